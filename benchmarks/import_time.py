@@ -0,0 +1,90 @@
+"""Import-time benchmark: the cost of importing passthrough in a fresh interpreter.
+
+Runs `python -X importtime` on a few import statements, each in a new interpreter
+process, and reports the cumulative import time of the statement (the median across
+repeats) along with the slowest modules it pulled in. Modules imported by the
+interpreter at startup (e.g. `site`) are excluded.
+
+Usage:
+    python benchmarks/import_time.py [--repeats 5] [--top 8]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Set, Tuple
+
+STATEMENTS = [
+    "import passthrough",
+    "from passthrough import PT_NS",
+    "from passthrough import Template",
+]
+
+
+def importtime(
+    statement: str, exclude: Set[str] = frozenset()
+) -> Tuple[int, Dict[str, int]]:
+    """Return the total and per-module cumulative import times in µs of `statement`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    modules = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = len(name) - len(name.lstrip())
+        name = name.strip()
+        if name in exclude:
+            continue
+        modules[name] = int(cumulative)
+        if depth == 1:  # top-level imports of the statement
+            total += int(cumulative)
+    return total, modules
+
+
+def measure(statement: str, repeats: int, top: int, startup: Set[str]) -> dict:
+    totals: List[int] = []
+    modules: Dict[str, int] = {}
+    for _ in range(repeats):
+        total, mods = importtime(statement, startup)
+        totals.append(total)
+        modules = mods  # module breakdown of the last run
+    slowest = sorted(modules.items(), key=lambda item: -item[1])[:top]
+    return {
+        "statement": statement,
+        "median_ms": round(statistics.median(totals) / 1000, 1),
+        "min_ms": round(min(totals) / 1000, 1),
+        "modules": len(modules),
+        "slowest": {name: round(us / 1000, 1) for name, us in slowest},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--json", action="store_true", help="emit JSON results")
+    args = parser.parse_args()
+
+    startup = set(importtime("pass")[1])
+    results = [measure(s, args.repeats, args.top, startup) for s in STATEMENTS]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(
+            f"{result['statement']}: {result['median_ms']}ms median,"
+            f" {result['min_ms']}ms min ({result['modules']} modules)"
+        )
+        for name, ms in result["slowest"].items():
+            print(f"    {ms:>8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
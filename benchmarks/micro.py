@@ -0,0 +1,201 @@
+"""Microbenchmarks of the primitives called for every element or expression.
+
+Times each primitive in isolation (the best of several repeats, in nanoseconds per
+call), and optionally saves the results as a JSON baseline or compares them to one,
+failing if any primitive has slowed down by more than a threshold.
+
+Usage:
+    python benchmarks/micro.py [--filter NAME] [--repeats 5]
+    python benchmarks/micro.py --save baseline.json
+    python benchmarks/micro.py --compare baseline.json [--threshold 0.1]
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+from typing import Callable, Dict
+
+from lxml import etree
+
+from passthrough import PT_NS, Template
+from passthrough.extensions.exm.lid import ProductLIDFormatter
+from passthrough.extensions.pt.datetime import PDSDatetime
+from passthrough.extensions.pt.vid import VID
+from passthrough.label_tools import PathManipulator, add_default_ns, is_populated
+from passthrough.state import PTState, SourceGroup
+
+PDS_NS = "http://pds.nasa.gov/pds4/pds/v1"
+TIMESTAMP = "2021-06-01T12:34:56.789012Z"
+LID = (
+    "urn:esa:psa:emrsp_rm_pan:data_partially_processed:"
+    "pan_par_sc_l01_spec-rad_20210601t123456.789z_20210601t123457.789z::1.0"
+)
+ELEMENT_PATH = (
+    f"{{{PDS_NS}}}Observation_Area/{{{PDS_NS}}}Time_Coordinates"
+    f"/{{{PDS_NS}}}start_date_time"
+)
+SOURCE = f"""<Product_Observational xmlns="{PDS_NS}">
+  <Identification_Area><logical_identifier>urn:a:b</logical_identifier>
+  </Identification_Area>
+</Product_Observational>"""
+
+
+def _pds_datetime_parse():
+    return lambda: PDSDatetime(TIMESTAMP)
+
+
+def _pds_datetime_format():
+    dt = PDSDatetime(TIMESTAMP)
+    return lambda: str(dt)
+
+
+def _lid_parse():
+    return lambda: ProductLIDFormatter(LID)
+
+
+def _lid_str():
+    lid = ProductLIDFormatter(LID)
+    return lambda: str(lid)
+
+
+def _vid_increment():
+    vid = VID(major=1, minor=0)
+    return lambda: vid.increment("minor")
+
+
+def _handle_fill():
+    elem = etree.Element("info")
+
+    def fill():
+        elem.text = "{} / {}"
+        Template._handle_fill(elem, ["1.0", "3"])
+
+    return fill
+
+
+def _is_populated():
+    elem = etree.fromstring(f'<a xmlns="{PDS_NS}">  text  </a>')
+    return lambda: is_populated(elem)
+
+
+def _clark_to_prefix():
+    pm = PathManipulator({"pds": PDS_NS, "pt": PT_NS["uri"]})
+    return lambda: pm.clark_to_prefix(ELEMENT_PATH)
+
+
+def _prefix_default_ns():
+    pm = PathManipulator({"pds": PDS_NS})
+    path = "/Product_Observational/Observation_Area/Time_Coordinates/start_date_time"
+    return lambda: pm.prefix_default_ns(path)
+
+
+def _pt_state():
+    source = etree.ElementTree(etree.fromstring(SOURCE))
+    root_state = PTState(source_map={"input": source})
+    pt = PT_NS["uri"]
+    template = etree.fromstring(
+        f'<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{pt}">'
+        '<Identification_Area pt:sources="input" pt:fetch="true()">'
+        "<logical_identifier/></Identification_Area>"
+        "</Product_Observational>"
+    )
+    t_elem = template[0]
+    return lambda: PTState(root_state, t_elem)
+
+
+def _source_group():
+    members = [etree.ElementTree(etree.fromstring(SOURCE)) for _ in range(4)]
+    return lambda: SourceGroup(members)
+
+
+def _add_default_ns():
+    root = etree.fromstring(SOURCE)
+    return lambda: add_default_ns(root.nsmap)
+
+
+# name -> setup function returning the callable to time
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {
+    "PDSDatetime.parse": _pds_datetime_parse,
+    "PDSDatetime.__str__": _pds_datetime_format,
+    "ProductLIDFormatter.parse": _lid_parse,
+    "ProductLIDFormatter.__str__": _lid_str,
+    "VID.increment": _vid_increment,
+    "Template._handle_fill": _handle_fill,
+    "is_populated": _is_populated,
+    "PathManipulator.clark_to_prefix": _clark_to_prefix,
+    "PathManipulator.prefix_default_ns": _prefix_default_ns,
+    "PTState": _pt_state,
+    "SourceGroup": _source_group,
+    "add_default_ns": _add_default_ns,
+}
+
+
+def measure(setup: Callable[[], Callable[[], object]], repeats: int) -> float:
+    """Return the best time in nanoseconds per call of the callable from `setup`."""
+    timer = timeit.Timer(setup())
+    number, _ = timer.autorange()  # enough calls to take at least 0.2s
+    return min(timer.repeat(repeats, number)) / number * 1e9
+
+
+def compare(results: Dict[str, float], baseline: dict, threshold: float) -> bool:
+    """Print each result's change from `baseline`; return whether none exceed
+    `threshold` (a fraction of the baseline).
+    """
+    ok = True
+    for name, ns in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:>34}: {ns:10.1f}ns  (no baseline)")
+            continue
+        change = ns / base - 1
+        regressed = change > threshold
+        ok &= not regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:>34}: {ns:10.1f}ns  {base:10.1f}ns  {change:+7.1%}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--save", help="save the results as a baseline to this file")
+    parser.add_argument("--compare", help="compare the results to this baseline file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="slowdown (as a fraction) above which --compare fails (default: 0.1)",
+    )
+    parser.add_argument("--json", action="store_true", help="emit JSON results")
+    args = parser.parse_args()
+
+    results = {
+        name: round(measure(setup, args.repeats), 1)
+        for name, setup in BENCHMARKS.items()
+        if args.filter is None or args.filter in name
+    }
+    record = {
+        "python": platform.python_version(),
+        "lxml": ".".join(map(str, etree.LXML_VERSION)),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(record, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold):
+            sys.exit(f"regressions beyond {args.threshold:.0%} of the baseline")
+    elif args.json:
+        print(json.dumps(record, indent=2))
+    else:
+        for name, ns in results.items():
+            print(f"{name:>34}: {ns:10.1f}ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Memory benchmark: resident set size per worker with and without preloading.
+
+Renders a batch of labels on a forked worker pool, once with every worker parsing the
+shared source and template itself, and once with both preloaded in the parent via
+`passthrough.preload`. Each worker reports its RSS, PSS (its proportional share of
+pages shared with other processes) and private dirty memory once done.
+
+Usage:
+    python benchmarks/preload_rss.py [--workers 8] [--jobs 64] [--elements 50000]
+
+Linux only (reads /proc/self/smaps_rollup).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from passthrough import Template, preload
+
+PDS_NS = "http://pds.nasa.gov/pds4/pds/v1"
+PT_URI = "https://github.com/ExoMars-PanCam/passthrough"
+
+TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}">
+  <Identification_Area pt:sources="input" pt:fetch="true()">
+    <logical_identifier/>
+    <version_id/>
+  </Identification_Area>
+  <Reference_List>
+    <Internal_Reference pt:sources="shared">
+      <lid_reference pt:fill="//pds:logical_identifier"/>
+      <comment pt:fill="count(//pds:Entry)"/>
+    </Internal_Reference>
+  </Reference_List>
+</Product_Observational>
+"""
+
+
+def make_label(path: Path, lid: str, entries: int = 0):
+    body = "".join(
+        f"<Entry><index>{i}</index><value>{i * 0.5}</value></Entry>"
+        for i in range(entries)
+    )
+    path.write_text(
+        f'<?xml version="1.0" encoding="UTF-8"?>\n<Product_Observational'
+        f' xmlns="{PDS_NS}"><Identification_Area><logical_identifier>{lid}'
+        "</logical_identifier><version_id>1.0</version_id></Identification_Area>"
+        f"<Table>{body}</Table></Product_Observational>"
+    )
+
+
+def memory_stats():
+    stats = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            fields = line.split()
+            if fields[0] in ("Rss:", "Pss:", "Private_Dirty:"):
+                stats[fields[0][:-1].lower()] = int(fields[1])  # kB
+    return stats
+
+
+def render(job):
+    mode, workdir, input_path, out_name = job
+    if mode == "preload":
+        template = preload.template("bench")
+        smap = preload.source_map({"input": input_path})
+    else:
+        template = str(Path(workdir) / "template.xml")
+        smap = {"input": input_path, "shared": str(Path(workdir) / "shared.xml")}
+    Template(template, smap, quiet=True).export(Path(workdir) / "out", out_name)
+    return os.getpid(), memory_stats()
+
+
+def run(mode, workdir, workers, jobs):
+    if mode == "preload":
+        preload.preload(
+            sources={"shared": str(Path(workdir) / "shared.xml")},
+            templates={"bench": str(Path(workdir) / "template.xml")},
+        )
+    queue = [
+        (mode, workdir, str(Path(workdir) / f"input_{i % 8}.xml"), f"out_{i}.xml")
+        for i in range(jobs)
+    ]
+    start = time.perf_counter()
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        results = dict(pool.map(render, queue, chunksize=1))
+    elapsed = time.perf_counter() - start
+    preload.clear()
+    summary = {"mode": mode, "seconds": round(elapsed, 3), "workers": len(results)}
+    for key in ("rss", "pss", "private_dirty"):
+        summary[f"mean_{key}_kb"] = round(
+            statistics.mean(s[key] for s in results.values())
+        )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--jobs", type=int, default=64)
+    parser.add_argument("--elements", type=int, default=50000)
+    parser.add_argument("--json", action="store_true", help="emit JSON results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        wd = Path(workdir)
+        (wd / "template.xml").write_text(TEMPLATE)
+        make_label(wd / "shared.xml", "urn:bench:shared", args.elements)
+        for i in range(8):
+            make_label(wd / f"input_{i}.xml", f"urn:bench:input_{i}")
+        results = [
+            run(mode, workdir, args.workers, args.jobs)
+            for mode in ("per-worker", "preload")
+        ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    header = ("mode", "seconds", "mean_rss_kb", "mean_pss_kb", "mean_private_dirty_kb")
+    print("".join(f"{h:>24}" for h in header))
+    for result in results:
+        print("".join(f"{result[h]:>24}" for h in header))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Start-up benchmark: the first render of a fresh worker, with and without an artifact.
+
+Times the first render in a new interpreter process, once from the type template file
+and once from a precompiled artifact (see `passthrough.compiled`), reporting the median
+across repeats. Loading the artifact is included in its time. Either way the template
+still has to be copied and traversed; the artifact saves parsing it, expanding its
+XInclude fragments, stripping its comments and discovering the installed extensions
+(which reads the metadata of every installed distribution).
+
+Usage:
+    python benchmarks/startup.py [--repeats 9] [--fragments 50]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from passthrough.compiled import CompiledTemplate
+
+PDS_NS = "http://pds.nasa.gov/pds4/pds/v1"
+PT_URI = "https://github.com/ExoMars-PanCam/passthrough"
+XINCLUDE_NS = "http://www.w3.org/2001/XInclude"
+
+TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}"
+    xmlns:xi="{XINCLUDE_NS}" pt:sources="input">
+  <!-- the identification of the product -->
+  <Identification_Area pt:fetch="true()">
+    <logical_identifier/>
+    <version_id/>
+  </Identification_Area>
+  <Reference_List pt:required="false()">{{}}
+  </Reference_List>
+</Product_Observational>
+"""
+# an optional reference, pruned at export
+INCLUDE = """
+    <!-- reference {0} -->
+    <xi:include href="reference_{0}.xml"/>"""
+FRAGMENT = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Internal_Reference xmlns="{PDS_NS}">
+  <lid_reference/>
+  <reference_type>data_to_calibration_product</reference_type>
+</Internal_Reference>
+"""
+SOURCE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}">
+  <Identification_Area>
+    <logical_identifier>urn:bench:input</logical_identifier>
+    <version_id>1.0</version_id>
+  </Identification_Area>
+</Product_Observational>
+"""
+
+# run in a fresh interpreter: the seconds taken by the first render, imports excluded
+RENDER = """
+import sys, time
+from passthrough import Template
+from passthrough.compiled import CompiledTemplate
+mode, template, source = sys.argv[1:]
+start = time.perf_counter()
+if mode == "artifact":
+    template = CompiledTemplate.load(template)
+Template(template, {"input": source}, quiet=True).finalize()
+print(time.perf_counter() - start)
+"""
+
+
+def first_render(mode: str, template: Path, source: Path) -> float:
+    proc = subprocess.run(
+        [sys.executable, "-c", RENDER, mode, str(template), str(source)],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return float(proc.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeats", type=int, default=9)
+    parser.add_argument(
+        "--fragments", type=int, default=50, help="fragments included by the template"
+    )
+    parser.add_argument("--json", action="store_true", help="emit JSON results")
+    args = parser.parse_args()
+    if args.fragments < 1:
+        parser.error("the template must include at least one fragment")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        wd = Path(workdir)
+        includes = "".join(INCLUDE.format(i) for i in range(args.fragments))
+        (wd / "template.xml").write_text(TEMPLATE.format(includes))
+        for i in range(args.fragments):
+            (wd / f"reference_{i}.xml").write_text(FRAGMENT)
+        (wd / "source.xml").write_text(SOURCE)
+        CompiledTemplate.compile(str(wd / "template.xml")).save(wd / "template.ptc")
+        inputs = {"template": wd / "template.xml", "artifact": wd / "template.ptc"}
+        results = {
+            mode: round(
+                1000
+                * statistics.median(
+                    first_render(mode, template, wd / "source.xml")
+                    for _ in range(args.repeats)
+                ),
+                2,
+            )
+            for mode, template in inputs.items()
+        }
+
+    results["speedup"] = round(results["template"] / results["artifact"], 2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"first render from the template: {results['template']} ms")
+    print(f"first render from an artifact:  {results['artifact']} ms")
+    print(f"speed-up: {results['speedup']}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Differential benchmark: XSLT-compiled templates versus the Template interpreter.
+
+Renders the same label from a type template with both `passthrough.xslt` and
+`Template`, checks that the two results are identical (after canonicalisation), and
+then times repeated renders of each.
+
+Usage:
+    python benchmarks/xslt_compare.py [--renders 500] [--entries 8]
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from lxml import etree
+
+from passthrough import Template, xslt
+
+PDS_NS = "http://pds.nasa.gov/pds4/pds/v1"
+PT_URI = "https://github.com/ExoMars-PanCam/passthrough"
+
+TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}">
+  <Identification_Area pt:sources="input">
+    <logical_identifier pt:fetch="true()"/>
+    <version_id pt:fetch="true()"/>
+    <title pt:fill="pt:context('title')"/>
+  </Identification_Area>
+  <Observation_Area pt:sources="input" pt:fetch="true()">
+    <Time_Coordinates>
+      <start_date_time/>
+      <stop_date_time/>
+    </Time_Coordinates>
+    <Investigation_Area pt:multi="true()">
+      <name/>
+      <type/>
+    </Investigation_Area>
+    <comment pt:required="false()"/>
+  </Observation_Area>
+  <Reference_List>
+    <Internal_Reference pt:sources="shared">
+      <lid_reference pt:fill="//pds:logical_identifier"/>
+      <reference_type pt:fill="concat('data_to_', //pds:version_id)"/>
+    </Internal_Reference>
+  </Reference_List>
+</Product_Observational>
+"""
+
+
+def make_label(path: Path, lid: str, entries: int):
+    areas = "".join(
+        f"<Investigation_Area><name>Area {i}</name><type>Mission</type>"
+        "</Investigation_Area>"
+        for i in range(entries)
+    )
+    path.write_text(
+        f'<?xml version="1.0" encoding="UTF-8"?>\n<Product_Observational'
+        f' xmlns="{PDS_NS}"><Identification_Area><logical_identifier>{lid}'
+        "</logical_identifier><version_id>1.0</version_id></Identification_Area>"
+        "<Observation_Area><Time_Coordinates>"
+        "<start_date_time>2021-01-01T00:00:00.000Z</start_date_time>"
+        "<stop_date_time>2021-01-01T00:00:01.000Z</stop_date_time>"
+        f"</Time_Coordinates>{areas}</Observation_Area></Product_Observational>"
+    )
+
+
+def canonical(label: etree._ElementTree) -> bytes:
+    return etree.tostring(label, method="c14n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--renders", type=int, default=500)
+    parser.add_argument("--entries", type=int, default=8)
+    parser.add_argument("--json", action="store_true", help="emit JSON results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        wd = Path(workdir)
+        template = wd / "template.xml"
+        template.write_text(TEMPLATE)
+        make_label(wd / "input.xml", "urn:bench:input", args.entries)
+        make_label(wd / "shared.xml", "urn:bench:shared", 0)
+        smap = {"input": str(wd / "input.xml"), "shared": str(wd / "shared.xml")}
+        cmap = {"title": "Benchmark"}
+
+        compiled = xslt.compile_xslt(str(template))
+        if compiled is None:
+            raise SystemExit("template could not be compiled to XSLT")
+        xslt_label = compiled.render(smap, cmap)
+        interp_label = Template(str(template), smap, cmap, quiet=True).finalize()
+        identical = canonical(xslt_label) == canonical(interp_label)
+
+        start = time.perf_counter()
+        for _ in range(args.renders):
+            compiled.render(smap, cmap)
+        xslt_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.renders):
+            Template(str(template), smap, cmap, quiet=True).finalize()
+        interp_seconds = time.perf_counter() - start
+
+    results = {
+        "identical": identical,
+        "renders": args.renders,
+        "xslt_seconds": round(xslt_seconds, 3),
+        "template_seconds": round(interp_seconds, 3),
+        "speedup": round(interp_seconds / xslt_seconds, 1),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, val in results.items():
+            print(f"{key:>18}: {val}")
+    if not identical:
+        raise SystemExit("XSLT and Template outputs differ")
+
+
+if __name__ == "__main__":
+    main()
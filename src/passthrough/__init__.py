@@ -1,32 +1,100 @@
 """Passthrough - PDS4 label template system
 
+Submodules, the main classes and the distribution metadata are loaded on first access,
+so that importing the package itself is cheap.
 """
-try:
-    import importlib.metadata as importlib_metadata
-except ImportError:
-    import importlib_metadata
-_dist_meta = importlib_metadata.metadata("passthrough")
-__author__ = _dist_meta["Author"]
-__description__ = _dist_meta["Summary"]
-__project__ = _dist_meta["Name"]
-__url__ = _dist_meta["Home-Page"]
-__version__ = _dist_meta["Version"]
-del _dist_meta
+import sys
+from importlib import import_module
+
+__project__ = "passthrough"
+__url__ = "https://github.com/ExoMars-PanCam/passthrough"
 
 PT_NS = {"prefix": "pt", "uri": __url__}
 PT_EXT_URI_BASE = f"{__url__}/extensions"
 FILL_TOKEN = "{}"
 
-from . import exc, extensions, label_tools
-from .template import Template
+# Lazily loaded attributes: distribution metadata fields, submodules, and the classes
+# re-exported from them
+_METADATA = {
+    "__author__": "Author",
+    "__description__": "Summary",
+    "__version__": "Version",
+}
+_SUBMODULES = {
+    "aio",
+    "batch",
+    "compiled",
+    "exc",
+    "explain",
+    "extensions",
+    "fragments",
+    "label_tools",
+    "loaders",
+    "preload",
+    "profiling",
+    "sinks",
+    "validation",
+    "watch",
+    "xslt",
+}
+_CLASSES = {
+    "CompiledTemplate": "compiled",
+    "ContextProvider": "extensions.pt.context",
+    "ExportResult": "template",
+    "Template": "template",
+}
 
 __all__ = [
     "__author__",
     "__version__",
+    "aio",
+    "batch",
+    "compiled",
+    "CompiledTemplate",
+    "ContextProvider",
     "exc",
+    "ExportResult",
+    "explain",
     "extensions",
+    "fragments",
     "label_tools",
+    "loaders",
     "PT_NS",
     "PT_EXT_URI_BASE",
+    "preload",
+    "profiling",
+    "sinks",
     "Template",
+    "validation",
+    "watch",
+    "xslt",
 ]
+
+
+def __getattr__(name: str):
+    if name in _METADATA:
+        try:
+            import importlib.metadata as importlib_metadata
+        except ImportError:
+            import importlib_metadata
+        meta = importlib_metadata.metadata(__project__)
+        for attr, field in _METADATA.items():
+            globals()[attr] = meta[field]
+        return globals()[name]
+    if name in _SUBMODULES:
+        return import_module(f".{name}", __name__)  # also binds it as an attribute
+    if name in _CLASSES:
+        val = getattr(import_module(f".{_CLASSES[name]}", __name__), name)
+        globals()[name] = val
+        return val
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_METADATA) | _SUBMODULES | set(_CLASSES))
+
+
+if sys.version_info < (3, 7):  # module __getattr__ (PEP 562) is unsupported
+    for _name in [*_METADATA, *sorted(_SUBMODULES), *_CLASSES]:
+        globals()[_name] = __getattr__(_name)
+    del _name
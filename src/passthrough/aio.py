@@ -0,0 +1,230 @@
+"""asyncio interface for rendering labels without blocking the event loop
+
+Pre-processing a template and exporting its label takes long enough to stall an event
+loop. An `AsyncRenderer` instead runs both on an executor, bounding the number of
+renders in progress with a semaphore:
+
+```python
+from concurrent.futures import ThreadPoolExecutor
+
+from passthrough.aio import AsyncRenderer
+
+renderer = AsyncRenderer(ThreadPoolExecutor(8))
+
+async def handle(request):
+    label = await renderer.render("template.xml", {"input": request.path})
+    ...
+
+async def campaign(jobs):
+    async for result in renderer.render_many(jobs):
+        print(result.path, result.error)
+```
+
+Thread pool executors are supported by virtue of `Template` being safe to use from
+multiple threads concurrently; process pool executors additionally require that all
+arguments (e.g. source labels given as lxml trees) can be pickled.
+"""
+
+__all__ = [
+    "AsyncRenderer",
+    "render_async",
+]
+
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from lxml import etree
+
+from . import batch
+from .compiled import CompiledTemplate
+from .label_tools import LabelLike
+from .template import ExportResult, Template
+
+
+class AsyncRenderer:
+    """Render labels on an executor from asyncio code.
+
+    Attributes:
+        executor Optional[concurrent.futures.Executor]: The executor renders run on
+            (None for the event loop's default executor).
+        max_concurrency int: The maximum number of renders in progress at once.
+    """
+
+    def __init__(
+        self, executor: Optional[Executor] = None, max_concurrency: Optional[int] = None
+    ):
+        """Prepare to render labels on `executor`.
+
+        Args:
+            executor: The thread or process pool executor to render labels on (by
+                default, the event loop's default executor).
+            max_concurrency: The maximum number of renders in progress at once (by
+                default, the executor's number of workers or the number of CPUs).
+        """
+        self.executor = executor
+        self.max_concurrency = (
+            max_concurrency
+            or getattr(executor, "_max_workers", None)
+            or os.cpu_count()
+            or 1
+        )
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def render(
+        self,
+        template: Union[LabelLike, CompiledTemplate],
+        source_map: Dict[str, Union[LabelLike, Sequence[LabelLike]]],
+        context_map: Optional[dict] = None,
+        output: Optional[Union[Path, str]] = None,
+        filename: Optional[str] = None,
+        **template_kwargs,
+    ) -> Union[ExportResult, bytes]:
+        """Render a label, waiting for a free slot if `max_concurrency` is reached.
+
+        Cancelling the render while it is waiting for a slot or an executor worker
+        prevents it from starting. Once started on a thread, a render can't be
+        interrupted, but it is abandoned before export.
+
+        Args:
+            template, source_map, context_map, template_kwargs: As for `Template`.
+            output: If provided, export the label to this directory as with
+                `Template.export`.
+            filename: As for `Template.export`.
+
+        Returns:
+            The `ExportResult` if `output` is provided, else the serialised label.
+        """
+        async with self._get_semaphore():
+            cancelled = None
+            if not isinstance(self.executor, ProcessPoolExecutor):
+                cancelled = threading.Event()
+            func = partial(
+                _render,
+                template,
+                source_map,
+                context_map,
+                output,
+                filename,
+                template_kwargs,
+                cancelled,
+            )
+            try:
+                return await asyncio.get_event_loop().run_in_executor(
+                    self.executor, func
+                )
+            except asyncio.CancelledError:
+                if cancelled is not None:
+                    cancelled.set()
+                raise
+
+    async def render_many(
+        self,
+        jobs: Union[Iterable[batch.Job], AsyncIterable[batch.Job]],
+        ordered: bool = False,
+    ) -> AsyncIterator[batch.JobResult]:
+        """Render `jobs`, yielding their results as they complete.
+
+        At most `max_concurrency` jobs are taken from `jobs` ahead of their results
+        being consumed. Errors are reported through the results' `error` fields (see
+        `batch.render_job`), and jobs still in progress are cancelled if iteration is
+        abandoned.
+
+        Args:
+            jobs: An iterable or async iterable of the jobs to render.
+            ordered: If enabled, yield the results in the order of `jobs` rather than
+                in order of completion.
+        """
+        loop = asyncio.get_event_loop()
+        pending = deque()
+        try:
+            async for job in _aiter(jobs):
+                if len(pending) >= self.max_concurrency:
+                    completed = self._completed(pending, ordered, wait_all=False)
+                    async for result in completed:
+                        yield result
+                pending.append(loop.create_task(self._render_job(job)))
+            async for result in self._completed(pending, ordered, wait_all=True):
+                yield result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _render_job(self, job: batch.Job) -> batch.JobResult:
+        async with self._get_semaphore():
+            return await asyncio.get_event_loop().run_in_executor(
+                self.executor, batch.render_job, job
+            )
+
+    @staticmethod
+    async def _completed(pending: deque, ordered: bool, wait_all: bool):
+        # yield (and remove) the results of at least one pending task, or all of them
+        while pending:
+            if ordered:
+                yield await pending[0]
+                pending.popleft()
+            else:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    pending.remove(task)
+                    yield task.result()
+            if not wait_all:
+                return
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # created on first use, as semaphores are bound to the event loop running then
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+
+async def render_async(
+    template: Union[LabelLike, CompiledTemplate],
+    source_map: Dict[str, Union[LabelLike, Sequence[LabelLike]]],
+    context_map: Optional[dict] = None,
+    output: Optional[Union[Path, str]] = None,
+    filename: Optional[str] = None,
+    executor: Optional[Executor] = None,
+    **template_kwargs,
+) -> Union[ExportResult, bytes]:
+    """Render a single label on `executor` (see `AsyncRenderer.render`)."""
+    return await AsyncRenderer(executor).render(
+        template, source_map, context_map, output, filename, **template_kwargs
+    )
+
+
+def _render(
+    template, source_map, context_map, output, filename, template_kwargs, cancelled
+):
+    with Template(template, source_map, context_map, **template_kwargs) as t:
+        if cancelled is not None and cancelled.is_set():
+            return None  # the result is discarded anyway
+        if output is not None:
+            return t.export(output, filename)
+        return etree.tostring(
+            t.finalize(), encoding="UTF-8", pretty_print=True, xml_declaration=True
+        )
+
+
+async def _aiter(iterable):
+    if hasattr(iterable, "__aiter__"):
+        async for item in iterable:
+            yield item
+    else:
+        for item in iterable:
+            yield item
@@ -0,0 +1,593 @@
+"""Rendering labels in bulk on a pool of worker processes
+
+A `Job` describes a single label to render, and `render_job` renders it. `render_job`
+is meant to be run in long-lived worker processes (e.g. those of a
+`concurrent.futures.ProcessPoolExecutor`), each of which compiles every type template
+it encounters only once, recompiling it only if the template file is modified. Workers
+can be set up ahead of their first job with `init_worker`, which warms them up (see
+`warm`) and keeps their `Template` log messages below logging.ERROR from drowning out
+those of the batch:
+
+```python
+from concurrent.futures import ProcessPoolExecutor
+
+from passthrough import batch
+
+with ProcessPoolExecutor(
+    8, initializer=batch.init_worker, initargs=(["rad.xml"],)
+) as pool:
+    for result in pool.map(batch.render_job, jobs):
+        print(result.path, result.seconds, result.error)
+```
+
+Campaigns of renders can also be described by a manifest file, and run with
+`render_manifest` (or the `passthrough render` command). Every completed render is
+appended to a `Journal`, so that an interrupted campaign can be resumed by running it
+again. A manifest is either a JSON Lines file of objects with `template`, `source_map`,
+`output`, and optionally `context_map`, `filename` and `id` members:
+
+```json
+{"template": "rad.xml", "source_map": {"input": "in/a.xml"}, "output": "out"}
+```
+
+or a CSV file with `template` and `output` (and optionally `filename` and `id`) columns,
+a `source.<moniker>` column per source and a `context.<key>` column per context entry.
+Source groups are given as JSON arrays, in either format. Relative paths are resolved
+against the directory of the manifest, and rows without an `id` are identified by the
+digest of their contents.
+
+Templates can be debugged against a whole campaign with `check_manifest` (or the
+`passthrough check` command), which renders every row in collect-errors mode without
+exporting anything, and aggregates the errors found into an `ErrorSummary`.
+"""
+
+__all__ = [
+    "ErrorSummary",
+    "Job",
+    "JobResult",
+    "Journal",
+    "Stats",
+    "check_job",
+    "check_manifest",
+    "clear_template_cache",
+    "get_template",
+    "init_worker",
+    "read_manifest",
+    "render_job",
+    "render_manifest",
+    "warm",
+]
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import signal
+import statistics
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from . import __project__
+from .compiled import CompiledTemplate
+from .template import ErrorRecord, Template
+
+# A label to render: the path of its type template, its source and context maps, and
+# the directory (and optionally the file name) to export it to
+Job = namedtuple("Job", ("template", "source_map", "context_map", "output", "filename"))
+# The outcome of `render_job`: the exported label's path and whether it was written,
+# the time taken to render it, and a description of the error if rendering failed
+JobResult = namedtuple("JobResult", ("job", "path", "written", "seconds", "error"))
+
+_templates: Dict[str, Tuple[int, CompiledTemplate]] = {}
+_template_log = logging.getLogger(".".join([__project__, Template.__name__]))
+
+
+def get_template(template: Union[Path, str]) -> CompiledTemplate:
+    """Return the compiled `template`, compiling it if it isn't cached or is stale.
+
+    The template is stale if it, or any fragment it includes, has been modified.
+    """
+    path = Path(template).expanduser().resolve()
+    mtime = path.stat().st_mtime_ns
+    try:
+        cached_mtime, compiled = _templates[str(path)]
+    except KeyError:
+        pass
+    else:
+        if cached_mtime == mtime and compiled.is_current():
+            return compiled
+    compiled = CompiledTemplate.compile(str(path))
+    compiled.to_etree()  # parse now rather than during the first render
+    _templates[str(path)] = (mtime, compiled)
+    return compiled
+
+
+def clear_template_cache() -> None:
+    """Empty the process' cache of compiled templates."""
+    _templates.clear()
+
+
+def warm(templates: Iterable[Union[Path, str]]) -> None:
+    """Compile `templates` into the process' cache ahead of the first job.
+
+    Intended as the initializer of a worker pool. Templates which fail to compile are
+    skipped, as the error will be reported by the jobs using them.
+    """
+    for template in templates:
+        try:
+            get_template(template)
+        except Exception:
+            pass
+
+
+def init_worker(templates: Iterable[Union[Path, str]] = ()) -> None:
+    """Set up a worker process of a batch, warming it up with `templates`.
+
+    Intended as the initializer of a worker pool. `Template` log messages below
+    logging.ERROR are suppressed in the worker, leaving the level of the `passthrough`
+    logger (and thus any other messages) unaffected. SIGINT is ignored, so that an
+    interrupt (e.g. Ctrl-C in a terminal, which signals the whole process group) is
+    left to the parent process to handle, rather than aborting renders midway.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _template_log.addFilter(_is_error)
+    warm(templates)
+
+
+def _is_error(record: logging.LogRecord) -> bool:
+    return record.levelno >= logging.ERROR
+
+
+@contextmanager
+def _quiet_templates():
+    # the equivalent of init_worker for rows rendered in the current process
+    _template_log.addFilter(_is_error)
+    try:
+        yield
+    finally:
+        _template_log.removeFilter(_is_error)
+
+
+def _pool(jobs: int) -> ProcessPoolExecutor:
+    # worker initializers are only supported from Python 3.7
+    if sys.version_info >= (3, 7):
+        return ProcessPoolExecutor(jobs, initializer=init_worker)
+    return ProcessPoolExecutor(jobs)
+
+
+def _log_level() -> int:
+    # passed on to Template as its quiet level, so as to leave the level of the
+    # passthrough logger as configured (quieting is left to a filter; see init_worker)
+    return logging.getLogger(__project__).level
+
+
+def render_job(job: Job) -> JobResult:
+    """Render and export the label described by `job`.
+
+    Errors are reported through the `error` field of the result rather than raised, so
+    that a failed job doesn't abort the batch it is part of.
+    """
+    start = time.perf_counter()
+    try:
+        with Template(
+            get_template(job.template),
+            job.source_map,
+            job.context_map,
+            quiet=_log_level(),
+        ) as template:
+            result = template.export(job.output, job.filename)
+    except Exception as e:
+        # exceptions are reported as text as not all of them can be pickled
+        error = f"{e.__class__.__name__}: {e}"
+        return JobResult(job, None, False, time.perf_counter() - start, error)
+    seconds = time.perf_counter() - start
+    return JobResult(job, result.path, result.written, seconds, None)
+
+
+def check_job(job: Job) -> List[ErrorRecord]:
+    """Render the label described by `job` in collect-errors mode, without exporting it.
+
+    Returns:
+        Every error encountered. An error which prevents rendering altogether (e.g. an
+        unreadable source) is reported as a single record without a template element.
+    """
+    try:
+        with Template(
+            get_template(job.template),
+            job.source_map,
+            job.context_map,
+            quiet=_log_level(),
+            collect_errors=True,
+        ) as template:
+            template.finalize()
+            return template.error_report()
+    except Exception as e:
+        return [ErrorRecord(e.__class__.__name__, str(e), None, None)]
+
+
+class ErrorSummary:
+    """The errors found in a batch of labels, aggregated across jobs.
+
+    Errors are grouped by template, exception class and template element, so that an
+    error arising from the same template construct in many labels is reported once.
+
+    Attributes:
+        checked int: The number of jobs checked.
+        failed int: The number of those jobs with errors.
+    """
+
+    def __init__(self):
+        self.checked = 0
+        self.failed = 0
+        self._groups: Dict[tuple, Dict[str, object]] = {}
+
+    def add(
+        self, job: Job, errors: List[ErrorRecord], job_id: Optional[str] = None
+    ) -> None:
+        """Record the `errors` found by checking `job` (identified by `job_id`)."""
+        self.checked += 1
+        if errors:
+            self.failed += 1
+        seen = set()
+        for error in errors:
+            key = (job.template, error.type, error.tag, error.sourceline)
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = {
+                    "template": job.template,
+                    "type": error.type,
+                    "tag": error.tag,
+                    "sourceline": error.sourceline,
+                    "occurrences": 0,
+                    "jobs": 0,
+                    "message": error.message,
+                    "job_id": job_id,
+                }
+            group["occurrences"] += 1
+            if key not in seen:
+                seen.add(key)
+                group["jobs"] += 1
+
+    def summary(self) -> List[Dict[str, object]]:
+        """Return the error groups, most widespread first.
+
+        Each group is a dict of the `template`, the exception `type`, the `tag` and
+        `sourceline` of the template element, the number of `occurrences` and of
+        `jobs` affected, and the `message` and `job_id` of the first occurrence.
+        """
+        return sorted(
+            (dict(group) for group in self._groups.values()),
+            key=lambda g: (-g["jobs"], g["template"], g["sourceline"] or 0, g["type"]),
+        )
+
+
+class Stats:
+    """Throughput and latency statistics of a stream of renders.
+
+    Statistics are accumulated over a window, which can be restarted when reporting
+    them so that long-running processes keep a bounded amount of state, alongside
+    running totals.
+
+    Attributes:
+        total int: The number of renders recorded since the `Stats` were created.
+        total_failed int: The number of those renders which failed.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.total_failed = 0
+        self._start = time.monotonic()
+        self._latencies: List[float] = []
+        self._failed = 0
+
+    def record(self, latency: float, failed: bool = False) -> None:
+        """Record a render which took `latency` seconds to complete."""
+        self._latencies.append(latency)
+        self.total += 1
+        if failed:
+            self._failed += 1
+            self.total_failed += 1
+
+    def summary(self, reset: bool = False) -> Dict[str, Optional[float]]:
+        """Return the statistics of the current window.
+
+        Args:
+            reset: If enabled, start a new window.
+
+        Returns:
+            The number of renders (and failed renders) in the window, its duration in
+            seconds, the throughput in renders per second, and the mean, median, 95th
+            percentile and maximum latency in seconds (None if no renders have been
+            recorded).
+        """
+        now = time.monotonic()
+        elapsed = now - self._start
+        latencies = sorted(self._latencies)
+        count = len(latencies)
+        summary = {
+            "count": count,
+            "failed": self._failed,
+            "seconds": round(elapsed, 3),
+            "rate": round(count / elapsed, 3) if elapsed > 0 else None,
+            "mean": None,
+            "median": None,
+            "p95": None,
+            "max": None,
+        }
+        if count:
+            summary.update(
+                mean=round(statistics.mean(latencies), 3),
+                median=round(statistics.median(latencies), 3),
+                p95=round(latencies[min(count - 1, int(count * 0.95))], 3),
+                max=round(latencies[-1], 3),
+            )
+        if reset:
+            self._start = now
+            self._latencies = []
+            self._failed = 0
+        return summary
+
+
+def read_manifest(path: Union[Path, str]) -> Iterator[Tuple[str, Job]]:
+    """Yield the `(id, job)` pairs of the rows of the manifest at `path`.
+
+    Files with a `.csv` suffix are read as CSV, any other as JSON Lines.
+
+    Raises:
+        ValueError: if a row is malformed.
+    """
+    path = Path(path).expanduser()
+    base = path.resolve().parent
+    with open(path, newline="") as f:
+        if path.suffix.lower() == ".csv":
+            records = enumerate(csv.DictReader(f), start=2)
+            parse = _csv_row
+        else:
+            records = ((n, line) for n, line in enumerate(f, start=1) if line.strip())
+            parse = _json_row
+        for lineno, record in records:
+            try:
+                row = parse(record)
+                job = _row_job(row, base)
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"{path}, line {lineno}: {e}") from None
+            yield _row_id(row), job
+
+
+def _json_row(line: str) -> dict:
+    row = json.loads(line)
+    if not isinstance(row, dict):
+        raise ValueError("manifest row is not an object")
+    return row
+
+
+def _csv_row(record: Dict[str, str]) -> dict:
+    row = {"source_map": {}, "context_map": {}}
+    for column, val in record.items():
+        if column is None or val is None or val == "":
+            continue  # surplus or missing values
+        if column.startswith("source."):
+            row["source_map"][column[7:]] = json.loads(val) if val[0] == "[" else val
+        elif column.startswith("context."):
+            row["context_map"][column[8:]] = val
+        else:
+            row[column] = val
+    return row
+
+
+def _row_id(row: dict) -> str:
+    if row.get("id") is not None:
+        return str(row["id"])
+    return hashlib.sha1(json.dumps(row, sort_keys=True).encode()).hexdigest()
+
+
+def _row_job(row: dict, base: Path) -> Job:
+    unknown = set(row) - {*Job._fields, "id"}
+    if unknown:
+        raise ValueError(f"unknown manifest fields {sorted(unknown)}")
+    for field in ("template", "source_map", "output"):
+        if field not in row:
+            raise ValueError(f"missing manifest field '{field}'")
+    if not isinstance(row["source_map"], dict):
+        raise TypeError("source_map must be an object")
+    source_map = {}
+    for key, val in row["source_map"].items():
+        if isinstance(val, str):
+            source_map[key] = str(base / val)
+        elif isinstance(val, list) and all(isinstance(v, str) for v in val):
+            source_map[key] = [str(base / v) for v in val]
+        else:
+            raise TypeError(f"source map key {key} must map to a path or list of paths")
+    return Job(
+        template=str(base / row["template"]),
+        source_map=source_map,
+        context_map=row.get("context_map") or {},
+        output=str(base / row["output"]),
+        filename=row.get("filename"),
+    )
+
+
+class Journal:
+    """An append-only JSON Lines record of the outcomes of manifest rows.
+
+    Attributes:
+        path pathlib.Path: Path of the journal file.
+        completed Set[str]: The IDs of the rows which have been rendered successfully.
+    """
+
+    def __init__(self, path: Union[Path, str], resume: bool = True):
+        """Open the journal at `path`, creating it if it doesn't exist.
+
+        Args:
+            path: Path of the journal file.
+            resume: If enabled, load the rows completed by previous runs; otherwise,
+                discard the journal's previous contents.
+        """
+        self.path = Path(path).expanduser()
+        self.completed: Set[str] = set()
+        if resume and self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # e.g. truncated by a crash mid-write
+                    if entry.get("status") == "ok":
+                        self.completed.add(entry["id"])
+        self._file = open(self.path, "a" if resume else "w")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, row_id: str, result: JobResult) -> None:
+        """Append the outcome of the row `row_id` to the journal."""
+        entry = {
+            "id": row_id,
+            "status": "ok" if result.error is None else "failed",
+            "path": None if result.path is None else str(result.path),
+            "seconds": round(result.seconds, 6),
+            "error": result.error,
+            "time": time.time(),
+        }
+        # write whole lines at once so that an interruption can't interleave entries
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        if result.error is None:
+            self.completed.add(row_id)
+
+    def close(self) -> None:
+        """Close the journal file."""
+        self._file.close()
+
+
+def render_manifest(
+    manifest: Union[Path, str],
+    jobs: Optional[int] = None,
+    journal: Optional[Union[Path, str]] = None,
+    resume: bool = True,
+    stats_interval: float = 10.0,
+) -> Dict[str, Optional[float]]:
+    """Render the rows of `manifest` on a pool of worker processes.
+
+    Args:
+        manifest: Path of the manifest file.
+        jobs: The number of worker processes (by default, one per CPU). With a single
+            job, rows are rendered in the current process.
+        journal: Path of the journal file (by default, the manifest path suffixed with
+            `.journal`).
+        resume: If enabled, skip the rows recorded as completed by the journal.
+        stats_interval: Seconds between progress log entries.
+
+    Returns:
+        The statistics of the run (see `Stats.summary`), together with the number of
+        rows skipped as already completed.
+
+    Raises:
+        ValueError: if the manifest is malformed. Rows preceding the malformed row may
+            have been rendered (and journaled) already.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    journal = journal or f"{manifest}.journal"
+    log = logging.getLogger(".".join([__project__, "batch"]))
+    stats = Stats()
+    skipped = 0
+    last_report = time.monotonic()
+
+    def complete(row_id: str, result: JobResult):
+        nonlocal last_report
+        journal_.record(row_id, result)
+        stats.record(result.seconds, failed=result.error is not None)
+        if result.error is not None:
+            log.error(f"row {row_id} failed: {result.error}")
+        if time.monotonic() - last_report >= stats_interval:
+            last_report = time.monotonic()
+            summary = stats.summary()
+            log.info(
+                f"{stats.total} rows rendered ({stats.total_failed} failed, {skipped}"
+                f" skipped) at {summary['rate']}/s"
+            )
+
+    with Journal(journal, resume) as journal_:
+        rows = read_manifest(manifest)
+        if jobs == 1:
+            with _quiet_templates():
+                for row_id, job in rows:
+                    if row_id in journal_.completed:
+                        skipped += 1
+                        continue
+                    complete(row_id, render_job(job))
+        else:
+            in_flight = {}
+            with _pool(jobs) as pool:
+                for row_id, job in rows:
+                    if row_id in journal_.completed:
+                        skipped += 1
+                        continue
+                    # bound the number of queued rows to stream large manifests
+                    while len(in_flight) >= 4 * jobs:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            complete(in_flight.pop(future), future.result())
+                    in_flight[pool.submit(render_job, job)] = row_id
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        complete(in_flight.pop(future), future.result())
+    summary = stats.summary()
+    summary["skipped"] = skipped
+    return summary
+
+
+def check_manifest(
+    manifest: Union[Path, str], jobs: Optional[int] = None
+) -> ErrorSummary:
+    """Check the rows of `manifest` for errors on a pool of worker processes.
+
+    Every row is rendered in collect-errors mode (see `check_job`); nothing is
+    exported or journaled.
+
+    Args:
+        manifest: Path of the manifest file.
+        jobs: The number of worker processes (by default, one per CPU). With a single
+            job, rows are checked in the current process.
+
+    Raises:
+        ValueError: if the manifest is malformed.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    summary = ErrorSummary()
+    rows = read_manifest(manifest)
+    if jobs == 1:
+        with _quiet_templates():
+            for row_id, job in rows:
+                summary.add(job, check_job(job), row_id)
+        return summary
+
+    in_flight = {}
+
+    def complete(future):
+        row_id, job = in_flight.pop(future)
+        summary.add(job, future.result(), row_id)
+
+    with _pool(jobs) as pool:
+        for row_id, job in rows:
+            # bound the number of queued rows to stream large manifests
+            while len(in_flight) >= 4 * jobs:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    complete(future)
+            in_flight[pool.submit(check_job, job)] = (row_id, job)
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                complete(future)
+    return summary
@@ -0,0 +1,275 @@
+"""The `passthrough` command line interface"""
+
+import argparse
+import json
+import logging
+import signal
+import sys
+from typing import List, Optional
+
+from . import __description__, __project__, __version__
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the `passthrough` command with the arguments `argv` (default: sys.argv)."""
+    parser = argparse.ArgumentParser(prog=__project__, description=__description__)
+    parser.add_argument(
+        "--version", action="version", version=f"%(prog)s {__version__}"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="log debug messages"
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    _add_render_parser(subparsers)
+    _add_check_parser(subparsers)
+    _add_explain_parser(subparsers)
+    _add_watch_parser(subparsers)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    return args.func(args)
+
+
+def _add_render_parser(subparsers):
+    parser = subparsers.add_parser(
+        "render",
+        help="render the labels listed in a manifest",
+        description="Render the labels listed in a JSON Lines or CSV manifest in"
+        " parallel, journaling each outcome so that an interrupted run can be resumed.",
+    )
+    parser.add_argument("manifest", help="JSON Lines or CSV (*.csv) manifest")
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="number of worker processes (default: CPUs)"
+    )
+    parser.add_argument(
+        "--journal", help="journal file (default: the manifest path + '.journal')"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="discard the journal and render every row, instead of resuming",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=10.0,
+        help="seconds between progress log entries (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print the run statistics as JSON"
+    )
+    parser.set_defaults(func=_render)
+
+
+def _render(args) -> int:
+    from .batch import render_manifest
+
+    try:
+        summary = render_manifest(
+            args.manifest,
+            jobs=args.jobs,
+            journal=args.journal,
+            resume=not args.restart,
+            stats_interval=args.stats_interval,
+        )
+    except (OSError, ValueError) as e:
+        print(f"{__project__} render: error: {e}", file=sys.stderr)
+        return 2
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(
+            f"{summary['count']} rendered ({summary['failed']} failed,"
+            f" {summary['skipped']} skipped) in {summary['seconds']}s:"
+            f" {summary['rate']} labels/s"
+        )
+        if summary["count"]:
+            print(
+                f"render time: mean {summary['mean']}s, median {summary['median']}s,"
+                f" p95 {summary['p95']}s, max {summary['max']}s"
+            )
+    return 1 if summary["failed"] else 0
+
+
+def _add_check_parser(subparsers):
+    parser = subparsers.add_parser(
+        "check",
+        help="report the template errors of the labels listed in a manifest",
+        description="Render the labels listed in a manifest without exporting them,"
+        " collecting every template error rather than stopping at the first, and"
+        " report the errors aggregated across all labels.",
+    )
+    parser.add_argument("manifest", help="JSON Lines or CSV (*.csv) manifest")
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="number of worker processes (default: CPUs)"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print the error report as JSON"
+    )
+    parser.set_defaults(func=_check)
+
+
+def _check(args) -> int:
+    from .batch import check_manifest
+
+    try:
+        errors = check_manifest(args.manifest, jobs=args.jobs)
+    except (OSError, ValueError) as e:
+        print(f"{__project__} check: error: {e}", file=sys.stderr)
+        return 2
+    groups = errors.summary()
+    if args.json:
+        report = {"checked": errors.checked, "failed": errors.failed, "errors": groups}
+        print(json.dumps(report, indent=2))
+    else:
+        for group in groups:
+            where = (
+                f"{group['template']}:{group['sourceline']} ({group['tag']})"
+                if group["sourceline"] is not None
+                else group["template"]
+            )
+            print(
+                f"{where}: {group['type']} in {group['jobs']} labels"
+                f" ({group['occurrences']} occurrences)\n    {group['message']}"
+                f" [first in row {group['job_id']}]"
+            )
+        print(f"{errors.failed} of {errors.checked} labels have errors")
+    return 1 if errors.failed else 0
+
+
+def _add_explain_parser(subparsers):
+    parser = subparsers.add_parser(
+        "explain",
+        help="report how a type template would be processed",
+        description="Statically analyse a type template without rendering it, listing"
+        " its PT expressions, their inheritance, fan-out and deferred work, and"
+        " flagging constructs which scale poorly. Sample sources refine the estimates.",
+    )
+    parser.add_argument("template", help="type template")
+    parser.add_argument(
+        "-s",
+        "--source",
+        action="append",
+        default=[],
+        metavar="MONIKER=LABEL",
+        help="sample source label (repeat a moniker for a source group)",
+    )
+    parser.add_argument("--json", action="store_true", help="print the plan as JSON")
+    parser.add_argument(
+        "--strict", action="store_true", help="exit with status 1 if hazards are found"
+    )
+    parser.set_defaults(func=_explain)
+
+
+def _explain(args) -> int:
+    from lxml import etree
+
+    from .exc import PTError
+    from .explain import explain_template
+
+    source_map = None
+    if args.source:
+        source_map = {}
+        for entry in args.source:
+            moniker, sep, label = entry.partition("=")
+            if not sep:
+                print(
+                    f"{__project__} explain: error: expected MONIKER=LABEL, not"
+                    f" '{entry}'",
+                    file=sys.stderr,
+                )
+                return 2
+            source_map.setdefault(moniker, []).append(label)
+    try:
+        plan = explain_template(args.template, source_map)
+    except (OSError, ValueError, PTError, etree.XMLSyntaxError) as e:
+        print(f"{__project__} explain: error: {e}", file=sys.stderr)
+        return 2
+    print(plan.to_json(indent=2) if args.json else plan.format())
+    return 1 if args.strict and plan.hazards else 0
+
+
+def _add_watch_parser(subparsers):
+    parser = subparsers.add_parser(
+        "watch",
+        help="render labels for source labels as they appear in a directory",
+        description="Watch a directory tree for new or modified source labels, and"
+        " render labels for them on a pool of worker processes.",
+    )
+    parser.add_argument("directory", help="directory tree to watch")
+    parser.add_argument(
+        "-r", "--rules", required=True, help="JSON file of source-to-template rules"
+    )
+    parser.add_argument(
+        "-o", "--output", required=True, help="directory to export labels to"
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, help="number of worker processes (default: CPUs)"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="seconds between directory scans (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=2.0,
+        help="seconds a source label must be left unmodified before it is rendered"
+        " (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        help="maximum number of renders queued on the workers (default: 4 per worker)",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=60.0,
+        help="seconds between throughput and latency log entries"
+        " (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--skip-existing",
+        action="store_true",
+        help="ignore source labels present at startup until they are next modified",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="exit once all source labels found have been rendered",
+    )
+    parser.set_defaults(func=_watch)
+
+
+def _watch(args) -> int:
+    from .watch import Watcher, load_rules
+
+    try:
+        watcher = Watcher(
+            args.directory,
+            load_rules(args.rules),
+            args.output,
+            workers=args.workers,
+            interval=args.interval,
+            debounce=args.debounce,
+            max_pending=args.max_pending,
+            skip_existing=args.skip_existing,
+            stats_interval=args.stats_interval,
+        )
+    except (OSError, ValueError) as e:
+        print(f"{__project__} watch: error: {e}", file=sys.stderr)
+        return 2
+    # finish the renders in progress before exiting
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: watcher.stop())
+    watcher.run(once=args.once)
+    return 1 if watcher.stats.total_failed else 0
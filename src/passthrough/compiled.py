@@ -0,0 +1,291 @@
+"""Precompiled type template artifacts
+
+Parsing a type template, stripping its comments and discovering the installed
+extensions is work that every process rendering the template has to repeat before its
+first label can be produced. A `CompiledTemplate` captures the outcome of those steps
+once, and can be persisted to (and loaded from) an on-disk artifact so that short-lived
+workers can skip them. The XInclude fragments of the template are expanded at compile
+time, and the artifact is considered stale once any of them is modified.
+
+The PT attributes of the template are checked at compile time, so that unrecognised or
+empty ones are reported before any label is rendered. They are still evaluated (and
+their combinations validated) by `Template` when rendering, as elements are copied and
+moved about in the process.
+
+Artifacts are pickles, so they must only be loaded from trusted locations.
+"""
+
+__all__ = [
+    "ARTIFACT_FORMAT",
+    "CompiledTemplate",
+    "compile_template",
+    "template_digest",
+]
+
+import hashlib
+import os
+import pickle
+from copy import deepcopy
+from importlib import import_module
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, List, Optional, Union
+
+from lxml import etree
+
+from . import PT_NS
+from .exc import PTArtifactError, PTEvalError, PTSyntaxError
+from .extensions import get_extensions
+from .fragments import expand_includes
+from .label_tools import LabelLike, labellike_to_etree
+from .loaders import is_url
+
+ARTIFACT_FORMAT = 3
+
+
+class CompiledTemplate:
+    """A type template pre-processed for fast instantiation.
+
+    Instances are created with `CompiledTemplate.compile` (or `compile_template`), and
+    can be passed to `Template` in place of the original `LabelLike` template.
+
+    Attributes:
+        xml bytes: The serialised template, with comments stripped unless
+            `keep_comments` is set.
+        url Optional[str]: The URL (path) the template was originally loaded from.
+        digest str: SHA-256 hex digest of the original template.
+        version str: The passthrough version the template was compiled with.
+        keep_comments bool: Whether template comments were retained in `xml`.
+        extensions Dict[str, str]: Mapping of extension prefixes to the names of the
+            modules implementing them.
+        fragments Dict[str, int]: The modification times (in ns) of the XInclude
+            fragment files the template was assembled from, by path.
+    """
+
+    def __init__(
+        self,
+        xml: bytes,
+        url: Optional[str],
+        digest: str,
+        keep_comments: bool,
+        extensions: Dict[str, str],
+        sourcelines: List[Optional[int]],
+        version: Optional[str] = None,
+        fragments: Optional[Dict[str, int]] = None,
+    ):
+        self.xml = xml
+        self.url = url
+        self.digest = digest
+        self.keep_comments = keep_comments
+        self.extensions = extensions
+        self.version = version or _version()
+        self.fragments = fragments or {}
+        self._sourcelines = sourcelines
+        self._label: Optional[etree._ElementTree] = None
+
+    def __getstate__(self):
+        # drop the parsed tree, which can't be pickled (e.g. for process pools)
+        state = self.__dict__.copy()
+        state["_label"] = None
+        return state
+
+    @classmethod
+    def compile(
+        cls, template: LabelLike, keep_comments: bool = False
+    ) -> "CompiledTemplate":
+        """Compile `template` into a `CompiledTemplate`.
+
+        Args:
+            template: `LabelLike` representation of the type template.
+            keep_comments: If enabled, retain XML comments from `template`.
+
+        Raises:
+            PTSyntaxError: if an unrecognised PT attribute is encountered.
+            PTEvalError: if a PT attribute expression is empty.
+        """
+        from .state import PTState  # deferred to avoid a circular import
+
+        try:
+            label = labellike_to_etree(template)
+        except TypeError as e:
+            raise TypeError(f"template is in an {e}") from None
+        digest = template_digest(template, label)
+        fragments = dict(expand_includes(label))
+        if not keep_comments:
+            etree.strip_elements(label, etree.Comment, with_tail=False)
+
+        for elem in label.getroot().iter("*"):
+            for attr, exp in elem.items():
+                qname = etree.QName(attr)
+                if qname.namespace != PT_NS["uri"]:
+                    continue
+                if qname.localname not in PTState._PROPERTIES:
+                    raise PTSyntaxError(
+                        f"unrecognised PT attribute: {qname.localname}", elem
+                    )
+                if not len(exp):
+                    raise PTEvalError(
+                        f'{PT_NS["prefix"]}:{qname.localname}="" - PT attribute'
+                        " expression is empty",
+                        elem,
+                    )
+
+        return cls(
+            xml=etree.tostring(label, encoding="UTF-8", xml_declaration=True),
+            url=label.docinfo.URL,
+            digest=digest,
+            keep_comments=keep_comments,
+            extensions={
+                prefix: mod.__name__ for prefix, mod in get_extensions().items()
+            },
+            sourcelines=[elem.sourceline for elem in label.getroot().iter()],
+            fragments=fragments,
+        )
+
+    @classmethod
+    def load(cls, path: Union[Path, str]) -> "CompiledTemplate":
+        """Load a `CompiledTemplate` from the artifact at `path`.
+
+        Artifacts are unpickled, which can execute arbitrary code: only load artifacts
+        from a trusted source (e.g. those written by `save` to a location only writable
+        by trusted users).
+
+        Raises:
+            PTArtifactError: if the artifact is unreadable, or was created by a
+                different version of passthrough.
+        """
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            raise PTArtifactError(f"unable to read artifact {path}: {e}") from None
+        if not isinstance(state, dict) or state.get("format") != ARTIFACT_FORMAT:
+            raise PTArtifactError(f"{path} is not a compatible template artifact")
+        if state["version"] != _version():
+            raise PTArtifactError(
+                f"artifact {path} was compiled with passthrough {state['version']},"
+                f" not {_version()}"
+            )
+        del state["format"]
+        return cls(**state)
+
+    def save(self, path: Union[Path, str]) -> None:
+        """Persist the `CompiledTemplate` to an artifact at `path`."""
+        state = {
+            "format": ARTIFACT_FORMAT,
+            "xml": self.xml,
+            "url": self.url,
+            "digest": self.digest,
+            "keep_comments": self.keep_comments,
+            "extensions": self.extensions,
+            "sourcelines": self._sourcelines,
+            "version": self.version,
+            "fragments": self.fragments,
+        }
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write-then-rename so that concurrent readers never see a partial artifact
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(path)
+
+    def is_current(self, template: Optional[LabelLike] = None) -> bool:
+        """Check whether the `CompiledTemplate` is up to date.
+
+        It is stale if it was compiled by a different version of passthrough, or if
+        any of the fragment files it includes has since been modified.
+
+        Args:
+            template: If provided, also check that the `CompiledTemplate` was compiled
+                from an identical `template`.
+        """
+        if self.version != _version():
+            return False
+        for path, mtime in self.fragments.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return template is None or template_digest(template) == self.digest
+
+    def to_etree(self) -> etree._ElementTree:
+        """Return a fresh copy of the template as an lxml element tree.
+
+        The template is only parsed on the first call; subsequent calls copy the
+        parsed tree, which is considerably cheaper.
+        """
+        if self._label is None:
+            label = etree.fromstring(self.xml, base_url=self.url).getroottree()
+            # restore the original line numbers for use in error messages
+            for elem, line in zip(label.getroot().iter(), self._sourcelines):
+                if line is not None:
+                    elem.sourceline = line
+            self._label = label
+        return deepcopy(self._label)
+
+    def load_extensions(self) -> Dict[str, ModuleType]:
+        """Import and return the extension modules recorded at compile time."""
+        try:
+            return {
+                prefix: import_module(name) for prefix, name in self.extensions.items()
+            }
+        except ImportError as e:
+            raise PTArtifactError(f"unable to load extension: {e}") from None
+
+
+def template_digest(
+    template: LabelLike, label: Optional[etree._ElementTree] = None
+) -> str:
+    """Return the SHA-256 hex digest of `template`.
+
+    File-backed templates are hashed by their raw contents (which avoids having to
+    parse them), any other `LabelLike` (including URLs, which are fetched anew) by its
+    serialisation.
+    """
+    if isinstance(template, Path) or (
+        isinstance(template, str) and not is_url(template)
+    ):
+        data = Path(template).expanduser().read_bytes()
+    else:
+        if label is None:
+            label = labellike_to_etree(template)
+        data = etree.tostring(label, encoding="UTF-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def compile_template(
+    template: LabelLike,
+    artifact: Union[Path, str],
+    keep_comments: bool = False,
+) -> CompiledTemplate:
+    """Load the compiled `template` from `artifact`, (re)compiling it if required.
+
+    The artifact is recompiled if it is missing, unreadable, was compiled from a
+    different `template` or with different options, or by a different version of
+    passthrough.
+
+    Args:
+        template: `LabelLike` representation of the type template.
+        artifact: Path of the on-disk artifact, which must be trusted (see
+            `CompiledTemplate.load`).
+        keep_comments: If enabled, retain XML comments from `template`.
+    """
+    try:
+        compiled = CompiledTemplate.load(artifact)
+    except PTArtifactError:
+        pass
+    else:
+        if compiled.keep_comments == keep_comments and compiled.is_current(template):
+            return compiled
+    compiled = CompiledTemplate.compile(template, keep_comments)
+    compiled.save(artifact)
+    return compiled
+
+
+def _version() -> str:
+    # looked up on first use, as reading the distribution metadata is slow
+    from . import __version__
+
+    return __version__
@@ -2,13 +2,20 @@ from lxml import etree
 
 
 class PTError(Exception):
-    """Base class for passthrough exceptions."""
+    """Base class for passthrough exceptions.
+
+    Attributes:
+        message str: The error message, without the template element details.
+        tag Optional[str]: The local name of the template element the error arose from.
+        sourceline Optional[int]: The line of that element in the template.
+    """
 
     def __init__(self, msg: str, t_elem: etree._Element = None):
+        self.message = msg
+        self.tag = etree.QName(t_elem.tag).localname if t_elem is not None else None
+        self.sourceline = t_elem.sourceline if t_elem is not None else None
         elem_info = (
-            f" ({etree.QName(t_elem.tag).localname} @ line {t_elem.sourceline})"
-            if t_elem is not None
-            else ""
+            f" ({self.tag} @ line {self.sourceline})" if t_elem is not None else ""
         )
         super().__init__(f"{msg}{elem_info}")
 
@@ -41,3 +48,21 @@ class PTTemplateError(PTError):
     """An error arose from the template structure"""
 
     pass
+
+
+class PTArtifactError(PTError):
+    """A precompiled template artifact could not be used"""
+
+    pass
+
+
+class PTValidationError(PTError):
+    """A label failed schema validation"""
+
+    pass
+
+
+class PTCompileError(PTError):
+    """A template construct is not supported by the XSLT compiler"""
+
+    pass
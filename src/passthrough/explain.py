@@ -0,0 +1,351 @@
+"""Static analysis of type templates
+
+`explain_template` (or `Template.explain`) reports how a type template would be
+processed, without rendering it: each PT-annotated element with its PT expressions,
+the `pt:sources`, `pt:fetch` and `pt:required` it inherits, its expected fan-out (the
+number of copies `pt:multi` or a source group makes of it), and the work deferred to
+export. It also flags constructs which scale poorly:
+
+- `reorder`: a `pt:reorder` class with many children, as sorting them is quadratic.
+- `fan-out`: an element expected to be copied many times over.
+- `descendant-scan`: an expression using `//`, which scans the whole source document
+  each time it is evaluated.
+
+```python
+plan = Template.explain("template.xml", {"input": "sample.xml"})
+print(plan.format())
+```
+
+Given sample sources, the report is annotated with estimates of the number of
+instances of each element, i.e. the number of times its expressions are evaluated.
+`pt:fetch` and `pt:multi` expressions which are not literals are evaluated against the
+samples where possible (i.e. when they don't call extension functions). Estimates
+assume the copies of an element resemble the first; without samples, source groups are
+assumed to hold a single source, and fan-outs which depend on the sources are unknown.
+"""
+
+__all__ = [
+    "FANOUT_LIMIT",
+    "REORDER_WIDTH",
+    "Hazard",
+    "Plan",
+    "PlanStep",
+    "explain_template",
+]
+
+import json
+import re
+from collections import namedtuple
+from copy import deepcopy
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+from lxml import etree
+
+from . import PT_NS
+from .compiled import CompiledTemplate
+from .exc import PTSyntaxError
+from .fragments import expand_includes
+from .label_tools import (
+    LabelLike,
+    PathManipulator,
+    add_default_ns,
+    is_labellike,
+    labellike_to_etree,
+)
+from .loaders import prefetch
+
+REORDER_WIDTH = 32  # children of a pt:reorder class
+FANOUT_LIMIT = 100  # copies of an element
+
+# A PT-annotated template element: its ElementPath (in prefix notation) and source
+# line, its PT expressions, the effective `sources`, `fetch` and `required` expressions
+# (declared or inherited), the names of those which are inherited, its expected
+# fan-out and estimated number of instances (None if unknown), and the properties
+# evaluated at export
+PlanStep = namedtuple(
+    "PlanStep",
+    (
+        "path",
+        "sourceline",
+        "exps",
+        "sources",
+        "fetch",
+        "required",
+        "inherited",
+        "fanout",
+        "instances",
+        "deferred",
+    ),
+)
+# A construct which scales poorly: its kind, the path and source line of the element it
+# is declared on, and a description
+Hazard = namedtuple("Hazard", ("kind", "path", "sourceline", "message"))
+
+_PT = f"{{{PT_NS['uri']}}}"
+_LITERALS = {"true()": True, "false()": False}
+_STRING_LITERAL = re.compile(r"'[^']*'|\"[^\"]*\"")
+# pt:* properties which are not XPath expressions
+_NOT_XPATH = {"sources"}
+_INHERITED = ("sources", "fetch", "required")
+
+
+class Plan:
+    """The processing plan of a type template, as produced by `explain_template`.
+
+    Attributes:
+        steps List[PlanStep]: The PT-annotated elements, in document order.
+        hazards List[Hazard]: The constructs flagged as scaling poorly.
+        sampled bool: Whether the estimates are based on sample sources.
+    """
+
+    def __init__(self, steps: List[PlanStep], hazards: List[Hazard], sampled: bool):
+        self.steps = steps
+        self.hazards = hazards
+        self.sampled = sampled
+
+    @property
+    def deferred(self) -> List[PlanStep]:
+        """The steps with work deferred to export."""
+        return [step for step in self.steps if step.deferred]
+
+    def to_dict(self) -> dict:
+        """Return the plan as a JSON-serialisable dict."""
+        return {
+            "sampled": self.sampled,
+            "steps": [step._asdict() for step in self.steps],
+            "hazards": [hazard._asdict() for hazard in self.hazards],
+        }
+
+    def to_json(self, **kwargs) -> str:
+        """Return the plan as JSON (`kwargs` are passed on to `json.dumps`)."""
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def format(self) -> str:
+        """Return the plan as a human-readable report."""
+        lines = []
+        for step in self.steps:
+            counts = f"fan-out {_count(step.fanout)}"
+            if self.sampled:
+                counts += f", ~{_count(step.instances)} instances"
+            lines.append(f"line {step.sourceline}: {step.path} ({counts})")
+            exps = (f'{PT_NS["prefix"]}:{kw}="{e}"' for kw, e in step.exps.items())
+            lines.append(f"    {' '.join(exps)}")
+            if step.inherited:
+                inherited = ", ".join(
+                    f'{kw}="{getattr(step, kw)}"' for kw in step.inherited
+                )
+                lines.append(f"    inherits {inherited}")
+            if step.deferred:
+                lines.append(f"    deferred to export: {', '.join(step.deferred)}")
+        for hazard in self.hazards:
+            lines.append(
+                f"{hazard.kind} at line {hazard.sourceline} ({hazard.path}):"
+                f" {hazard.message}"
+            )
+        lines.append(
+            f"{len(self.steps)} annotated elements, {len(self.deferred)} with deferred"
+            f" work, {len(self.hazards)} hazards"
+        )
+        return "\n".join(lines)
+
+
+def explain_template(
+    template: Union[LabelLike, CompiledTemplate],
+    source_map: Optional[Dict[str, Union[LabelLike, Sequence[LabelLike]]]] = None,
+    template_source_entry: bool = True,
+) -> Plan:
+    """Analyse `template` without rendering it.
+
+    Args:
+        template: `LabelLike` representation of the type template, or a
+            `CompiledTemplate` thereof.
+        source_map: Sample sources to base estimates on, as for `Template`.
+        template_source_entry: As for `Template`; only relevant with a `source_map`.
+
+    Raises:
+        PTSyntaxError: if an unrecognised PT attribute is encountered.
+    """
+    from .state import PTState  # deferred to avoid a circular import
+
+    if isinstance(template, CompiledTemplate):
+        label = template.to_etree()
+    else:
+        try:
+            label = deepcopy(labellike_to_etree(template))
+        except TypeError as e:
+            raise TypeError(f"template is in an {e}") from None
+        expand_includes(label)
+    samples = None
+    if source_map is not None:
+        samples = _load_samples(source_map)
+        if template_source_entry:
+            samples.setdefault("template", [label])
+    analysis = _Analysis(label, samples, PTState._PROPERTIES)
+    root = label.getroot()
+    analysis.walk(root, {kw: None for kw in _INHERITED}, False, None, 1)
+    return Plan(analysis.steps, analysis.hazards, samples is not None)
+
+
+class _Analysis:
+    def __init__(self, label, samples, properties):
+        self.label = label
+        self.samples = samples
+        self.properties = properties
+        self.steps: List[PlanStep] = []
+        self.hazards: List[Hazard] = []
+        self._paths = PathManipulator(add_default_ns(label.getroot().nsmap))
+
+    def walk(self, elem, inherited, fetch, primary, instances):
+        exps = self._exps(elem)
+        path = self.label.getelementpath(elem)
+        root_path = f"/{self.label.getroot().tag}"
+        display = self._paths.clark_to_prefix(
+            root_path if path == "." else f"{root_path}/{path}"
+        )
+        effective = {kw: exps.get(kw, inherited[kw]) for kw in _INHERITED}
+
+        # the sources an element's copies are populated from, if sampled
+        members = [primary] if primary is not None else []
+        if "sources" in exps:
+            members = (self.samples or {}).get(exps["sources"], [])
+            primary = members[0] if members else None
+        nsmap = add_default_ns(primary.getroot().nsmap) if primary is not None else {}
+        if "fetch" in exps:
+            fetch = self._fold(exps["fetch"], primary, nsmap)
+        multi = self._fold(exps["multi"], primary, nsmap) if "multi" in exps else False
+
+        group = len(members) if "sources" in exps and members else 1
+        if fetch is True and self.samples is not None and members:
+            fanout = sum(self._copies(elem, path, m) for m in members)
+        elif fetch is True:
+            if multi is True or multi is None:
+                fanout = None  # depends on the number of source elements
+            else:
+                fanout = group * max(multi, 1)
+        elif fetch is False:
+            fanout = None if multi is None else group * max(int(multi), 1)
+        else:
+            fanout = None
+        instances = None if None in (instances, fanout) else instances * fanout
+
+        deferred = []
+        if "fill" in exps and "defer" in exps:
+            if self._fold(exps["defer"], primary, nsmap) is not False:
+                deferred.append("fill")
+        if "required" in exps and fetch is not True:
+            deferred.append("required")
+
+        if exps:
+            self.steps.append(
+                PlanStep(
+                    display,
+                    elem.sourceline,
+                    exps,
+                    *(effective[kw] for kw in _INHERITED),
+                    [kw for kw in _INHERITED if kw not in exps and effective[kw]],
+                    fanout,
+                    instances,
+                    deferred,
+                )
+            )
+        self._check(elem, path, display, exps, fanout, instances, primary)
+
+        for child in elem.iterchildren(tag=etree.Element):
+            self.walk(child, effective, fetch, primary, instances)
+
+    def _exps(self, elem) -> Dict[str, str]:
+        exps = {}
+        for attr, exp in elem.items():
+            if not attr.startswith(_PT):
+                continue
+            kw = attr[len(_PT) :]
+            if kw not in self.properties:
+                raise PTSyntaxError(f"unrecognised PT attribute: {kw}", elem)
+            exps[kw] = exp
+        return exps
+
+    def _copies(self, elem, path, source):
+        # the number of copies of elem per copy of its parent, in the source element
+        # matching (the first copy of) its parent: the fan-out of the parent is already
+        # accounted for by its instances
+        parent = elem.getparent()
+        if parent is None:
+            return 1
+        parent_path = self.label.getelementpath(parent)
+        if parent_path == ".":
+            return len(source.findall(path))
+        s_parent = source.find(parent_path)
+        if s_parent is None:
+            return 0
+        return len(s_parent.findall(path[len(parent_path) + 1 :]))
+
+    @staticmethod
+    def _fold(exp, primary, nsmap):
+        # the value of a pt:fetch or pt:multi expression, if it can be determined
+        exp = exp.strip()
+        if exp in _LITERALS:
+            return _LITERALS[exp]
+        if exp.isdigit():
+            return int(exp)
+        if primary is None:
+            return None
+        try:
+            val = primary.xpath(exp, namespaces=nsmap)
+        except (etree.XPathError, RuntimeError):
+            # calls an extension function (raising RuntimeError if its namespace is
+            # registered, as no ExtensionManager is active)
+            return None
+        if isinstance(val, bool):
+            return val
+        if isinstance(val, float) and val.is_integer() and val >= 0:
+            return int(val)
+        return None
+
+    def _check(self, elem, path, display, exps, fanout, instances, primary):
+        def flag(kind, message):
+            self.hazards.append(Hazard(kind, display, elem.sourceline, message))
+
+        if "reorder" in exps:
+            width = len(elem)
+            if primary is not None:
+                s_elem = primary.find(path)
+                if s_elem is not None:
+                    width = max(width, len(s_elem))
+            if width > REORDER_WIDTH:
+                flag(
+                    "reorder",
+                    f"pt:reorder sorts {width} children, in time quadratic in their"
+                    " number",
+                )
+        if fanout is not None and fanout > FANOUT_LIMIT:
+            flag("fan-out", f"the element is copied {fanout} times")
+        for kw, exp in exps.items():
+            if kw in _NOT_XPATH or "//" not in _STRING_LITERAL.sub("", exp):
+                continue
+            times = f", ~{instances} times" if self.samples and instances else ""
+            flag(
+                "descendant-scan",
+                f"pt:{kw} scans the whole source document with // each time it is"
+                f" evaluated{times}",
+            )
+
+
+def _load_samples(
+    source_map: Dict[str, Union[LabelLike, Sequence[LabelLike]]]
+) -> Dict[str, List[etree._ElementTree]]:
+    labellikes = []
+    for val in source_map.values():
+        labellikes.extend([val] if is_labellike(val) else val)
+    loaded = prefetch(labellikes)
+    samples = {}
+    for key, val in source_map.items():
+        samples[key] = [
+            loaded[ll] if isinstance(ll, (Path, str)) else labellike_to_etree(ll)
+            for ll in ([val] if is_labellike(val) else val)
+        ]
+    return samples
+
+
+def _count(n: Optional[int]) -> str:
+    return "?" if n is None else str(n)
@@ -1,14 +1,59 @@
+import re
+import threading
+from collections import OrderedDict, namedtuple
 from functools import partial
-from typing import Any, MutableMapping, Optional
+from types import ModuleType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from lxml import etree
 
-from .. import PT_EXT_URI_BASE, importlib_metadata
-from ..label_tools import add_default_ns
+from .. import PT_EXT_URI_BASE
+from ..exc import PTEvalError
+from ..label_tools import FrozenNsmap, NsmapCache, add_default_ns
+
+# Stand-in for the result of a pending batched call; private use code points keep it
+# from colliding with genuine label content
+_BATCH_TOKEN = "\ue000{}\ue001"
+_BATCH_TOKEN_RE = re.compile("\ue000(\\d+)\ue001")
 
 
 def get_extensions():  # -> MutableMapping[str, ModuleType]:
-    """ Return a dict of all installed extension modules as {prefix: module}. """
+    """Return a dict of all installed extension modules as {prefix: module}.
+
+    An extension module must provide a `functions` mapping of XPath function names to
+    implementations. It may additionally provide a `volatile` collection naming those
+    functions whose results vary between invocations with identical arguments (e.g.
+    the current time), which are masked when comparing exported labels, and a `pure`
+    collection naming those functions whose results depend solely on their arguments
+    (i.e. not on the evaluation context or any other state), which are memoized in
+    `memo_cache`. Node-set arguments of pure functions are only to be inspected for
+    their content, not navigated beyond (e.g. to their ancestors or document), as
+    results are shared between arguments of identical serialisation.
+
+    Finally, a `batched` collection may name functions that are evaluated in bulk:
+    rather than `(ctx, *args)`, these take a sequence of `(ctx, args)` calls and return
+    a sequence holding the result of each. Calls made while filling elements are
+    collected, and each batched function invoked once for all of them when the
+    pending calls are flushed (see `ExtensionManager.flush`). Until then a call
+    yields a placeholder string, so a batched function's result may only be inserted
+    into an element's text (directly or e.g. via `concat()`), not computed with.
+    """
+    try:
+        import importlib.metadata as importlib_metadata
+    except ImportError:
+        import importlib_metadata
+
     extensions = importlib_metadata.entry_points(group="passthrough.extensions")
     # FIXME: kluge. Passthrough doesn't register its entry points if installed in dev
     #  mode in another project (e.g. with poetry and develop=true)
@@ -21,12 +66,116 @@ def get_extensions():  # -> MutableMapping[str, ModuleType]:
     return extensions
 
 
+# Statistics of a MemoCache, analogous to those of functools.lru_cache
+CacheInfo = namedtuple("CacheInfo", ("hits", "misses", "evictions", "size", "maxsize"))
+
+
+class MemoCache:
+    """A bounded, thread-safe LRU cache of pure extension function results.
+
+    Results are keyed on the function and its arguments, with node-set arguments
+    normalised to the serialisation of their nodes. Keys are therefore independent of
+    the identity of the documents the nodes belong to, so results can be shared
+    between elements, sources and renders alike. Only scalar (string, number and
+    boolean) results are cached, as node-sets are bound to their document.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+
+    def call(self, func: Callable, ctx: "PTContext", args: tuple) -> Any:
+        """Return `func(ctx, *args)`, from the cache if previously computed."""
+        if self.maxsize <= 0:
+            return func(ctx, *args)
+        try:
+            key = (func, *(self._normalise(arg) for arg in args))
+        except TypeError:  # unhashable argument (e.g. from a custom extension)
+            return func(ctx, *args)
+        with self._lock:
+            try:
+                result = self._entries[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+        result = func(ctx, *args)
+        if isinstance(result, (str, float, int)):
+            if isinstance(result, str):
+                result = str(result)  # drop any reference to a source document
+            with self._lock:
+                self._entries[key] = result
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return result
+
+    def info(self) -> CacheInfo:
+        """Return the cache's hit, miss and eviction counts and its current size."""
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions, len(self._entries), self.maxsize
+            )
+
+    def clear(self) -> None:
+        """Empty the cache and reset its statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    @classmethod
+    def _normalise(cls, arg: Any) -> Hashable:
+        if isinstance(arg, list):  # node-set
+            return tuple(cls._normalise(item) for item in arg)
+        if isinstance(arg, etree._Element):
+            return etree.tostring(arg, with_tail=False)
+        if isinstance(arg, str):  # also drops the parent of lxml "smart" strings
+            return str(arg)
+        hash(arg)
+        return arg
+
+
+memo_cache = MemoCache()
+
+# Extension functions are registered with lxml once, process-wide, and dispatched to the
+# ExtensionManager active in the calling thread, so that templates can be processed
+# concurrently in multiple threads
+_active = threading.local()
+_registered: Dict[Tuple[str, str], Tuple[Callable, str]] = {}
+_registered_lock = threading.Lock()
+
+
+def _dispatch(func: Callable, method: str, ctx, *args):
+    manager = getattr(_active, "manager", None)
+    if manager is None:
+        raise RuntimeError("no ExtensionManager has been activated in this thread")
+    return getattr(manager, method)(func, ctx, *args)
+
+
 class ExtensionManager:
-    def __init__(self):
+    def __init__(
+        self,
+        extensions: Optional[Mapping[str, ModuleType]] = None,
+        nsmaps: Optional[NsmapCache] = None,
+    ):
         self.t_elem: Optional[etree._Element] = None
+        # the namespace maps of the documents functions are evaluated against
+        self.nsmaps = nsmaps
         self.function_namespaces: MutableMapping[str, etree.FunctionNamespace] = {}
+        # elements filled using functions whose results vary between invocations
+        self.volatile_elems: List[etree._Element] = []
+        # qualified ("prefix:name") names of the registered pure functions
+        self.pure_functions: Set[str] = set()
+        # whether calls to batched functions are deferred until the next flush
+        self.batching = False
+        self._pending: List[Tuple[Callable, PTContext, tuple]] = []
 
-        extensions = get_extensions()
+        if extensions is None:
+            extensions = get_extensions()
         for prefix, mod in extensions.items():
             if not hasattr(mod, "functions"):
                 raise AttributeError(
@@ -37,21 +186,109 @@ class ExtensionManager:
             uri = f"{PT_EXT_URI_BASE}/{prefix}"
             fns = etree.FunctionNamespace(uri)
             fns.prefix = prefix
+            volatile = getattr(mod, "volatile", ())
+            pure = getattr(mod, "pure", ())
+            batched = getattr(mod, "batched", ())
             for func_name, func in mod.functions.items():
-                fns[func_name] = partial(self._dispatch, func)
+                if func_name in batched:
+                    method = "_dispatch_batched"
+                elif func_name in volatile:
+                    method = "_dispatch_volatile"
+                elif func_name in pure:
+                    method = "_dispatch_pure"
+                    self.pure_functions.add(f"{prefix}:{func_name}")
+                else:
+                    method = "_dispatch"
+                with _registered_lock:
+                    if _registered.get((uri, func_name)) != (func, method):
+                        fns[func_name] = partial(_dispatch, func, method)
+                        _registered[(uri, func_name)] = (func, method)
             self.function_namespaces[prefix] = fns
+        self.activate()
+
+    def activate(self) -> None:
+        """Make this the manager extension functions called in this thread report to.
+
+        Managers are activated in the thread creating them, and must be (re-)activated
+        before evaluating expressions in any other thread, or if another manager may
+        have been created (or activated) in the same thread since.
+        """
+        _active.manager = self
+
+    def deactivate(self) -> None:
+        """Stop extension functions from reporting to this manager."""
+        if getattr(_active, "manager", None) is self:
+            _active.manager = None
 
     def set_elem_context(self, t_elem):
         # during tree traversal: set self.t_elem that will be passed to extensions
         self.t_elem = t_elem
 
+    def flush(self) -> None:
+        """Evaluate the pending batched calls and fill in their results.
+
+        Each batched function is invoked once with all of its pending calls, and the
+        placeholders in the text of the elements the calls were made for are replaced
+        with the results.
+        """
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        calls: Dict[Callable, List[int]] = {}
+        for idx, (func, _, _) in enumerate(pending):
+            calls.setdefault(func, []).append(idx)
+        results: List[Optional[str]] = [None] * len(pending)
+        for func, idxs in calls.items():
+            func_results = func([pending[idx][1:] for idx in idxs])
+            if len(func_results) != len(idxs):
+                raise PTEvalError(
+                    f"batched function {func.__name__} returned {len(func_results)}"
+                    f" results for {len(idxs)} calls",
+                    pending[idxs[0]][1].t_elem,
+                )
+            for idx, result in zip(idxs, func_results):
+                results[idx] = self._batch_result_str(result)
+
+        def substitute(match):
+            return results[int(match.group(1))]
+
+        elems = {id(ctx.t_elem): ctx.t_elem for _, ctx, _ in pending}
+        for elem in elems.values():
+            if elem.text is not None:
+                elem.text = _BATCH_TOKEN_RE.sub(substitute, elem.text)
+
     def _dispatch(self, func, ctx, *args, **kwargs):
-        return func(PTContext(self.t_elem, ctx), *args, **kwargs)
+        return func(PTContext(self.t_elem, ctx, self.nsmaps), *args, **kwargs)
+
+    def _dispatch_pure(self, func, ctx, *args):
+        return memo_cache.call(func, PTContext(self.t_elem, ctx, self.nsmaps), args)
+
+    def _dispatch_batched(self, func, ctx, *args):
+        call = (PTContext(self.t_elem, ctx, self.nsmaps), args)
+        if not self.batching or self.t_elem is None:
+            return func([call])[0]
+        self._pending.append((func, *call))
+        return _BATCH_TOKEN.format(len(self._pending) - 1)
+
+    @staticmethod
+    def _batch_result_str(result: Any) -> str:
+        # mirror the string conversion of pt:fill results
+        if isinstance(result, bool):
+            return str(result).lower()
+        return str(result)
+
+    def _dispatch_volatile(self, func, ctx, *args, **kwargs):
+        if self.t_elem is not None:
+            self.volatile_elems.append(self.t_elem)
+        return self._dispatch(func, ctx, *args, **kwargs)
 
 
 class PTContext:
-    def __init__(self, t_elem: etree._Element, ctx):
+    def __init__(
+        self, t_elem: etree._Element, ctx, nsmaps: Optional[NsmapCache] = None
+    ):
         self._t_elem = t_elem
+        self._nsmaps = nsmaps
         self._s_root = ctx.context_node
         self._s_xpath = None
         self._s_nsmap = None
@@ -68,9 +305,9 @@ class PTContext:
         return self.t_elem.getroottree().getroot()
 
     @property
-    def t_nsmap(self) -> MutableMapping[str, str]:
+    def t_nsmap(self) -> FrozenNsmap:
         if self._t_nsmap is None:
-            self._t_nsmap = add_default_ns(self.t_root.nsmap)
+            self._t_nsmap = self._get_nsmap(self.t_root)
         return self._t_nsmap
 
     def t_xpath(self, expression: str) -> Any:
@@ -88,7 +325,12 @@ class PTContext:
         return self._s_xpath(expression)
 
     @property
-    def s_nsmap(self) -> MutableMapping[str, str]:
+    def s_nsmap(self) -> FrozenNsmap:
         if self._s_nsmap is None:
-            self._s_nsmap = add_default_ns(self.s_root.nsmap)
+            self._s_nsmap = self._get_nsmap(self.s_root)
         return self._s_nsmap
+
+    def _get_nsmap(self, elem: etree._Element) -> FrozenNsmap:
+        if self._nsmaps is None:
+            return FrozenNsmap(add_default_ns(elem.nsmap))
+        return self._nsmaps.get(elem)
@@ -11,3 +11,7 @@ functions = {
     lid_subunit.__name__.replace("_", ".", 1): lid_subunit,
     lid_time.__name__.replace("_", ".", 1): lid_time,
 }
+
+pure = {
+    lid_to_browse.__name__.replace("_", ".", 1),
+}
@@ -11,3 +11,11 @@ functions = {
     datetime_add.__name__.replace("_", "."): datetime_add,
     datetime_now.__name__.replace("_", "."): datetime_now,
 }
+
+volatile = {
+    datetime_now.__name__.replace("_", "."),
+}
+
+pure = {
+    datetime_add.__name__.replace("_", "."),
+}
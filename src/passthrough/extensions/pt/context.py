@@ -1,30 +1,111 @@
-from typing import Union
+import threading
+from typing import Any, Callable, Optional, Union
 
 from lxml import etree
 
 from ...exc import PTEvalError
 
-_context_map: dict = {}
+# per thread, so that templates can be processed concurrently
+_local = threading.local()
 
+_UNSET = object()
 
-def set_context_map(map_: dict):
-    global _context_map
-    _context_map = map_
+
+class ContextProvider:
+    """A context map entry computed on demand, when first looked up by `pt:context`.
+
+    Plain callables in a context map behave as providers of scope "render". An explicit
+    `ContextProvider` is only needed for a scope of "batch".
+
+    Attributes:
+        func Callable[[], Any]: The function computing the entry's value.
+        scope str: How long the computed value is reused: "render" for the remainder
+            of the render (i.e. `Template`) it was computed for, or "batch" for every
+            render the provider is used in. The latter are shared by the threads of a
+            process, but not between processes (e.g. of a process pool).
+    """
+
+    SCOPES = ("render", "batch")
+
+    def __init__(self, func: Callable[[], Any], scope: str = "render"):
+        """Wrap `func` as a context provider of the given `scope`.
+
+        Raises:
+            ValueError: if `scope` is not one of `SCOPES`.
+        """
+        if scope not in self.SCOPES:
+            raise ValueError(f"unknown scope '{scope}', expected one of {self.SCOPES}")
+        self.func = func
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._value = _UNSET
+
+    def __call__(self):
+        return self.func()
+
+    def __getstate__(self):
+        # drop the lock (which can't be pickled) and any value computed in this process
+        state = self.__dict__.copy()
+        del state["_lock"], state["_value"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._value = _UNSET
+
+    def value(self):
+        """Return the batch-scoped value, computing it on first use."""
+        if self._value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:  # not computed by another thread meanwhile
+                    self._value = self.func()
+        return self._value
+
+    def reset(self) -> None:
+        """Discard the batch-scoped value, so that it is recomputed on next use."""
+        with self._lock:
+            self._value = _UNSET
+
+
+def set_context_map(map_: Optional[dict], cache: Optional[dict] = None):
+    """Set the context map of the current thread.
+
+    Args:
+        map_: The context map.
+        cache: The values of the render-scoped providers of `map_` computed so far.
+            Pass the same dict to resume a render, or None to start a new one.
+    """
+    _local.context_map = map_ if map_ is not None else {}
+    _local.cache = cache if cache is not None else {}
 
 
 def context_get(ctx, key):
-    global _context_map
     key = _unpack(key)
     try:
-        return _context_map[key]
+        val = getattr(_local, "context_map", {})[key]
     except KeyError:
         raise PTEvalError(f"context entry '{key}' has not been registered", ctx.t_elem)
+    if callable(val):
+        try:
+            if isinstance(val, ContextProvider) and val.scope == "batch":
+                return val.value()
+            cache = _local.cache
+            if key not in cache:
+                cache[key] = val()
+            return cache[key]
+        except PTEvalError:
+            raise
+        except Exception as e:
+            raise PTEvalError(
+                f"context entry '{key}' could not be computed: {e!r}", ctx.t_elem
+            ) from e
+    return val
 
 
 # def context_set(_, key, value):
-#     global _context_map
 #     key = _unpack(key)
-#     _context_map[key] = value
+#     _local.context_map[key] = value
 
 
 # TODO: should probably centralise this
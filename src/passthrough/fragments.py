@@ -0,0 +1,167 @@
+"""XInclude template fragments
+
+Blocks shared by many type templates (e.g. `Identification_Area` or
+`Modification_History`) can be kept in fragment files of their own, and included in
+each template with an XInclude element:
+
+```xml
+<Product_Observational xmlns="http://pds.nasa.gov/pds4/pds/v1"
+    xmlns:xi="http://www.w3.org/2001/XInclude">
+  <xi:include href="fragments/identification_area.xml"/>
+  ...
+</Product_Observational>
+```
+
+Includes are expanded when a template is loaded by `Template` or compiled into a
+`CompiledTemplate`. Relative `href`s are resolved against the location of the including
+file, fragments may include further fragments, and an `xi:fallback` child provides the
+content to use should the fragment be missing. Only whole-document XML includes are
+supported (i.e. no `parse="text"` or `xpointer`).
+
+Parsed fragments (with their own includes expanded) are cached process-wide, keyed on
+their resolved path and checked against the modification times of the files they were
+assembled from, so that templates sharing a fragment only parse it once. The cache holds
+at most `MAX_CACHED_FRAGMENTS` fragments, evicting the least recently used.
+"""
+
+__all__ = [
+    "MAX_CACHED_FRAGMENTS",
+    "XINCLUDE_NS",
+    "Fragment",
+    "clear_fragment_cache",
+    "expand_includes",
+    "load_fragment",
+]
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from copy import deepcopy
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+from lxml import etree
+
+from .exc import PTTemplateError
+from .label_tools import parse_label
+
+XINCLUDE_NS = "http://www.w3.org/2001/XInclude"
+_INCLUDE = f"{{{XINCLUDE_NS}}}include"
+_FALLBACK = f"{{{XINCLUDE_NS}}}fallback"
+
+MAX_CACHED_FRAGMENTS = 128
+
+# A parsed fragment: its root element (with any includes of its own expanded), and the
+# (path, mtime) pairs of the files it was assembled from, itself first
+Fragment = namedtuple("Fragment", ("root", "files"))
+
+# Parsed fragments by resolved path, least recently used first
+_cache: Dict[str, Fragment] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def clear_fragment_cache() -> None:
+    """Discard all cached fragments."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def load_fragment(path: Union[Path, str]) -> Fragment:
+    """Return the parsed fragment at `path`, from the cache if it is up to date.
+
+    The returned fragment is shared, so its `root` must not be modified.
+
+    Raises:
+        OSError: if the fragment (or one it includes) can't be read.
+        etree.XMLSyntaxError: if the fragment is not well-formed.
+        PTTemplateError: if the fragment contains an unsupported or circular include.
+    """
+    return _load(str(Path(path).expanduser().resolve()), ())
+
+
+def expand_includes(
+    label: Union[etree._ElementTree, etree._Element]
+) -> List[Tuple[str, int]]:
+    """Replace the XInclude elements of `label` with the fragments they include.
+
+    Returns:
+        The (path, mtime) pairs of the fragment files included, directly or not.
+
+    Raises:
+        PTTemplateError: if an include is unsupported, circular or can't be read (and
+            provides no fallback).
+    """
+    return _expand(label, ())
+
+
+def _load(path: str, stack: Tuple[str, ...]) -> Fragment:
+    with _cache_lock:
+        fragment = _cache.get(path)
+        if fragment is not None and _is_current(fragment):
+            _cache.move_to_end(path)
+            return fragment
+    mtime = os.stat(path).st_mtime_ns  # before parsing, so later changes are noticed
+    root = parse_label(path).getroot()
+    files = [(path, mtime), *_expand(root, (*stack, path))]
+    fragment = Fragment(root, files)
+    with _cache_lock:
+        _cache[path] = fragment
+        _cache.move_to_end(path)
+        while len(_cache) > MAX_CACHED_FRAGMENTS:
+            _cache.popitem(last=False)
+    return fragment
+
+
+def _is_current(fragment: Fragment) -> bool:
+    try:
+        return all(os.stat(path).st_mtime_ns == mtime for path, mtime in fragment.files)
+    except OSError:
+        return False
+
+
+def _expand(
+    label: Union[etree._ElementTree, etree._Element], stack: Tuple[str, ...]
+) -> List[Tuple[str, int]]:
+    root = label.getroot() if isinstance(label, etree._ElementTree) else label
+    files = []
+    # restart the search after each substitution, as it may move (fallback) or drop
+    # (the include's own subtree) other includes
+    while True:
+        include = next(root.iter(_INCLUDE), None)
+        if include is None:
+            return files
+        parent = include.getparent()
+        if parent is None:
+            raise PTTemplateError("the root element can't be an XInclude", include)
+        if include.get("parse", "xml") != "xml" or "xpointer" in include.attrib:
+            raise PTTemplateError(
+                "only whole-document XML XIncludes are supported", include
+            )
+        href = include.get("href")
+        if not href:
+            raise PTTemplateError("XInclude is missing its href", include)
+        path = Path(href)
+        if not path.is_absolute() and include.base is not None:
+            path = Path(include.base).parent / path
+        path = str(path.expanduser().resolve())
+        if path in stack:
+            raise PTTemplateError(f"circular XInclude of {href}", include)
+
+        try:
+            fragment = _load(path, stack)
+        except (OSError, etree.XMLSyntaxError) as e:
+            fallback = include.find(_FALLBACK)
+            if fallback is None:
+                raise PTTemplateError(
+                    f"unable to include {href}: {e}", include
+                ) from None
+            content = list(fallback)
+            if len(content):
+                content[-1].tail = include.tail
+            index = parent.index(include)
+            parent[index : index + 1] = content
+            continue
+        files.extend(fragment.files)
+        elem = deepcopy(fragment.root)
+        elem.tail = include.tail
+        parent.replace(include, elem)
@@ -4,28 +4,34 @@ __all__ = [
     "LabelLike",
     "PDS_NS_PREFIX",
     "ATTR_PATHS",
+    "COMPRESSIONS",
+    "is_labellike",
     "labellike_to_etree",
+    "detect_compression",
+    "parse_label",
+    "compress_label",
     "add_default_ns",
+    "FrozenNsmap",
+    "NsmapCache",
     "is_populated",
+    "label_digest",
     "PathManipulator",
 ]
 
+import hashlib
+import sys
+from importlib import import_module
 from pathlib import Path
-from typing import Dict, Optional, Union
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Tuple, Union
+from weakref import WeakKeyDictionary
 
 from lxml import etree
 
-try:
+if TYPE_CHECKING:
     from pds4_tools.reader.general_objects import StructureList
     from pds4_tools.reader.label_objects import Label
-except ModuleNotFoundError:
-    StructureList = None
-    Label = None
 
-if None not in (StructureList, Label):
-    LabelLike = Union[etree._ElementTree, StructureList, Label, Path, str]
-else:
-    LabelLike = Union[etree._ElementTree, Path, str]
+LabelLike = Union[etree._ElementTree, "StructureList", "Label", Path, str]
 
 PDS_NS_PREFIX = "pds"
 
@@ -39,15 +45,65 @@ ATTR_PATHS = {
     # "exposure_duration": "//img:Exposure/img:exposure_duration",
 }
 
+# Supported label compression formats, mapped to the modules implementing them
+COMPRESSIONS = {"gz": "gzip", "xz": "lzma", "bz2": "bz2"}
+_COMPRESSION_SUFFIXES = {f".{c}": c for c in COMPRESSIONS}
+_COMPRESSION_MAGIC = {b"\x1f\x8b": "gz", b"\xfd7zXZ\x00": "xz", b"BZh": "bz2"}
+# label file extensions taken to be uncompressed, so that the files aren't sniffed (any
+# gzip-compressed ones are still decompressed by libxml2)
+_LABEL_SUFFIXES = {".xml", ".lblx"}
 
-def labellike_to_etree(labellike: LabelLike) -> etree._ElementTree:
+# Conversions of pds4_tools Labels which could not be read directly from disk
+_label_cache = WeakKeyDictionary()
+
+
+def _pds4_tools_types():
+    # pds4_tools (and NumPy with it) is slow to import, so its types are only looked up
+    # once imported elsewhere, as they must have been to create any pds4_tools labels
+    if "pds4_tools" not in sys.modules:
+        return None, None
+    try:
+        from pds4_tools.reader.general_objects import StructureList
+        from pds4_tools.reader.label_objects import Label
+    except ImportError:
+        return None, None
+    return StructureList, Label
+
+
+def is_labellike(obj) -> bool:
+    """Check whether `obj` is a `LabelLike` (rather than e.g. a sequence of them)."""
+    if isinstance(obj, (etree._ElementTree, Path, str)):
+        return True
+    return any(t is not None and isinstance(obj, t) for t in _pds4_tools_types())
+
+
+def labellike_to_etree(labellike: LabelLike, cache: bool = False) -> etree._ElementTree:
+    """Return `labellike` as an lxml element tree.
+
+    Strings may be paths or URLs, the latter being loaded by the loader registered for
+    their scheme (see `passthrough.loaders`). pds4_tools `StructureList`s are re-read
+    directly from their label file where possible, which is considerably faster than
+    serialising and re-parsing the label. Other pds4_tools `Label`s have to be
+    serialised, but the result can be cached.
+
+    Args:
+        labellike: The label to convert.
+        cache: If enabled, reuse the element tree previously converted from the same
+            pds4_tools `Label` object. The tree is shared, so must not be modified.
+    """
     if isinstance(labellike, etree._ElementTree):
         return labellike
     if isinstance(labellike, Path):
         labellike = str(labellike.expanduser().resolve())
         # continue to handling of str
     if isinstance(labellike, str):
-        return etree.parse(labellike)
+        if "://" in labellike:
+            from .loaders import is_url, load_url  # deferred to avoid a circular import
+
+            if is_url(labellike):
+                return load_url(labellike)
+        return parse_label(labellike)
+    StructureList, Label = _pds4_tools_types()
     base_url = None
     if StructureList is not None and isinstance(labellike, StructureList):
         prefix = "Processing label: "
@@ -56,22 +112,154 @@ def labellike_to_etree(labellike: LabelLike) -> etree._ElementTree:
             # *should* always resolve to the abs path of the XML label
             base_url = log[len(prefix) :]
         labellike = labellike.label
+        if cache and labellike in _label_cache:
+            return _label_cache[labellike]
+        if base_url is not None and Path(base_url).is_file():
+            # skip the serialise/re-parse round trip by reading the label file afresh
+            tree = etree.parse(base_url)
+            if cache:
+                _label_cache[labellike] = tree
+            return tree
         # continue to handling of Label
     if Label is not None and isinstance(labellike, Label):
-        return etree.fromstring(
+        if cache and labellike in _label_cache:
+            return _label_cache[labellike]
+        tree = etree.fromstring(
             labellike.to_string(unmodified=True), base_url=base_url
         ).getroottree()
+        if cache:
+            _label_cache[labellike] = tree
+        return tree
     raise TypeError(
         f"unknown label format {type(labellike)}, expected one of {LabelLike}"
     )
 
 
+def detect_compression(path: Union[Path, str]) -> Optional[str]:
+    """Return the compression format of the file at `path`, or None if uncompressed.
+
+    The format is determined by the file extension: `.gz`, `.xz` and `.bz2` files are
+    compressed, and `.xml` and `.lblx` files are not. The format of files with any
+    other extension is determined by their magic bytes.
+
+    Raises:
+        OSError: if the file has to be sniffed but can't be read.
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix in _COMPRESSION_SUFFIXES:
+        return _COMPRESSION_SUFFIXES[suffix]
+    if suffix in _LABEL_SUFFIXES:
+        return None
+    with open(path, "rb") as f:
+        head = f.read(6)
+    for magic, fmt in _COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return fmt
+    return None
+
+
+def parse_label(path: Union[Path, str]) -> etree._ElementTree:
+    """Parse the (optionally gzip, xz or bz2 compressed) label file at `path`.
+
+    Compressed labels are decompressed as they are parsed, without reading the whole
+    file into memory first.
+    """
+    path = str(path)
+    compression = detect_compression(path)
+    if compression is None:
+        return etree.parse(path)
+    with import_module(COMPRESSIONS[compression]).open(path, "rb") as f:
+        return etree.parse(f, base_url=path)
+
+
+def compress_label(
+    data: bytes, compression: str, compresslevel: Optional[int] = None
+) -> bytes:
+    """Compress the serialised label `data`.
+
+    Args:
+        data: The serialised label.
+        compression: The compression format; one of the keys of `COMPRESSIONS`.
+        compresslevel: The compression level (by default, that of the format's
+            module): 1-9 for gzip and bz2, or the preset 0-9 for xz.
+
+    Raises:
+        ValueError: if `compression` is not supported.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(
+            f"unsupported compression '{compression}', expected one of"
+            f" {list(COMPRESSIONS)}"
+        )
+    module = import_module(COMPRESSIONS[compression])
+    if compresslevel is None:
+        return module.compress(data)
+    if compression == "xz":
+        return module.compress(data, preset=compresslevel)
+    return module.compress(data, compresslevel)
+
+
 def add_default_ns(nsmap: Dict[Optional[str], str]) -> Dict[str, str]:
-    nsmap[PDS_NS_PREFIX] = nsmap[None]
-    del nsmap[None]
+    """Give the default namespace of `nsmap` (if any) the PDS prefix, in place.
+
+    XPath has no notion of a default namespace, so elements in it can only be
+    selected by way of a prefix.
+    """
+    if None in nsmap:
+        nsmap[PDS_NS_PREFIX] = nsmap.pop(None)
     return nsmap
 
 
+class FrozenNsmap(dict):
+    """A read-only namespace map, as shared by `NsmapCache`.
+
+    It is a `dict` subclass, as lxml won't accept other mappings as namespace maps.
+    Use `copy` to obtain a mutable copy.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("shared namespace maps are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+class NsmapCache:
+    """A cache of the namespace maps of elements, normalised by `add_default_ns`.
+
+    lxml builds a new dict on every access of an element's `nsmap`, so when many
+    expressions are evaluated against the same few documents, their maps are better
+    computed once and shared (hence read-only). Cached elements, and therefore their
+    documents, are kept alive until the cache is cleared.
+    """
+
+    def __init__(self):
+        self._maps: Dict[int, Tuple[etree._Element, FrozenNsmap]] = {}
+
+    def get(self, elem: Union[etree._ElementTree, etree._Element]) -> FrozenNsmap:
+        """Return the normalised namespace map of `elem` (or a tree's root element)."""
+        if isinstance(elem, etree._ElementTree):
+            elem = elem.getroot()
+        # holding on to the element keeps its id (and lxml proxy) from being reused
+        entry = self._maps.get(id(elem))
+        if entry is None:
+            nsmap = FrozenNsmap(add_default_ns(elem.nsmap))
+            entry = self._maps[id(elem)] = (elem, nsmap)
+        return entry[1]
+
+    def discard(self, elem: Union[etree._ElementTree, etree._Element]) -> None:
+        """Release the namespace map of `elem` (or a tree's root element), if cached."""
+        if isinstance(elem, etree._ElementTree):
+            elem = elem.getroot()
+        entry = self._maps.get(id(elem))
+        if entry is not None and entry[0] is elem:
+            del self._maps[id(elem)]
+
+    def clear(self) -> None:
+        """Release all cached namespace maps (and the elements they belong to)."""
+        self._maps.clear()
+
+
 def is_populated(elem: etree._Element):
     if elem.text is not None and bool(elem.text.strip()):
         return True
@@ -83,6 +271,24 @@ def is_populated(elem: etree._Element):
     return False
 
 
+def label_digest(label: Union[bytes, etree._ElementTree], mask: Iterable[str] = ()):
+    """Return the SHA-256 hex digest of the canonical (C14N) form of `label`.
+
+    Args:
+        label: A serialised label, or a label element tree.
+        mask: ElementPaths (relative to the root) of elements whose text should be
+            disregarded, e.g. because it changes on every export. Paths which are not
+            present in `label` are ignored.
+    """
+    if isinstance(label, bytes):
+        label = etree.fromstring(label).getroottree()
+    for path in mask:
+        elem = label.find(path)
+        if elem is not None:
+            elem.text = None
+    return hashlib.sha256(etree.tostring(label, method="c14n")).hexdigest()
+
+
 class PathManipulator:
     def __init__(self, nsmap: dict, default_prefix: str = PDS_NS_PREFIX):
         self._nsmap = nsmap
@@ -0,0 +1,217 @@
+"""Source label loaders for URLs, and concurrent prefetching of sources
+
+Besides paths, source labels (and templates) may be given as URLs, which are loaded by
+the loader registered for their scheme:
+
+- `file:///path/to/label.xml`: a local (optionally compressed) label file.
+- `http://host/label.xml`, `https://...`: a label served over HTTP(S). Connections are
+  kept alive and reused for later requests to the same host from the same thread.
+- `zip:///path/to/archive.zip!/member.xml`, `tar:///path/to/archive.tar.gz!/...`: a
+  member of a zip or (optionally compressed) tar archive.
+
+Further loaders are registered through the `passthrough.loaders` entry point group,
+named for the URL scheme they handle (see `get_loaders`).
+
+As loading a label from latency-bound storage mostly consists of waiting, `Template`
+loads the file and URL sources of a render concurrently, on a shared thread pool (see
+`prefetch`).
+"""
+
+__all__ = [
+    "HTTP_TIMEOUT",
+    "PREFETCH_WORKERS",
+    "get_loaders",
+    "is_url",
+    "load_archive_member",
+    "load_file",
+    "load_http",
+    "load_url",
+    "prefetch",
+]
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Union
+from urllib.parse import urlsplit, urlunsplit
+from urllib.request import url2pathname
+
+from lxml import etree
+
+from .label_tools import LabelLike, labellike_to_etree, parse_label
+
+HTTP_TIMEOUT = 30  # seconds
+PREFETCH_WORKERS = 8
+
+# A URL scheme is at least two characters long, so as not to mistake a Windows drive
+_URL = re.compile(r"[A-Za-z][A-Za-z0-9+.-]+://")
+
+Loader = Callable[[str], etree._ElementTree]
+
+_loaders: Optional[Dict[str, Loader]] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None  # the process the executor's threads belong to
+_executor_lock = threading.Lock()
+
+
+class _Connections(threading.local):
+    # HTTP(S) connections of the current thread, by (scheme, host)
+    def __init__(self):
+        self.pool = {}
+
+
+_connections = _Connections()
+
+
+def _reset_after_fork():
+    # the pool's threads don't survive a fork (nor does the lock if one of them held
+    # it), and connections mustn't be shared with the parent
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _connections.pool = {}
+
+
+if hasattr(os, "register_at_fork"):  # Python 3.7+, POSIX
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_loaders() -> Dict[str, Loader]:
+    """Return a dict of all installed source loaders as {URL scheme: loader}.
+
+    A loader is a callable taking a URL and returning the label it locates as an lxml
+    element tree. It should raise an `OSError` if the label can't be retrieved. As
+    loaders are called concurrently by `prefetch`, they must be thread-safe.
+
+    Loaders registered through entry points take precedence over the built-in ones.
+    """
+    global _loaders
+    if _loaders is None:
+        try:
+            import importlib.metadata as importlib_metadata
+        except ImportError:
+            import importlib_metadata
+
+        # the built-ins are included regardless, in case passthrough's own entry points
+        # aren't registered (e.g. if installed in dev mode in another project)
+        loaders = {
+            "file": load_file,
+            "http": load_http,
+            "https": load_http,
+            "tar": load_archive_member,
+            "zip": load_archive_member,
+        }
+        entry_points = importlib_metadata.entry_points(group="passthrough.loaders")
+        loaders.update((ep.name, ep.load()) for ep in entry_points)
+        _loaders = loaders
+    return _loaders
+
+
+def is_url(labellike: LabelLike) -> bool:
+    """Check whether `labellike` is a URL string (rather than e.g. a path)."""
+    return isinstance(labellike, str) and _URL.match(labellike) is not None
+
+
+def load_url(url: str) -> etree._ElementTree:
+    """Load the label at `url` with the loader registered for its scheme.
+
+    Raises:
+        ValueError: if no loader is registered for the URL's scheme.
+        OSError: if the label can't be retrieved.
+    """
+    scheme = url.split(":", 1)[0].lower()
+    try:
+        loader = get_loaders()[scheme]
+    except KeyError:
+        raise ValueError(f"no source loader is registered for {scheme}:// URLs")
+    return loader(url)
+
+
+def load_file(url: str) -> etree._ElementTree:
+    """Load a `file://` URL."""
+    return parse_label(url2pathname(urlsplit(url).path))
+
+
+def load_http(url: str) -> etree._ElementTree:
+    """Load an `http://` or `https://` URL over a pooled connection."""
+    # comparatively expensive to import
+    from http.client import HTTPConnection, HTTPException, HTTPSConnection
+
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    target = urlunsplit(("", "", parts.path or "/", parts.query, ""))
+    while True:
+        conn = _connections.pool.get(key)
+        fresh = conn is None
+        if fresh:
+            cls = HTTPSConnection if parts.scheme == "https" else HTTPConnection
+            conn = _connections.pool[key] = cls(parts.netloc, timeout=HTTP_TIMEOUT)
+        try:
+            conn.request("GET", target)
+            response = conn.getresponse()
+            data = response.read()
+        except (HTTPException, OSError) as e:
+            conn.close()
+            del _connections.pool[key]
+            if fresh:
+                raise OSError(f"unable to fetch {url}: {e}") from None
+            continue  # the server may have closed the pooled connection meanwhile
+        if response.will_close:
+            conn.close()
+            del _connections.pool[key]
+        if response.status != 200:
+            raise OSError(
+                f"unable to fetch {url}: HTTP {response.status} {response.reason}"
+            )
+        return etree.fromstring(data, base_url=url).getroottree()
+
+
+def load_archive_member(url: str) -> etree._ElementTree:
+    """Load a `zip://` or `tar://` URL, of the form `<scheme>://<archive>!/<member>`."""
+    import tarfile  # comparatively expensive to import
+    import zipfile
+
+    parts = urlsplit(url)
+    archive, sep, member = url2pathname(parts.path).partition("!/")
+    if not sep:
+        raise ValueError(f"archive URL {url} doesn't name a member (<archive>!/...)")
+    try:
+        if parts.scheme == "zip":
+            with zipfile.ZipFile(archive) as zf, zf.open(member) as f:
+                return etree.parse(f, base_url=url)
+        with tarfile.open(archive) as tf:
+            f = tf.extractfile(member)
+            if f is None:
+                raise OSError(f"{member} is not a file")
+            with f:
+                return etree.parse(f, base_url=url)
+    except (KeyError, zipfile.BadZipFile, tarfile.TarError) as e:
+        raise OSError(f"unable to read {url}: {e}") from None
+
+
+def prefetch(
+    labellikes: Iterable[LabelLike],
+) -> Dict[Union[Path, str], etree._ElementTree]:
+    """Load the path and URL labels among `labellikes` concurrently.
+
+    Each distinct path or URL is loaded once, on a thread pool shared by the process
+    (of `PREFETCH_WORKERS` threads); other `LabelLike`s are disregarded.
+
+    Returns:
+        The loaded labels, keyed on the path or URL they were loaded from.
+    """
+    global _executor, _executor_pid
+    pending = [ll for ll in labellikes if isinstance(ll, (Path, str))]
+    pending = list(dict.fromkeys(pending))
+    if len(pending) < 2:  # not worth a round trip through the pool
+        return {ll: labellike_to_etree(ll) for ll in pending}
+    with _executor_lock:
+        # the pid check covers forks on interpreters without os.register_at_fork
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                PREFETCH_WORKERS, thread_name_prefix="passthrough-prefetch"
+            )
+            _executor_pid = os.getpid()
+    return dict(zip(pending, _executor.map(labellike_to_etree, pending)))
@@ -0,0 +1,121 @@
+"""Shared source and template preloading for multi-process rendering
+
+When rendering with `multiprocessing`, each worker would otherwise parse the same
+shared sources (e.g. calibration products) and type templates. Calling `preload` in the
+parent process before the worker pool is created parses them once; workers forked
+from the parent inherit the parsed trees copy-on-write, and layer their per-job
+sources on top using `source_map`:
+
+```python
+from multiprocessing import get_context
+
+from passthrough import Template, preload
+
+preload.preload(
+    sources={"flat": "flatfield.xml", "bias": "bias.xml"},
+    templates={"rad": "rad_template.xml"},
+)
+
+def render(job):
+    input_path, out_dir = job
+    template = Template(
+        preload.template("rad"), preload.source_map({"input": input_path})
+    )
+    template.export(out_dir)
+
+with get_context("fork").Pool(64) as pool:
+    pool.map(render, jobs)
+```
+
+Shared source trees are only ever read while rendering, and `Template` works on a
+private copy of each preloaded template, so the shared state is never mutated.
+"""
+
+__all__ = [
+    "preload",
+    "source_map",
+    "template",
+    "clear",
+]
+
+import gc
+from typing import Dict, Mapping, Optional, Sequence, Tuple, Union
+
+from lxml import etree
+
+from .compiled import CompiledTemplate
+from .label_tools import LabelLike, is_labellike, labellike_to_etree
+
+_sources: Dict[str, Union[etree._ElementTree, Tuple[etree._ElementTree, ...]]] = {}
+_templates: Dict[str, CompiledTemplate] = {}
+
+
+def preload(
+    sources: Optional[Mapping[str, Union[LabelLike, Sequence[LabelLike]]]] = None,
+    templates: Optional[Mapping[str, Union[LabelLike, CompiledTemplate]]] = None,
+    freeze: bool = True,
+) -> None:
+    """Parse shared sources and compile templates into the process-wide registry.
+
+    Call this in the parent process before forking workers. Entries are added to
+    those of any previous call, replacing entries with the same key.
+
+    Args:
+        sources: A source map (as accepted by `Template`) of the sources shared by
+            all jobs.
+        templates: A mapping of keys to `LabelLike` type templates (or already
+            compiled templates), retrievable in the workers with `template`.
+        freeze: If enabled, move all objects tracked by the garbage collector into a
+            permanent generation (see `gc.freeze`), so that collections in the
+            workers don't touch, and thereby copy, the pages holding them.
+    """
+    for key, val in (sources or {}).items():
+        try:
+            if is_labellike(val):
+                _sources[key] = labellike_to_etree(val, cache=True)
+            else:
+                _sources[key] = tuple(labellike_to_etree(ll, cache=True) for ll in val)
+        except TypeError as e:
+            raise TypeError(f"source map key {key} maps to an {e}") from None
+    for key, val in (templates or {}).items():
+        if not isinstance(val, CompiledTemplate):
+            val = CompiledTemplate.compile(val)
+        val.to_etree()  # parse now so that workers only ever copy the tree
+        _templates[key] = val
+    if freeze and hasattr(gc, "freeze"):  # Python 3.7+
+        gc.collect()
+        gc.freeze()
+
+
+def source_map(
+    job_sources: Optional[Mapping[str, Union[LabelLike, Sequence[LabelLike]]]] = None
+) -> Dict[str, Union[LabelLike, Sequence[LabelLike]]]:
+    """Return a source map of the preloaded sources, overlaid with `job_sources`.
+
+    A new map is returned on each call; neither the registry nor the shared source
+    trees are modified.
+
+    Args:
+        job_sources: Per-job source map entries. These take precedence over shared
+            entries with the same key.
+    """
+    smap = dict(_sources)
+    if job_sources is not None:
+        smap.update(job_sources)
+    return smap
+
+
+def template(key: str) -> CompiledTemplate:
+    """Return the preloaded template registered under `key`."""
+    try:
+        return _templates[key]
+    except KeyError:
+        raise KeyError(f"no template has been preloaded for the key '{key}'") from None
+
+
+def clear() -> None:
+    """Empty the registry of preloaded sources and templates."""
+    _sources.clear()
+    _templates.clear()
+    if hasattr(gc, "unfreeze"):
+        gc.unfreeze()
@@ -0,0 +1,184 @@
+"""Memory profiling of label rendering
+
+A `Template` created with `profile_memory=True` traces the Python allocations of each
+of its processing phases with `tracemalloc`, and records them in a `MemoryProfile`:
+
+```python
+template = Template("template.xml", {"input": "input.xml"}, profile_memory=True)
+template.export("out")
+print(template.memory_profile.to_json())
+```
+
+The phases are `parse` (loading the template and sources), `traverse` (populating the
+partial label), `snapshot` (copying the partial label for the structure check),
+`deferred` (evaluating deferred `pt:fill`s and `pt:required`s), `checks` (the
+post-processing checks) and `export` (serialising and writing the label). For each,
+the profile holds the peak and retained traced memory, and the allocation sites
+retaining the most memory.
+
+lxml trees are allocated by libxml2, out of sight of `tracemalloc`; their sizes are
+instead estimated from their node counts with `estimate_tree_size`.
+
+`tracemalloc` traces the whole process, so only one `Template` should be profiled at a
+time, and concurrent threads skew the figures.
+"""
+
+__all__ = [
+    "AllocationSite",
+    "MemoryProfile",
+    "PhaseReport",
+    "estimate_tree_size",
+    "phase",
+]
+
+import json
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Union
+
+from lxml import etree
+
+# A source line retaining memory at the end of a phase: its "file:line" location, and
+# the size and number of the memory blocks it allocated during the phase
+AllocationSite = namedtuple("AllocationSite", ("location", "size", "count"))
+# The allocations of a processing phase: its duration, the peak and retained traced
+# memory in bytes (relative to the start of the phase), and its top allocation sites
+PhaseReport = namedtuple(
+    "PhaseReport", ("name", "seconds", "peak", "retained", "sites")
+)
+
+# Approximate sizes in bytes of libxml2's node structures on 64-bit platforms
+_NODE_SIZE = 120  # xmlNode (elements, text, comments, processing instructions)
+_ATTR_SIZE = 96  # xmlAttr, plus a text node child for its value
+_NS_SIZE = 48  # xmlNs
+
+
+class MemoryProfile:
+    """The per-phase allocation reports of a profiled render.
+
+    Attributes:
+        phases List[PhaseReport]: The reports of the phases profiled so far, in order.
+        trees Dict[str, int]: The estimated sizes in bytes of the lxml trees involved,
+            by name (e.g. "label", or "source:input").
+        top int: The number of allocation sites recorded per phase.
+    """
+
+    def __init__(self, top: int = 10, frames: int = 1):
+        """Prepare a profile.
+
+        Args:
+            top: The number of allocation sites to record per phase.
+            frames: The number of stack frames to record per allocation, should
+                tracing need to be started (see `tracemalloc.start`).
+        """
+        self.phases: List[PhaseReport] = []
+        self.trees: Dict[str, int] = {}
+        self.top = top
+        self._frames = frames
+
+    @property
+    def peak(self) -> int:
+        """The highest peak of traced memory of any phase."""
+        return max((p.peak for p in self.phases), default=0)
+
+    def record_tree(
+        self, name: str, tree: Union[etree._ElementTree, etree._Element]
+    ) -> None:
+        """Record the estimated size of the lxml `tree` under `name`."""
+        self.trees[name] = estimate_tree_size(tree)
+
+    def to_dict(self) -> dict:
+        """Return the profile as a JSON-serialisable dict."""
+        return {
+            "peak": self.peak,
+            "trees": dict(self.trees),
+            "phases": [
+                {
+                    **phase._asdict(),
+                    "seconds": round(phase.seconds, 6),
+                    "sites": [site._asdict() for site in phase.sites],
+                }
+                for phase in self.phases
+            ],
+        }
+
+    def to_json(self, **kwargs) -> str:
+        """Return the profile as JSON (`kwargs` are passed on to `json.dumps`)."""
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+@contextmanager
+def phase(profile: Optional[MemoryProfile], name: str) -> Iterator[None]:
+    """Profile the allocations of the enclosed block as phase `name` of `profile`.
+
+    Does nothing if `profile` is None, so that instrumented code doesn't need to check
+    whether profiling is enabled.
+    """
+    if profile is None:
+        yield
+        return
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(profile._frames)
+    elif hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+        tracemalloc.reset_peak()
+    try:
+        before = tracemalloc.take_snapshot()
+        initial, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+    # disregard the bookkeeping of the profiling itself
+    ignore = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ]
+    diffs = after.filter_traces(ignore).compare_to(
+        before.filter_traces(ignore), "lineno"
+    )
+    sites = [
+        AllocationSite(
+            f"{d.traceback[0].filename}:{d.traceback[0].lineno}",
+            d.size_diff,
+            d.count_diff,
+        )
+        for d in diffs[: profile.top]
+        if d.size_diff > 0
+    ]
+    profile.phases.append(
+        PhaseReport(name, seconds, peak - initial, current - initial, sites)
+    )
+
+
+def estimate_tree_size(tree: Union[etree._ElementTree, etree._Element]) -> int:
+    """Estimate the memory in bytes held by libxml2 for the lxml `tree`.
+
+    The estimate counts the node structures of the tree's elements, attributes, text
+    and namespace declarations, plus the length of their text; tag and attribute names
+    are interned by libxml2, and so are disregarded.
+    """
+    if isinstance(tree, etree._ElementTree):
+        tree = tree.getroot()
+    size = 0
+    for node in tree.iter():
+        size += _NODE_SIZE
+        if node.text:
+            size += _NODE_SIZE + len(node.text.encode())
+        if node.tail:
+            size += _NODE_SIZE + len(node.tail.encode())
+        if isinstance(node, etree._Element) and not isinstance(
+            node, (etree._Comment, etree._ProcessingInstruction)
+        ):
+            for val in node.attrib.values():
+                size += _ATTR_SIZE + _NODE_SIZE + len(val.encode())
+            parent = node.getparent()
+            inherited = len(parent.nsmap) if parent is not None else 0
+            size += _NS_SIZE * max(len(node.nsmap) - inherited, 0)
+    return size
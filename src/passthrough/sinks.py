@@ -0,0 +1,182 @@
+"""Export sinks for delivering many labels in bulk
+
+Writing hundreds of thousands of small label files is dominated by per-file metadata
+operations on shared filesystems. An `ArchiveSink` instead streams labels into a single
+tar or zip archive, written sequentially by a dedicated thread. It can be passed to
+`Template.export` in place of an output directory, or fed serialised labels directly
+with `ArchiveSink.add`, and may be shared by any number of producer threads:
+
+```python
+with ArchiveSink("labels.tar.gz", compression="gz") as sink:
+    for source in sources:
+        Template("template.xml", {"input": source}).export(sink)
+```
+"""
+
+__all__ = [
+    "ArchiveMember",
+    "ArchiveSink",
+]
+
+import io
+import json
+import queue
+import tarfile
+import threading
+import time
+import zipfile
+from collections import namedtuple
+from pathlib import Path
+from typing import List, Optional, Union
+
+# An archive member: its name, the offset of its header within the (uncompressed)
+# archive stream, and the size of its (uncompressed) data
+ArchiveMember = namedtuple("ArchiveMember", ("name", "offset", "size"))
+
+_TAR_MODES = {None: "w", "gz": "w:gz", "bz2": "w:bz2", "xz": "w:xz"}
+_ZIP_COMPRESSION = {
+    None: zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bz2": zipfile.ZIP_BZIP2,
+    "xz": zipfile.ZIP_LZMA,
+}
+_STOP = object()
+
+
+class ArchiveSink:
+    """Stream labels into a tar or zip archive from a dedicated writer thread.
+
+    Attributes:
+        path pathlib.Path: Path of the archive being written.
+        index List[ArchiveMember]: The members written so far, in archive order.
+    """
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+        format: str = "tar",
+        compression: Optional[str] = None,
+        queue_size: int = 256,
+        index_path: Optional[Union[Path, str]] = None,
+    ):
+        """Open the archive at `path` for writing and start the writer thread.
+
+        Args:
+            path: Path of the archive to create (overwriting any existing file).
+            format: Archive format; one of "tar" or "zip".
+            compression: Compression to apply; one of None, "gz", "bz2" or "xz" for
+                tar archives, or None, "deflate", "bz2" or "xz" for zip archives.
+            queue_size: The maximum number of labels waiting to be written before
+                producers are blocked.
+            index_path: If provided, write the archive index to this path as JSON
+                when the sink is closed.
+        """
+        self.path = Path(path)
+        self.index: List[ArchiveMember] = []
+        self._index_path = Path(index_path) if index_path is not None else None
+        if format == "tar":
+            if compression not in _TAR_MODES:
+                raise ValueError(
+                    f"unsupported tar compression '{compression}', expected one of"
+                    f" {list(_TAR_MODES)}"
+                )
+            self._archive = tarfile.open(self.path, _TAR_MODES[compression])
+            self._write = self._write_tar
+        elif format == "zip":
+            if compression not in _ZIP_COMPRESSION:
+                raise ValueError(
+                    f"unsupported zip compression '{compression}', expected one of"
+                    f" {list(_ZIP_COMPRESSION)}"
+                )
+            self._archive = zipfile.ZipFile(
+                self.path, "w", compression=_ZIP_COMPRESSION[compression]
+            )
+            self._write = self._write_zip
+        else:
+            raise ValueError(f"unsupported archive format '{format}'")
+
+        self._names = set()
+        self._names_lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = threading.Thread(
+            target=self._run, name=f"ArchiveSink({self.path.name})", daemon=True
+        )
+        self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, name: str, data: bytes) -> None:
+        """Queue `data` to be written to the archive as member `name`.
+
+        Blocks if the writer thread has fallen `queue_size` labels behind.
+
+        Raises:
+            ValueError: if the sink is closed, or a member called `name` has already
+                been added.
+            Exception: any error previously encountered by the writer thread.
+        """
+        self._raise_writer_error()
+        with self._names_lock:
+            if self._closed:
+                raise ValueError("cannot add to a closed ArchiveSink")
+            if name in self._names:
+                raise ValueError(f"archive already contains a member '{name}'")
+            self._names.add(name)
+        self._queue.put((name, data))
+
+    def close(self) -> None:
+        """Write all queued labels, finalise the archive and stop the writer thread.
+
+        Closing a sink more than once is allowed.
+
+        Raises:
+            Exception: any error encountered by the writer thread.
+        """
+        with self._names_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._archive.close()
+        if self._index_path is not None and self._error is None:
+            self._index_path.write_text(
+                json.dumps([member._asdict() for member in self.index], indent=1)
+            )
+        self._raise_writer_error()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            if self._error is not None:
+                continue  # drain the queue so that producers don't block forever
+            try:
+                self.index.append(self._write(*item))
+            except BaseException as e:  # re-raised in the producer threads
+                self._error = e
+
+    def _write_tar(self, name: str, data: bytes) -> ArchiveMember:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        offset = self._archive.offset
+        self._archive.addfile(info, io.BytesIO(data))
+        return ArchiveMember(name, offset, info.size)
+
+    def _write_zip(self, name: str, data: bytes) -> ArchiveMember:
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = self._archive.compression
+        self._archive.writestr(info, data)
+        return ArchiveMember(name, info.header_offset, info.file_size)
+
+    def _raise_writer_error(self):
+        if self._error is not None:
+            raise self._error
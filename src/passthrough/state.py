@@ -5,7 +5,7 @@ from lxml import etree
 
 from . import PT_NS
 from .exc import PTEvalError, PTStateError, PTSyntaxError, PTTemplateError
-from .label_tools import add_default_ns
+from .label_tools import NsmapCache
 
 Property = namedtuple("Property", ("default", "inherit", "types"))
 
@@ -52,6 +52,7 @@ class PTState(UserDict):
         source_map: Dict[
             str, Union[etree._ElementTree, Sequence[etree._ElementTree]]
         ] = None,
+        nsmaps: Optional[NsmapCache] = None,
     ):
         super().__init__()
 
@@ -63,11 +64,14 @@ class PTState(UserDict):
             self._conform_source_map(source_map) if source_map is not None else None
         )
         self.nsmap = None  # (re)set when evaluating the source_map
+        # shared by the whole state hierarchy
+        self._nsmaps = nsmaps if nsmaps is not None else NsmapCache()
         self.exp = {kw: None for kw in self._PROPERTIES}
         self.update({kw: prop.default for kw, prop in self._PROPERTIES.items()})
 
         if parent is not None:
             self._source_map = parent._source_map
+            self._nsmaps = parent._nsmaps
             self.nsmap = parent.nsmap
             for kw, prop in self._PROPERTIES.items():
                 if prop.inherit:
@@ -118,7 +122,7 @@ class PTState(UserDict):
                     f"{self._exp_str('sources')} did not match any source (group)",
                     self.t_elem,
                 )
-            self.nsmap = add_default_ns(self["sources"].primary.getroot().nsmap)
+            self.nsmap = self._nsmaps.get(self["sources"].primary)
             return
         elif kw == "fill" and not deferred:
             return
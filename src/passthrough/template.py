@@ -1,24 +1,61 @@
 import logging
-from collections import defaultdict
+import re
+from collections import defaultdict, namedtuple
 from copy import deepcopy
 from pathlib import Path
-from typing import Dict, Optional, Sequence, Union
+from typing import Dict, List, MutableMapping, Optional, Sequence, Union
 
 from lxml import etree
 
 from . import FILL_TOKEN, PT_NS, __project__
-from .exc import PTEvalError, PTFetchError, PTTemplateError
+from .compiled import CompiledTemplate
+from .exc import (
+    PTError,
+    PTEvalError,
+    PTFetchError,
+    PTStateError,
+    PTTemplateError,
+    PTValidationError,
+)
+from .explain import Plan, explain_template
 from .extensions import ExtensionManager
 from .extensions.pt import context
+from .fragments import expand_includes
 from .label_tools import (
     ATTR_PATHS,
+    COMPRESSIONS,
     LabelLike,
+    NsmapCache,
     PathManipulator,
     add_default_ns,
+    compress_label,
+    is_labellike,
     is_populated,
+    label_digest,
     labellike_to_etree,
+    parse_label,
 )
+from .loaders import prefetch
+from .profiling import MemoryProfile, phase
+from .sinks import ArchiveSink
 from .state import PTState, SourceGroup
+from .validation import LabelValidator
+
+# The outcome of `Template.export`
+ExportResult = namedtuple("ExportResult", ("path", "written", "digest"))
+# An error recorded in collect-errors mode: the name of its exception class, its
+# message, and the local name and source line of the template element it arose from
+ErrorRecord = namedtuple("ErrorRecord", ("type", "message", "tag", "sourceline"))
+
+# Provenance records of incremental mode: a fetch from a source (with the template
+# attributes of the element if it is a leaf), a fill (with the element's text prior to
+# it), and the evaluated value of a PT property which affects the label structure
+_FetchRecord = namedtuple("_FetchRecord", ("state", "path", "count", "attrib"))
+_FillRecord = namedtuple("_FillRecord", ("state", "text"))
+_EvalRecord = namedtuple("_EvalRecord", ("state", "kw", "val"))
+
+# A call of a prefixed (i.e. extension) XPath function
+_FUNCTION_CALL = re.compile(r"([A-Za-z_][\w.-]*):([A-Za-z_][\w.-]*)\s*\(")
 
 
 class Template:
@@ -28,23 +65,47 @@ class Template:
     For convenience, the document `root` is also exposed, together with its `nsmap`
     (the namespace prefix->uri dictionary of the partial label).
 
+    Source products are only retained for as long as they can still be queried: once
+    pre-processing is complete, only those referenced by pending deferred `pt:fill`s
+    and `pt:required`s are kept, and these are in turn released as `export` evaluates
+    them. Call `close` (or use the `Template` as a context manager) to release all
+    remaining resources held for export while keeping the `label` around for
+    inspection.
+
+    In incremental mode, the `Template` instead retains its sources and records which
+    source elements and expressions each element of the label was populated from, so
+    that the label can be brought up to date with `refresh` when a source is revised,
+    rather than being rendered anew.
+
+    In collect-errors mode, PT errors don't abort processing: each is recorded in
+    `errors` instead, and processing carries on with the rest of the label, skipping
+    the remainder of the offending element's subtree. A label with errors can't be
+    exported, but `finalize` runs every post-processing step to find all of them, after
+    which `error_report` summarises them.
+
     Attributes:
         label lxml.etree._ElementTree: The partial label represented as an lxml element
             tree, which allows access to its classes and attributes via the XML DOM.
         root lxml.etree._Element: The partial label's root element (e.g.
             `Product_Observational`)
         nsmap dict: The partial label's namespace map
+        errors List[PTError]: The errors recorded in collect-errors mode.
+        memory_profile Optional[MemoryProfile]: The allocations of each processing
+            phase, if `profile_memory` is enabled.
     """
 
     def __init__(
         self,
-        template: LabelLike,
+        template: Union[LabelLike, CompiledTemplate],
         source_map: Dict[str, Union[LabelLike, Sequence[LabelLike]]],
         context_map: Optional[dict] = None,
         template_source_entry: bool = True,
         keep_template_comments: bool = False,
         skip_structure_check: bool = False,
         quiet: Union[bool, int] = False,
+        incremental: bool = False,
+        collect_errors: bool = False,
+        profile_memory: bool = False,
     ):
         """Instantiate a partial label from the provided type template.
 
@@ -53,11 +114,13 @@ class Template:
 
         Args:
             template: `LabelLike` representation of the output product's type template
-                (e.g. a string path to an XML file).
+                (e.g. a string path to an XML file), or a `CompiledTemplate` thereof.
+                XInclude fragments are expanded (see `passthrough.fragments`).
             source_map: A dictionary which maps string monikers used by the `pt:sources`
                 property, to `LabelLike` source products. A single moniker can map to a
                 single product or a list of products, and products can be referenced by
-                multiple monikers. For instance:
+                multiple monikers. Products given as paths or URLs (see
+                `passthrough.loaders`) are loaded concurrently. For instance:
                 ```python
                     {
                         "input": "input.xml",
@@ -71,11 +134,15 @@ class Template:
             context_map: If called for by the template, a dictionary of key-value pairs
                 which can be looked up using the `pt:context()` XPath extension
                 function, for instance to automatically populate history entries with
-                the processor's ID and version using the `pt:fill` property.
+                the processor's ID and version using the `pt:fill` property. Values
+                which are expensive to compute can be given as callables (or
+                `ContextProvider`s), which are only called once a template looks them
+                up, and whose results are reused for the rest of the render (or batch).
             template_source_entry: Add a "template"->`template` mapping to `source_map`.
                 Convenience option for self-referencing templates.
             keep_template_comments: If enabled, propagate XML comments from `template`
-                to the exported output product.
+                to the exported output product. Ignored for a `CompiledTemplate`, which
+                records this choice at compile time.
             skip_structure_check: If enabled, share a few milliseconds off the export
                 process (and some kilobytes of memory) by not sanity-checking the
                 structure of the partial label to that of the original `template`.
@@ -83,6 +150,12 @@ class Template:
                 from propagating up the hierarchy. Alternatively, a numeric log level
                 can be provided, which will be forwarded directly to the `Template`
                 logger.
+            incremental: If enabled, record the provenance of the label's elements to
+                allow updating them with `refresh`.
+            collect_errors: If enabled, record PT errors in `errors` rather than
+                raising them.
+            profile_memory: If enabled, profile the allocations of each processing
+                phase into `memory_profile` (see `passthrough.profiling`).
         """
 
         log_level = (
@@ -93,99 +166,525 @@ class Template:
         logging.getLogger(__project__).setLevel(log_level)
         self._log = logging.getLogger(".".join([__project__, self.__class__.__name__]))
 
-        self._sources = self._source_map_to_etree_map(source_map)
-        try:
-            self.label = labellike_to_etree(template)
-        except TypeError as e:
-            raise TypeError(f"template is in an {e}") from None
-        if template_source_entry:
-            if "template" in self._sources:
-                raise KeyError(
-                    "source map already contains a mapping for the key 'template'"
-                )
-            self._sources["template"] = self.label
+        self.memory_profile = MemoryProfile() if profile_memory else None
+        with phase(self.memory_profile, "parse"):
+            self._sources = self._source_map_to_etree_map(source_map)
+            if isinstance(template, CompiledTemplate):
+                self.label = template.to_etree()
+                extensions = template.load_extensions()
+                keep_template_comments = True  # already stripped at compile time
+            else:
+                try:
+                    self.label = labellike_to_etree(template)
+                except TypeError as e:
+                    raise TypeError(f"template is in an {e}") from None
+                expand_includes(self.label)
+                extensions = None
+            if template_source_entry:
+                if "template" in self._sources:
+                    raise KeyError(
+                        "source map already contains a mapping for the key 'template'"
+                    )
+                self._sources["template"] = self.label
 
-        if not keep_template_comments:
-            etree.strip_elements(self.label, etree.Comment, with_tail=False)
+            if not keep_template_comments:
+                etree.strip_elements(self.label, etree.Comment, with_tail=False)
+        if self.memory_profile is not None:
+            self._record_tree_sizes()
 
         self.root = self.label.getroot()
         self.nsmap = add_default_ns(self.root.nsmap)
 
-        context.set_context_map(context_map)
-        self._ext = ExtensionManager()
+        self._context_map = context_map
+        # the values of render-scoped context providers, once computed
+        self._context_cache = {}
+        context.set_context_map(context_map, self._context_cache)
+        # normalised namespace maps of the sources, shared by states and extensions
+        self._nsmaps = NsmapCache()
+        self._ext = ExtensionManager(extensions, self._nsmaps)
 
         self._reorder = []
         self._deferred_fills = []
         self._deferred_reqs = []
+        # provenance records for incremental mode
+        self._incremental = incremental
+        self._fetches: List[_FetchRecord] = []
+        self._fills: List[_FillRecord] = []
+        self._evaluations: List[_EvalRecord] = []
+        self._collect_errors = collect_errors
+        self.errors: List[PTError] = []
+        self._failed: List[etree._Element] = []  # the elements errors arose from
 
-        self._process_elem(
-            PTState(parent=None, t_elem=None, source_map=self._sources), self.root
-        )
-        self._reorder_children()
+        with phase(self.memory_profile, "traverse"):
+            self._process_elem(
+                PTState(
+                    parent=None,
+                    t_elem=None,
+                    source_map=self._sources,
+                    nsmaps=self._nsmaps,
+                ),
+                self.root,
+            )
+            self._ext.flush()
+            self._reorder_children()
+        if not incremental:
+            # From here on, sources are only reachable via the pending deferred states
+            # (which carry their own namespace maps)
+            self._sources.clear()
+            self._nsmaps.clear()
+
+        self._label_pre_handoff = None
+        if not skip_structure_check:
+            with phase(self.memory_profile, "snapshot"):
+                self._label_pre_handoff = deepcopy(self.label)
+            if self.memory_profile is not None:
+                self.memory_profile.record_tree("snapshot", self._label_pre_handoff)
+        self._closed = False
+
+    @staticmethod
+    def explain(
+        template: Union[LabelLike, CompiledTemplate],
+        source_map: Optional[Dict[str, Union[LabelLike, Sequence[LabelLike]]]] = None,
+        template_source_entry: bool = True,
+    ) -> Plan:
+        """Report how `template` would be processed, without rendering it.
+
+        See `passthrough.explain` for the contents of the report.
+
+        Args:
+            template: As for `Template`.
+            source_map: Sample sources to estimate the number of instances of each
+                element from, as for `Template`.
+            template_source_entry: As for `Template`.
+        """
+        return explain_template(template, source_map, template_source_entry)
+
+    def __enter__(self):
+        return self
 
-        self._label_pre_handoff = None if skip_structure_check else deepcopy(self.label)
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """Release the sources and other resources held for export.
+
+        The partial label remains available through the `label` attribute, but the
+        `Template` can no longer be exported. Closing a `Template` more than once is
+        allowed.
+        """
+        self._sources.clear()
+        self._reorder = []
+        self._deferred_fills = []
+        self._deferred_reqs = []
+        self._fetches = []
+        self._fills = []
+        self._evaluations = []
+        self._label_pre_handoff = None
+        self._nsmaps.clear()
+        self._context_cache.clear()
+        self._ext.set_elem_context(None)
+        self._ext.deactivate()
+        self._closed = True
 
     def export(
-        self, directory: Union[Path, str], filename: Optional[str] = None
-    ) -> None:
+        self,
+        directory: Union[Path, str, ArchiveSink],
+        filename: Optional[str] = None,
+        skip_unchanged: bool = False,
+        manifest: Optional[MutableMapping[str, str]] = None,
+        mask: Sequence[str] = (),
+        validator: Optional[LabelValidator] = None,
+        compression: Optional[str] = None,
+        compresslevel: Optional[int] = None,
+    ) -> ExportResult:
         """Export the partial label to the filesystem.
 
         Run the partial label through a series of post-processing steps before exporting
         the completed label to `filename` in `directory.
 
+        If `directory` is an `ArchiveSink`, the label is instead queued to be written to
+        the sink's archive as a member called `filename`.
+
         If `filename` is not provided, the product ID part of the post-processed label's
         logical identifier (LID) will be used. Please note that this behaviour is
         likely to change in an upcoming release!
 
+        Sources and other resources only needed for post-processing are released as
+        soon as they have served their purpose; subsequent exports of the same
+        `Template` therefore skip the structure check.
+
+        When reprocessing products, most labels are often identical to those exported
+        previously. With `skip_unchanged` enabled, the digest of the canonical (C14N)
+        form of the completed label is compared to that of the existing output file
+        (or, if provided, the digest recorded for it in `manifest`; required when
+        exporting to an `ArchiveSink`), and the label is only written if they differ.
+        Elements filled by volatile extension functions (e.g. `pt:datetime.now()`) are
+        disregarded in the comparison, as are any elements selected by `mask`.
+
+        With `compression` set, the label is written compressed, and the format's
+        extension (e.g. `.gz`) appended to its filename unless already present.
+        Labels are compared (and their digests computed) in uncompressed form.
+
         Args:
-            directory: Path to the desired output directory.
+            directory: Path to the desired output directory, or an `ArchiveSink`.
             filename: Filename override to use for the output label.
+            skip_unchanged: If enabled, don't write the label if its content is
+                unchanged from the existing output file.
+            manifest: A mutable mapping of output paths to label digests, which is
+                consulted in place of the existing output file when `skip_unchanged`
+                is enabled, and updated with the digest of each written label.
+            mask: XPath expressions (in terms of the label's `nsmap`) selecting
+                elements whose text should be disregarded when comparing labels.
+            validator: If provided, validate the completed label in memory before it
+                is written.
+            compression: If provided, the format to compress the label with; one of
+                "gz", "xz" or "bz2".
+            compresslevel: The compression level (see `label_tools.compress_label`).
+
+        Returns:
+            An `ExportResult` with the output path (for an `ArchiveSink`, the archive
+            path joined with the member name), whether the label was written, and its
+            digest (if `skip_unchanged` or `manifest` were used).
+
+        Raises:
+            ValueError: if the `Template` has been closed, if `skip_unchanged` is
+                used with an `ArchiveSink` but without a `manifest`, or if
+                `compression` is not supported.
+            PTValidationError: if the completed label fails validation.
+            PTTemplateError: if errors were recorded in collect-errors mode.
         """
-        self._eval_deferred_fills()
-        self._prune_empty_optionals()
-        self._ensure_populated()
-        self._check_structure()
-        etree.cleanup_namespaces(self.label)
+        if self._closed:
+            raise ValueError("cannot export a closed Template")
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(
+                f"unsupported compression '{compression}', expected one of"
+                f" {list(COMPRESSIONS)}"
+            )
+        sink = directory if isinstance(directory, ArchiveSink) else None
+        if sink is not None and skip_unchanged and manifest is None:
+            raise ValueError("skip_unchanged requires a manifest for an ArchiveSink")
+        self.finalize(validator)
+        if self.errors:
+            raise PTTemplateError(
+                f"the label has {len(self.errors)} errors (see Template.errors)"
+            )
         if filename is None:
             lid = self.label.xpath(ATTR_PATHS["lid"], namespaces=self.nsmap)[0].text
             filename = f"{lid.split(':')[-1].strip()}.xml"  # ExoMars/PSA specific
-        if not isinstance(directory, Path):
+        if compression is not None and not filename.endswith(f".{compression}"):
+            filename = f"{filename}.{compression}"
+        if sink is not None:
+            directory = sink.path
+        elif not isinstance(directory, Path):
             directory = Path(directory)
-        directory.mkdir(parents=True, exist_ok=True)
-        self.label.write(
-            str(directory / filename),
-            encoding="UTF-8",
-            pretty_print=True,
-            xml_declaration=True,
-        )
+        path = directory / filename
+        with phase(self.memory_profile, "export"):
+            data = etree.tostring(
+                self.label, encoding="UTF-8", pretty_print=True, xml_declaration=True
+            )
 
-    def _source_map_to_etree_map(
-        self, smap: Dict[str, Union[LabelLike, Sequence[LabelLike]]]
-    ):
-        cache = {}
-        for key in smap:
-            if key in cache:
-                smap[key] = cache[key]
+            digest = None
+            if skip_unchanged or manifest is not None:
+                mask_paths = self._mask_paths(mask)
+                digest = label_digest(data, mask_paths)
+                if skip_unchanged:
+                    if manifest is not None:
+                        previous = manifest.get(str(path))
+                    elif path.is_file():
+                        previous = label_digest(parse_label(path), mask_paths)
+                    else:
+                        previous = None
+                    if previous == digest:
+                        self._log.info(f"Skipping unchanged {path}")
+                        return ExportResult(path, False, digest)
+
+            if compression is not None:
+                data = compress_label(data, compression, compresslevel)
+            if sink is not None:
+                sink.add(filename, data)
             else:
+                directory.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(data)
+            if manifest is not None:
+                manifest[str(path)] = digest
+            return ExportResult(path, True, digest)
+
+    def finalize(
+        self, validator: Optional[LabelValidator] = None
+    ) -> etree._ElementTree:
+        """Run the partial label through the post-processing steps of `export`.
+
+        This completes the label without writing it anywhere, for clients that wish to
+        handle its serialisation themselves. In collect-errors mode, the (possibly
+        incomplete) label is returned even if errors were recorded.
+
+        Args:
+            validator: If provided, validate the completed label.
+
+        Returns:
+            The completed label (i.e. the `label` attribute).
+
+        Raises:
+            ValueError: if the `Template` has been closed.
+            PTValidationError: if the completed label fails validation.
+        """
+        if self._closed:
+            raise ValueError("cannot finalize a closed Template")
+        self._activate()
+        with phase(self.memory_profile, "deferred"):
+            self._eval_deferred_fills()
+            self._prune_empty_optionals()
+        with phase(self.memory_profile, "checks"):
+            self._ensure_populated()
+            try:
+                self._check_structure()
+            except PTTemplateError as e:
+                if not self._collect_errors:
+                    raise
+                self._record_error(e)
+            self._label_pre_handoff = None
+            if not self._incremental:
+                self._nsmaps.clear()  # no more queries against the sources
+            etree.cleanup_namespaces(self.label)
+            if validator is not None:
                 try:
-                    if isinstance(
-                        smap[key], LabelLike.__args__
-                    ):  # FIXME: __args__ is undocumented (= not reliable)
-                        smap[key] = cache[key] = labellike_to_etree(smap[key])
-                    else:
-                        smap[key] = cache[key] = [
-                            labellike_to_etree(ll) for ll in smap[key]
-                        ]
-                except TypeError as e:
-                    raise TypeError(f"source map key {key} maps to an {e}") from None
-        return smap
+                    validator.validate(self.label)
+                except PTValidationError as e:
+                    if not self._collect_errors:
+                        raise
+                    self._record_error(e)
+        if self.memory_profile is not None:
+            self.memory_profile.record_tree("label", self.label)
+        return self.label
+
+    def refresh(
+        self, source_map: Dict[str, Union[LabelLike, Sequence[LabelLike]]]
+    ) -> List[etree._Element]:
+        """Bring the label up to date with revised versions of some of its sources.
+
+        Only the elements fetched from, or filled using, the revised sources (as well as
+        those filled using the template itself or context-dependent extension
+        functions) are re-evaluated. Deferred `pt:fill`s and `pt:required`s which are
+        yet to be evaluated will use the revised sources when the label is exported.
+        All references to a revised source, including from other source groups, are
+        updated.
+
+        Args:
+            source_map: A dictionary mapping monikers of the original `source_map` to
+                the revised `LabelLike` source products. A moniker which mapped to a
+                source group must map to a group of the same size.
+
+        Returns:
+            The elements of the label whose content changed.
+
+        Raises:
+            ValueError: if the `Template` is closed or not in incremental mode.
+            KeyError: if a moniker is not part of the original source map.
+            PTStateError: if the revisions would alter the structure of the label
+                (e.g. a fetched element has appeared or disappeared, or a PT property
+                evaluates differently), in which case the label must be rendered anew.
+        """
+        if self._closed or not self._incremental:
+            raise ValueError("only an open, incremental Template can be refreshed")
+        self._activate()
+        replacements = {}
+        replaced = []
+        for key, revised in self._source_map_to_etree_map(source_map).items():
+            try:
+                group = self._sources[key]
+            except KeyError:
+                raise KeyError(
+                    f"source map has no mapping for the key '{key}'"
+                ) from None
+            old = (group.primary, *group.secondary)
+            if self.label in old:
+                raise ValueError("the template source cannot be refreshed")
+            new = SourceGroup(revised)
+            new = (new.primary, *new.secondary)
+            if len(old) != len(new):
+                raise PTStateError(
+                    f"source group {key} has {len(new)} members instead of {len(old)}"
+                )
+            replacements.update((id(o), n) for o, n in zip(old, new) if o is not n)
+            replaced.extend(o for o, n in zip(old, new) if o is not n)
+        if not len(replacements):
+            return []
+
+        # repoint every source group (shared by states, or not) at the revised sources
+        states = [
+            *(r.state for r in self._fetches),
+            *(r.state for r in self._fills),
+            *(r.state for r in self._evaluations),
+            *self._deferred_fills,
+            *self._deferred_reqs,
+        ]
+        groups = {id(self._sources[k]): self._sources[k] for k in self._sources}
+        groups.update((id(state["sources"]), state["sources"]) for state in states)
+        originals = [(g, g.primary, g.secondary) for g in groups.values()]
+        for group in groups.values():
+            group.primary = replacements.get(id(group.primary), group.primary)
+            group.secondary = [replacements.get(id(s), s) for s in group.secondary]
+        revised = {id(tree) for tree in replacements.values()}
+
+        def is_revised(state: PTState) -> bool:
+            return id(state["sources"].primary) in revised
+
+        # check that the structure is unaffected before modifying anything, and leave
+        # the Template as it was if it isn't
+        nsmaps = [(state, state.nsmap) for state in states if is_revised(state)]
+        try:
+            for state, _ in nsmaps:
+                state.nsmap = self._nsmaps.get(state["sources"].primary)
+            for state, kw, val in self._evaluations:
+                if not is_revised(state):
+                    continue
+                self._ext.set_elem_context(state.t_elem)
+                if state.eval_deferred(kw) != val:
+                    raise PTStateError(
+                        f"{PT_NS['prefix']}:{kw} evaluates differently for the"
+                        " revised source",
+                        state.t_elem,
+                    )
+            patches = []
+            for record in self._fetches:
+                if not is_revised(record.state):
+                    continue
+                s_elems = record.state["sources"].primary.findall(record.path)
+                if len(s_elems) != record.count:
+                    raise PTStateError(
+                        f"{len(s_elems)} source elements found at path {record.path}"
+                        f" in the revised source instead of {record.count}",
+                        record.state.t_elem,
+                    )
+                if record.attrib is not None:
+                    patches.append((record, s_elems[0]))
+        except Exception:
+            for group, primary, secondary in originals:
+                group.primary, group.secondary = primary, secondary
+            for state, nsmap in nsmaps:
+                state.nsmap = nsmap
+            for state, kw, val in self._evaluations:
+                state[kw] = val
+            raise
+        for tree in replaced:
+            self._nsmaps.discard(tree)
+
+        changed = {}
+        for record, s_elem in patches:
+            elem = record.state.t_elem
+            attrib = {**record.attrib, **s_elem.attrib}
+            if elem.text != s_elem.text or dict(elem.attrib) != attrib:
+                elem.attrib.clear()
+                elem.attrib.update(attrib)
+                elem.text = s_elem.text
+                changed[id(elem)] = elem
+        refilled = []
+        for state, text in self._fills:
+            elem = state.t_elem
+            if elem.getroottree().getroot() is not self.root:
+                continue  # pruned
+            source = state["sources"].primary
+            if not (
+                is_revised(state)
+                or source is self.label
+                or not self._is_elem_independent(state.exp["fill"])
+            ):
+                continue
+            state.nsmap = self._nsmaps.get(source)
+            self._ext.set_elem_context(elem)
+            refilled.append((elem, elem.text))
+            elem.text = text
+            self._handle_fill(elem, self._eval_fill(state))
+        # the text of a fill making batched calls holds placeholders until they are
+        # flushed, so only compare it to the previous text once it is final
+        self._ext.flush()
+        for elem, old_text in refilled:
+            if elem.text != old_text:
+                changed[id(elem)] = elem
+        return list(changed.values())
+
+    def _activate(self):
+        # the context map and extension manager in effect are per thread, and may have
+        # been replaced (by other Templates) since the label was pre-processed
+        context.set_context_map(self._context_map, self._context_cache)
+        self._ext.activate()
+
+    def _mask_paths(self, mask: Sequence[str]) -> List[str]:
+        # disregard volatile elements which have since been pruned from the label
+        elems = [
+            e
+            for e in self._ext.volatile_elems
+            if e.getroottree().getroot() is self.root
+        ]
+        for exp in mask:
+            result = self.label.xpath(exp, namespaces=self.nsmap)
+            if not isinstance(result, list):
+                raise ValueError(f"mask expression '{exp}' did not yield a node-set")
+            elems.extend(e for e in result if isinstance(e, etree._Element))
+        return [self.label.getelementpath(e) for e in elems]
+
+    @staticmethod
+    def _source_map_to_etree_map(
+        smap: Dict[str, Union[LabelLike, Sequence[LabelLike]]]
+    ):
+        # load the sources from disk or the network concurrently up front
+        labellikes = []
+        for val in smap.values():
+            if is_labellike(val):
+                labellikes.append(val)
+            elif isinstance(val, Sequence):
+                labellikes.extend(val)
+        loaded = prefetch(labellikes)
+
+        def to_etree(ll):
+            if isinstance(ll, (Path, str)):
+                return loaded[ll]
+            return labellike_to_etree(ll, cache=True)
+
+        # build a new map rather than converting in place, as the caller's map (and
+        # the source trees within it) may be shared with other Template instances
+        etree_map = {}
+        for key, val in smap.items():
+            try:
+                if is_labellike(val):
+                    etree_map[key] = to_etree(val)
+                else:
+                    trees = []
+                    for ll in val:
+                        tree = to_etree(ll)
+                        if any(tree is t for t in trees):
+                            # a label listed twice is loaded once, but the members
+                            # of a source group must be distinct trees
+                            tree = deepcopy(tree)
+                        trees.append(tree)
+                    etree_map[key] = trees
+            except TypeError as e:
+                raise TypeError(f"source map key {key} maps to an {e}") from None
+        return etree_map
 
     def _process_elem(self, parent_state: PTState, t_elem: etree._Element):
         if isinstance(t_elem, etree._Comment):
             return
+        try:
+            self._populate_elem(parent_state, t_elem)
+        except PTError as e:
+            if not self._collect_errors:
+                raise
+            self._record_error(e, t_elem)
+
+    def _populate_elem(self, parent_state: PTState, t_elem: etree._Element):
         self._ext.set_elem_context(t_elem)
         qname = etree.QName(t_elem.tag)
         state = PTState(parent_state, t_elem)
+        if self._incremental:
+            # non-fetch requireds are only evaluated at export, and recorded then
+            self._evaluations.extend(
+                _EvalRecord(state, kw, state[kw])
+                for kw, exp in state.exp.items()
+                if exp is not None
+                and kw not in ("sources", "fill")
+                and not (kw == "required" and not state["fetch"])
+            )
 
         if state["reorder"]:
             self._reorder.append(state)
@@ -215,6 +714,7 @@ class Template:
                     t_elem if source is state["sources"].primary else deepcopy(t_elem)
                 )
                 state["sources"] = SourceGroup(source)
+                state.nsmap = self._nsmaps.get(source)
                 parent.insert(idx, elem)
                 self._process_elem(state, elem)
             return
@@ -222,6 +722,15 @@ class Template:
         if state["fetch"]:
             path = self.label.getelementpath(t_elem)
             s_elems = state["sources"].primary.findall(path)
+            if self._incremental:
+                attrib = None
+                if len(s_elems) == 1 and not len(t_elem):
+                    attrib = {
+                        attr: val
+                        for attr, val in t_elem.items()
+                        if etree.QName(attr).namespace != PT_NS["uri"]
+                    }
+                self._fetches.append(_FetchRecord(state, path, len(s_elems), attrib))
             if len(s_elems) > 1:
                 if state["multi"] is not True and len(s_elems) != state["multi"]:
                     raise PTFetchError(
@@ -262,10 +771,44 @@ class Template:
             if state["defer"]:
                 self._deferred_fills.append(state)
             else:
-                self._handle_fill(state.t_elem, state.eval_deferred("fill"))
+                self._apply_fill(state, self._eval_fill(state))
 
         state.remove_elem_pt_attrs()
 
+    def _record_tree_sizes(self):
+        self.memory_profile.record_tree("template", self.label)
+        for key, val in self._sources.items():
+            if key == "template" and val is self.label:
+                continue
+            if isinstance(val, etree._ElementTree):
+                self.memory_profile.record_tree(f"source:{key}", val)
+            else:
+                for idx, tree in enumerate(val):
+                    self.memory_profile.record_tree(f"source:{key}[{idx}]", tree)
+
+    def _record_error(self, error: PTError, t_elem: Optional[etree._Element] = None):
+        if error.tag is None and t_elem is not None:
+            error.tag = etree.QName(t_elem.tag).localname
+            error.sourceline = t_elem.sourceline
+        self.errors.append(error)
+        if t_elem is not None:
+            # leave the rest of the subtree unprocessed, but rid it of PT attributes
+            self._failed.append(t_elem)
+            pt_attr = self._pt_clark("")
+            for elem in t_elem.iter("*"):
+                for attr in [a for a in elem.attrib if a.startswith(pt_attr)]:
+                    del elem.attrib[attr]
+
+    def error_report(self) -> List[ErrorRecord]:
+        """Return the errors recorded in collect-errors mode, in template order."""
+        return sorted(
+            (
+                ErrorRecord(e.__class__.__name__, e.message, e.tag, e.sourceline)
+                for e in self.errors
+            ),
+            key=lambda r: (r.sourceline is None, r.sourceline or 0),
+        )
+
     def _process_multi_branch(self, elem, parent_state, num_copies):
         # prevent multi expectation on sibling passes
         del elem.attrib[self._pt_clark("multi")]
@@ -283,10 +826,62 @@ class Template:
         parent_state["multi_branch"] = pmb
 
     def _eval_deferred_fills(self):
-        for state in self._deferred_fills:
+        # Deferred fills sharing an expression, source and multi branch yield the same
+        # result unless the expression calls an extension function that may depend on
+        # the element being filled, so each such group is only evaluated once. Results
+        # computed from the template source are never reused, as the template itself
+        # is modified by each fill.
+        shareable: Dict[str, bool] = {}
+        shared = {}
+        # consume the states as we go to release their sources as early as possible
+        self._deferred_fills.reverse()
+        while self._deferred_fills:
+            state = self._deferred_fills.pop()
             self._ext.set_elem_context(state.t_elem)
-            self._handle_fill(state.t_elem, state.eval_deferred("fill"))
-        self._deferred_fills = []
+            exp = state.exp["fill"]
+            if exp not in shareable:
+                shareable[exp] = self._is_elem_independent(exp)
+            source = state["sources"].primary
+            try:
+                if not shareable[exp] or source is self.label:
+                    val = self._eval_fill(state)
+                else:
+                    key = (exp, id(source), state["multi_branch"])
+                    if key not in shared:
+                        shared[key] = self._eval_fill(state)
+                    val = shared[key]
+                self._apply_fill(state, val)
+            except PTError as e:
+                if not self._collect_errors:
+                    raise
+                self._record_error(e, state.t_elem)
+        self._ext.flush()
+
+    def _apply_fill(self, state: PTState, val: Union[str, list]):
+        if self._incremental:
+            self._fills.append(_FillRecord(state, state.t_elem.text))
+        self._handle_fill(state.t_elem, val)
+
+    def _is_elem_independent(self, exp: str) -> bool:
+        # Every source query is evaluated against the root of its source, so only
+        # extension functions (other than pure ones) can observe the current element
+        return all(
+            f"{prefix}:{name}" in self._ext.pure_functions
+            for prefix, name in _FUNCTION_CALL.findall(exp)
+        )
+
+    def _eval_fill(self, state: PTState) -> Union[str, list]:
+        # calls to batched extension functions are only deferred while filling, as
+        # their placeholder results are only meaningful as element text. A fill reading
+        # the template could copy the placeholders of other elements, so those are
+        # substituted first
+        if state["sources"].primary is self.label:
+            self._ext.flush()
+        self._ext.batching = True
+        try:
+            return state.eval_deferred("fill")
+        finally:
+            self._ext.batching = False
 
     @staticmethod
     def _handle_fill(elem: etree._Element, val: Union[str, list]):
@@ -323,6 +918,8 @@ class Template:
         for state in self._reorder:
             t_elem = state.t_elem
             s_elem = state["sources"].primary.find(self.label.getelementpath(t_elem))
+            if s_elem is None:
+                continue  # its fetch failed (and was recorded, in collect-errors mode)
             tags = defaultdict(list)
             order = []
             # group t_elem's children by tag, where a child's index within its tag group
@@ -347,13 +944,24 @@ class Template:
 
             # Sort t_elem's children in-place using the derived element order
             t_elem[:] = sorted(t_elem, key=lambda e: order.index(e))
+        self._reorder = []
 
     def _prune_empty_optionals(self):
         # evaluate requireds inside-out to allow nested statements
-        # (e.g. for optional class with optional children)
-        for state in reversed(self._deferred_reqs):
+        # (e.g. for optional class with optional children), consuming the states as we
+        # go to release their sources as early as possible
+        while self._deferred_reqs:
+            state = self._deferred_reqs.pop()
             self._ext.set_elem_context(state.t_elem)
-            required = state.eval_deferred("required")
+            try:
+                required = state.eval_deferred("required")
+            except PTError as e:
+                if not self._collect_errors:
+                    raise
+                self._record_error(e, state.t_elem)
+                continue
+            if self._incremental:
+                self._evaluations.append(_EvalRecord(state, "required", required))
             if not required:
                 pop = empty = False
                 # .iter() includes the t_elem itself (for if it's a leaf node)
@@ -391,16 +999,20 @@ class Template:
                 #         "non-fetch required element contains both populated and"
                 #         " unpopulated children"
                 #     )
-        self._deferred_reqs = []
 
     def _ensure_populated(self):
+        # the subtrees of elements with errors are incomplete as a matter of course
+        failed = {elem for f in self._failed for elem in f.iter("*")}
         for child in self.root.iter("*"):
-            if len(child):
+            if len(child) or child in failed:
                 continue
             if not is_populated(child):
-                raise PTTemplateError(
+                error = PTTemplateError(
                     f"unpopulated leaf node encountered at export", child
                 )
+                if not self._collect_errors:
+                    raise error
+                self._record_error(error, child)
 
     def _check_structure(self):
         if self._label_pre_handoff is None:
@@ -0,0 +1,171 @@
+"""In-memory label validation against XML Schema and Schematron
+
+A `LabelValidator` validates a completed label against the schemas referenced by its
+`xsi:schemaLocation` attribute (and, optionally, the Schematron rules referenced by its
+`xml-model` processing instructions), using local copies of the schema files. Compiled
+schemas are cached process-wide, keyed on the resolved schema files and their
+modification times, so each process only compiles a given set of schemas once.
+"""
+
+__all__ = [
+    "LabelValidator",
+    "clear_schema_cache",
+]
+
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from lxml import etree
+
+from .exc import PTValidationError
+
+XSI_URI = "http://www.w3.org/2001/XMLSchema-instance"
+XSD_URI = "http://www.w3.org/2001/XMLSchema"
+SCHEMATRON_URI = "http://purl.oclc.org/dsdl/schematron"
+
+# Compiled validators (together with a lock serialising their use), keyed on the
+# (namespace, path, mtime) tuples of the schema files they were compiled from
+_cache: Dict[Tuple, Tuple[object, threading.Lock]] = {}
+_cache_lock = threading.Lock()
+
+
+def clear_schema_cache() -> None:
+    """Discard all compiled schemas."""
+    with _cache_lock:
+        _cache.clear()
+
+
+class LabelValidator:
+    """Validate labels against local copies of the schemas they reference."""
+
+    def __init__(
+        self,
+        schema_dirs: Sequence[Union[Path, str]] = (),
+        schematron: bool = False,
+        strict: bool = True,
+        max_errors: int = 10,
+    ):
+        """Configure how schema locations are resolved and which checks are run.
+
+        A schema location is resolved to a local file if it is a path to an existing
+        file (relative paths being resolved against the label's own location), or
+        otherwise if a file with the same name is present in one of `schema_dirs`.
+
+        Args:
+            schema_dirs: Directories containing local copies of the schemas (e.g. the
+                PDS4 common and discipline dictionaries, and mission schemas).
+            schematron: If enabled, also validate against the Schematron rules
+                referenced by the label's `xml-model` processing instructions.
+            strict: If enabled, fail validation when a referenced schema cannot be
+                resolved to a local file; otherwise such schemas are skipped.
+            max_errors: The maximum number of validation errors to report.
+        """
+        self.schema_dirs = [Path(d).expanduser() for d in schema_dirs]
+        self.schematron = schematron
+        self.strict = strict
+        self.max_errors = max_errors
+
+    def validate(self, label: etree._ElementTree) -> None:
+        """Validate `label`.
+
+        Raises:
+            PTValidationError: if `label` is invalid, or (if `strict`) references a
+                schema which cannot be resolved.
+        """
+        root = label.getroot()
+        base = label.docinfo.URL
+        locations = root.get(f"{{{XSI_URI}}}schemaLocation", "").split()
+        schemas = []
+        for ns, location in zip(locations[::2], locations[1::2]):
+            path = self._resolve(location, base)
+            if path is not None:
+                schemas.append((ns, path))
+        if len(schemas):
+            self._check(self._xml_schema(schemas), label, "XML Schema")
+
+        if self.schematron:
+            for href in self._schematron_hrefs(label):
+                path = self._resolve(href, base)
+                if path is not None:
+                    self._check(
+                        self._schematron(path), label, f"Schematron {path.name}"
+                    )
+
+    def _resolve(self, location: str, base: Optional[str]) -> Optional[Path]:
+        if location.startswith("file://"):
+            location = location[len("file://") :]
+        candidate = Path(location)
+        if "://" not in location:
+            if not candidate.is_absolute() and base is not None:
+                candidate = Path(base).parent / candidate
+            if candidate.is_file():
+                return candidate.resolve()
+        for directory in self.schema_dirs:
+            path = directory / candidate.name
+            if path.is_file():
+                return path.resolve()
+        if self.strict:
+            raise PTValidationError(f"no local copy of schema {location} found")
+        return None
+
+    @staticmethod
+    def _schematron_hrefs(label: etree._ElementTree) -> List[str]:
+        hrefs = []
+        for node in label.getroot().itersiblings(preceding=True):
+            if isinstance(node, etree._ProcessingInstruction) and (
+                node.target == "xml-model"
+            ):
+                attrib = node.attrib
+                if attrib.get("schematypens") == SCHEMATRON_URI and "href" in attrib:
+                    hrefs.append(attrib["href"])
+        return list(reversed(hrefs))  # preceding siblings are iterated in reverse
+
+    @staticmethod
+    def _xml_schema(schemas: List[Tuple[str, Path]]):
+        key = tuple((ns, str(path), path.stat().st_mtime) for ns, path in schemas)
+        with _cache_lock:
+            if key not in _cache:
+                driver = etree.Element(f"{{{XSD_URI}}}schema", nsmap={"xs": XSD_URI})
+                for ns, path in schemas:
+                    etree.SubElement(
+                        driver,
+                        f"{{{XSD_URI}}}import",
+                        namespace=ns,
+                        schemaLocation=path.as_uri(),
+                    )
+                try:
+                    schema = etree.XMLSchema(driver)
+                except etree.XMLSchemaParseError as e:
+                    raise PTValidationError(f"unable to compile schemas: {e}") from None
+                _cache[key] = (schema, threading.Lock())
+            return _cache[key]
+
+    @staticmethod
+    def _schematron(path: Path):
+        from lxml import isoschematron  # comparatively expensive to import
+
+        key = (("schematron", str(path), path.stat().st_mtime),)
+        with _cache_lock:
+            if key not in _cache:
+                try:
+                    schematron = isoschematron.Schematron(etree.parse(str(path)))
+                except (etree.LxmlError, ValueError) as e:
+                    raise PTValidationError(
+                        f"unable to compile Schematron {path}: {e}"
+                    ) from None
+                _cache[key] = (schematron, threading.Lock())
+            return _cache[key]
+
+    def _check(self, validator, label: etree._ElementTree, kind: str):
+        validator, lock = validator
+        with lock:
+            if validator.validate(label):
+                return
+            errors = list(validator.error_log)
+        msg = [f"label failed {kind} validation:"]
+        for error in errors[: self.max_errors]:
+            msg.append(f"line {error.line}: {error.message}")
+        if len(errors) > self.max_errors:
+            msg.append(f"... and {len(errors) - self.max_errors} more")
+        raise PTValidationError("\n".join(msg))
@@ -0,0 +1,309 @@
+"""Rendering labels for source products as they appear in a directory tree
+
+A `Watcher` polls a directory tree for new or modified source labels, maps each of them
+to a type template using a list of `Rule`s, and renders the resulting labels on a pool
+of long-lived worker processes (see `passthrough.batch`). It is the engine behind the
+`passthrough watch` command.
+
+Rules are usually loaded from a JSON file with `load_rules`, which holds a list of
+objects such as:
+
+```json
+[
+    {
+        "pattern": "**/pan_par_sc_*.xml",
+        "template": "templates/rad.xml",
+        "moniker": "input",
+        "sources": {"flat": "calibration/flatfield.xml"},
+        "context": {"processor": "pancam-rad 1.2"},
+        "output": "rad"
+    }
+]
+```
+
+Only `pattern` and `template` are required; relative paths are resolved against the
+directory of the rules file.
+"""
+
+__all__ = [
+    "Rule",
+    "Watcher",
+    "load_rules",
+]
+
+import fnmatch
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from . import __project__, batch
+
+# A mapping of source labels (by glob `pattern`, relative to the watched directory) to
+# the type `template` to render for them, the `moniker` the source is known by in the
+# template, any additional `sources`, the `context` map, and the `output` subdirectory
+Rule = namedtuple(
+    "Rule", ("pattern", "template", "moniker", "sources", "context", "output")
+)
+
+_RULE_DEFAULTS = {"moniker": "input", "sources": {}, "context": {}, "output": ""}
+
+
+def load_rules(path: Union[Path, str]) -> List[Rule]:
+    """Load a list of `Rule`s from the JSON file at `path`.
+
+    Raises:
+        ValueError: if the file does not hold a valid list of rules.
+    """
+    path = Path(path).expanduser()
+    try:
+        entries = json.loads(path.read_text())
+    except json.JSONDecodeError as e:
+        raise ValueError(f"unable to parse rules file {path}: {e}") from None
+    if not isinstance(entries, list):
+        raise ValueError(f"rules file {path} must hold a list of rules")
+    base = path.resolve().parent
+    rules = []
+    for idx, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"rule {idx} of {path} is not an object")
+        unknown = set(entry) - set(Rule._fields)
+        missing = {"pattern", "template"} - set(entry)
+        if unknown or missing:
+            problem = f"unknown keys {sorted(unknown)}" if unknown else ""
+            if missing:
+                problem += f"{', ' if problem else ''}missing keys {sorted(missing)}"
+            raise ValueError(f"rule {idx} of {path} has {problem}")
+        rule = Rule(**{**_RULE_DEFAULTS, **entry})
+        rules.append(
+            rule._replace(
+                template=str(base / rule.template),
+                sources={
+                    key: (
+                        str(base / val)
+                        if isinstance(val, str)
+                        else [str(base / v) for v in val]
+                    )
+                    for key, val in rule.sources.items()
+                },
+            )
+        )
+    return rules
+
+
+class _Entry:
+    # the tracked state of a source label
+    __slots__ = ("rule", "signature", "changed", "pending")
+
+    def __init__(self, rule: Rule, signature: tuple, changed: float):
+        self.rule = rule
+        self.signature = signature
+        self.changed = changed  # when the current signature was first observed
+        self.pending = True  # whether the current version is yet to be rendered
+
+
+class Watcher:
+    """Render labels for source products appearing in a directory tree.
+
+    Attributes:
+        directory pathlib.Path: The watched directory.
+        stats batch.Stats: Throughput and latency statistics, with latencies measured
+            from when a change to a source label was first observed to when its label
+            was exported.
+    """
+
+    def __init__(
+        self,
+        directory: Union[Path, str],
+        rules: Sequence[Rule],
+        output: Union[Path, str],
+        workers: Optional[int] = None,
+        interval: float = 2.0,
+        debounce: float = 2.0,
+        max_pending: Optional[int] = None,
+        skip_existing: bool = False,
+        stats_interval: float = 60.0,
+    ):
+        """Prepare to watch `directory`.
+
+        Args:
+            directory: The directory tree to watch for source labels.
+            rules: The rules mapping source labels to type templates. The first rule
+                matching a source label's path (relative to `directory`) applies;
+                files matching no rule are ignored.
+            output: The directory to export labels to (or to the `output`
+                subdirectories of their rules).
+            workers: The number of worker processes (by default, one per CPU).
+            interval: Seconds between successive scans of `directory`.
+            debounce: Seconds a source label must remain unmodified before it is
+                rendered, so that labels still being written are not picked up.
+            max_pending: The maximum number of renders queued on or running in the
+                worker pool (by default, four per worker). Further source labels are
+                held back until renders complete.
+            skip_existing: If enabled, ignore source labels present when watching
+                starts, until they are next modified.
+            stats_interval: Seconds between throughput and latency log entries.
+        """
+        self.directory = Path(directory).expanduser()
+        if not self.directory.is_dir():
+            raise NotADirectoryError(f"{self.directory} is not a directory")
+        self.rules = list(rules)
+        self.output = Path(output).expanduser()
+        # the output directories, which aren't scanned if nested in the watched one
+        self._outputs = {self.output.resolve()}
+        self._outputs.update((self.output / r.output).resolve() for r in self.rules)
+        self.workers = workers or os.cpu_count() or 1
+        self.interval = interval
+        self.debounce = debounce
+        self.max_pending = max_pending or 4 * self.workers
+        self.skip_existing = skip_existing
+        self.stats_interval = stats_interval
+        self.stats = batch.Stats()
+        self._log = logging.getLogger(".".join([__project__, "watch"]))
+        self._entries: "OrderedDict[Path, _Entry]" = OrderedDict()
+        # source label -> (render, when the rendered version was first observed)
+        self._in_flight: Dict[Path, Tuple[Future, float]] = {}
+        self._stop = threading.Event()
+
+    def run(self, once: bool = False) -> None:
+        """Watch the directory until `stop` is called.
+
+        Args:
+            once: If enabled, return as soon as every source label found has been
+                rendered instead.
+        """
+        templates = sorted({rule.template for rule in self.rules})
+        self._log.info(
+            f"watching {self.directory} with {self.workers} workers"
+            f" ({len(self.rules)} rules)"
+        )
+        # worker initializers are only supported from Python 3.7
+        warm = (
+            {"initializer": batch.init_worker, "initargs": (templates,)}
+            if sys.version_info >= (3, 7)
+            else {}
+        )
+        with ProcessPoolExecutor(self.workers, **warm) as pool:
+            first = True
+            last_report = time.monotonic()
+            while not self._stop.is_set():
+                self._scan(ignore=first and self.skip_existing)
+                first = False
+                self._reap()
+                self._dispatch(pool)
+                now = time.monotonic()
+                if now - last_report >= self.stats_interval:
+                    self._report()
+                    last_report = now
+                if once and not self._in_flight:
+                    if not any(e.pending for e in self._entries.values()):
+                        break
+                self._stop.wait(self.interval)
+            # let in-flight renders complete, but don't start any more
+            for future, _ in list(self._in_flight.values()):
+                future.exception()
+            self._reap()
+        self._report()
+
+    def stop(self) -> None:
+        """Stop watching once the renders in progress have completed."""
+        self._stop.set()
+
+    def _scan(self, ignore: bool = False):
+        now = time.monotonic()
+        seen = set()
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            dirnames[:] = [
+                d for d in dirnames if Path(dirpath, d).resolve() not in self._outputs
+            ]
+            for filename in filenames:
+                path = Path(dirpath, filename)
+                rule = self._match(path)
+                if rule is None:
+                    continue
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue  # removed since the directory was listed
+                signature = (st.st_mtime_ns, st.st_size)
+                seen.add(path)
+                entry = self._entries.get(path)
+                if entry is None:
+                    entry = self._entries[path] = _Entry(rule, signature, now)
+                    entry.pending = not ignore
+                elif entry.signature != signature:
+                    entry.signature = signature
+                    entry.changed = now
+                    entry.pending = True
+        for path in [p for p in self._entries if p not in seen]:
+            del self._entries[path]
+
+    def _match(self, path: Path) -> Optional[Rule]:
+        rel = path.relative_to(self.directory).as_posix()
+        for rule in self.rules:
+            if fnmatch.fnmatch(rel, rule.pattern) or fnmatch.fnmatch(
+                path.name, rule.pattern
+            ):
+                return rule
+        return None
+
+    def _dispatch(self, pool: ProcessPoolExecutor):
+        now = time.monotonic()
+        for path, entry in self._entries.items():
+            if len(self._in_flight) >= self.max_pending:
+                self._log.debug("worker pool saturated; holding back source labels")
+                return
+            if not entry.pending or path in self._in_flight:
+                continue
+            if now - entry.changed < self.debounce:
+                continue
+            entry.pending = False
+            job = batch.Job(
+                template=entry.rule.template,
+                source_map={entry.rule.moniker: str(path), **entry.rule.sources},
+                context_map=entry.rule.context,
+                output=str(self.output / entry.rule.output),
+                filename=None,
+            )
+            self._in_flight[path] = (pool.submit(batch.render_job, job), entry.changed)
+
+    def _reap(self):
+        now = time.monotonic()
+        for path, (future, changed) in list(self._in_flight.items()):
+            if not future.done():
+                continue
+            del self._in_flight[path]
+            try:
+                result = future.result()
+            except Exception as e:  # e.g. a worker process died
+                result = batch.JobResult(None, None, False, 0.0, repr(e))
+            latency = now - changed
+            self.stats.record(latency, failed=result.error is not None)
+            if result.error is not None:
+                self._log.error(f"failed to render a label for {path}: {result.error}")
+            else:
+                self._log.info(
+                    f"rendered {result.path} from {path} in {result.seconds:.3f}s"
+                    f" (latency {latency:.3f}s)"
+                )
+
+    def _report(self):
+        summary = self.stats.summary(reset=True)
+        pending = sum(e.pending for e in self._entries.values())
+        latency = (
+            f"; latency mean {summary['mean']}s, p95 {summary['p95']}s, max"
+            f" {summary['max']}s"
+            if summary["count"]
+            else ""
+        )
+        self._log.info(
+            f"{summary['count']} labels in {summary['seconds']}s"
+            f" ({summary['rate']}/s, {summary['failed']} failed){latency};"
+            f" {len(self._in_flight)} in flight, {pending} pending"
+        )
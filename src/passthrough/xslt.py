@@ -0,0 +1,472 @@
+"""Experimental: compilation of type templates to XSLT
+
+Much of a typical type template consists of plain `pt:fetch` copying and `pt:fill`
+XPath expressions, which libxslt can evaluate entirely in C. `XSLTTemplate` translates
+the subset of PT semantics it can express into an `etree.XSLT` stylesheet, with
+extension functions bound through lxml's function namespaces as usual.
+
+The compiler supports templates in which:
+
+- `pt:fetch`, `pt:multi`, `pt:required`, `pt:defer` and `pt:reorder` are literal
+  `true()`/`false()` expressions, with `pt:multi="true()"` only in a `pt:fetch`
+  context and no `pt:defer="true()"`, `pt:reorder="true()"`, or `pt:required="false()"`
+  outside a `pt:fetch` context;
+- `pt:sources` does not name the "template" source, and is not set inside the subtree
+  of a `pt:multi` element;
+- `pt:fill` expressions do not use `pt:self()`, and fill elements contain no format
+  tokens;
+- no element has a sibling with the same tag.
+
+At render time, every source must be a single product, and each `pt:fill` must yield a
+single value. Anything else, as well as any error raised while rendering, results in a
+fall back to the Python engine (i.e. `Template`), which either renders the label or
+reports the error in its usual form. Use `render` to get this behaviour:
+
+```python
+from passthrough import xslt
+
+compiled = xslt.compile_xslt("template.xml")  # None if the template is unsupported
+label = xslt.render(compiled or "template.xml", {"input": "input.xml"})
+```
+"""
+
+__all__ = [
+    "XSLTTemplate",
+    "compile_xslt",
+    "render",
+]
+
+import re
+import threading
+from copy import deepcopy
+from itertools import count
+from typing import Dict, Mapping, Optional, Sequence, Union
+
+from lxml import etree
+
+from . import FILL_TOKEN, PT_EXT_URI_BASE, PT_NS
+from .compiled import CompiledTemplate
+from .exc import PTCompileError
+from .extensions import ExtensionManager, get_extensions
+from .extensions.pt import context
+from .fragments import expand_includes
+from .label_tools import (
+    LabelLike,
+    add_default_ns,
+    is_labellike,
+    is_populated,
+    labellike_to_etree,
+)
+from .state import PTState
+
+_PROPERTIES = PTState._PROPERTIES
+
+XSL_URI = "http://www.w3.org/1999/XSL/Transform"
+_INTERNAL_URI = f"{PT_EXT_URI_BASE}/_xslt"
+_INTERNAL_PREFIX = "ptx"
+_LITERALS = {"true()": True, "false()": False}
+_ELEM_DEPENDENT = re.compile(rf"\b{PT_NS['prefix']}:self\s*\(")
+
+# The sources of the render in progress on the current thread
+_render_state = threading.local()
+
+
+class _Unsupported(Exception):
+    """A render-time construct is not supported by the compiled stylesheet"""
+
+
+def _source(_, moniker):
+    try:
+        return _render_state.sources[moniker]
+    except KeyError:
+        raise _Unsupported(f"source '{moniker}' is missing") from None
+
+
+def _conform(_, val):
+    # mirrors PTState._conform_xpath_result for single-valued pt:fill results
+    if isinstance(val, list):
+        if len(val) != 1:
+            raise _Unsupported("pt:fill did not yield a single value")
+        val = val[0]
+    if isinstance(val, etree._Element):
+        return str(val.text)
+    if isinstance(val, bool):
+        return str(val).lower()
+    if isinstance(val, (str, float)):
+        return str(val)
+    raise _Unsupported(f"pt:fill yielded a value of type {type(val)}")
+
+
+_internal_ns = etree.FunctionNamespace(_INTERNAL_URI)
+_internal_ns["source"] = _source
+_internal_ns["conform"] = _conform
+
+
+class XSLTTemplate:
+    """A type template compiled to an XSLT stylesheet.
+
+    Attributes:
+        stylesheet lxml.etree._ElementTree: The generated stylesheet.
+        monikers Dict[str, str]: The source monikers used by the template, mapped to
+            the stylesheet variables holding their root elements.
+    """
+
+    def __init__(self, template: Union[LabelLike, CompiledTemplate]):
+        """Compile `template` into an XSLT stylesheet.
+
+        Args:
+            template: `LabelLike` representation of the type template, or a
+                `CompiledTemplate` thereof.
+
+        Raises:
+            PTCompileError: if the template uses a construct the compiler does not
+                support.
+        """
+        self.template = template
+        if isinstance(template, CompiledTemplate):
+            label = template.to_etree()
+            self._extensions = template.load_extensions()
+        else:
+            label = deepcopy(labellike_to_etree(template))
+            expand_includes(label)
+            etree.strip_elements(label, etree.Comment, with_tail=False)
+            self._extensions = get_extensions()
+        self.monikers: Dict[str, str] = {}
+        self._ids = count()
+
+        root = label.getroot()
+        nsmap = {k: v for k, v in root.nsmap.items() if v != PT_NS["uri"]}
+        self.nsmap = add_default_ns(dict(nsmap))
+        self._prefixes = {uri: prefix for prefix, uri in self.nsmap.items()}
+        for prefix in self._extensions:
+            uri = f"{PT_EXT_URI_BASE}/{prefix}"
+            if nsmap.get(prefix, uri) != uri:
+                raise PTCompileError(
+                    f"template prefix '{prefix}' clashes with the extension prefix"
+                )
+            nsmap[prefix] = uri
+        nsmap.update({"xsl": XSL_URI, _INTERNAL_PREFIX: _INTERNAL_URI})
+        if "pds" in self.nsmap:
+            nsmap.setdefault("pds", self.nsmap["pds"])
+
+        sheet = etree.Element(f"{{{XSL_URI}}}stylesheet", nsmap=nsmap, version="1.0")
+        sheet.set(
+            "exclude-result-prefixes",
+            " ".join(["xsl", _INTERNAL_PREFIX, *self._extensions]),
+        )
+        main = etree.SubElement(sheet, f"{{{XSL_URI}}}template", match="/")
+        self._emit(root, main, _Context())
+        for moniker, var in self.monikers.items():
+            # top-level variables must precede the template in document order
+            sheet.insert(
+                0,
+                etree.Element(
+                    f"{{{XSL_URI}}}variable",
+                    name=var,
+                    select=f"{_INTERNAL_PREFIX}:source('{moniker}')",
+                ),
+            )
+        self.stylesheet = sheet.getroottree()
+        ExtensionManager(self._extensions)  # bind the extension functions
+        try:
+            self._transform = etree.XSLT(self.stylesheet)
+        except etree.XSLTParseError as e:
+            raise PTCompileError(f"unable to compile stylesheet: {e}") from None
+
+    def render(
+        self,
+        source_map: Mapping[str, Union[LabelLike, Sequence[LabelLike]]],
+        context_map: Optional[dict] = None,
+    ) -> etree._ElementTree:
+        """Render a completed label from `source_map`.
+
+        Args:
+            source_map: As for `Template`.
+            context_map: As for `Template`.
+
+        Raises:
+            PTCompileError: if the sources or the evaluation results are not
+                supported by the compiled stylesheet, or rendering failed. `render`
+                falls back to the Python engine in this case.
+        """
+        sources = {}
+        for moniker in self.monikers:
+            val = source_map.get(moniker)
+            if val is None:
+                raise PTCompileError(f"source map contains no key '{moniker}'")
+            if not is_labellike(val):
+                if len(val) != 1:
+                    raise PTCompileError(f"source group '{moniker}' is not supported")
+                val = val[0]
+            tree = labellike_to_etree(val, cache=True)
+            nsmap = add_default_ns(tree.getroot().nsmap)
+            for prefix, uri in nsmap.items():
+                if self.nsmap.get(prefix, uri) != uri:
+                    raise PTCompileError(
+                        f"namespace prefix '{prefix}' of source '{moniker}' differs"
+                        " from that of the template"
+                    )
+            sources[moniker] = tree.getroot()
+
+        context.set_context_map(context_map)
+        ExtensionManager(self._extensions)  # activated for this thread on creation
+        _render_state.sources = sources
+        try:
+            label = self._transform(_DUMMY_INPUT)
+        except etree.XSLTApplyError as e:
+            raise PTCompileError(f"stylesheet could not be applied: {e}") from None
+        except Exception as e:
+            # raised by an extension function (e.g. _Unsupported, or a PTEvalError)
+            # and re-raised as is by lxml once the transform is aborted
+            raise PTCompileError(
+                f"stylesheet could not be applied: {e.__class__.__name__}: {e}"
+            ) from None
+        finally:
+            _render_state.sources = {}
+        root = label.getroot()
+        if root is None:
+            raise PTCompileError("stylesheet produced no output")
+        for elem in root.iter("*"):
+            if not len(elem) and not is_populated(elem):
+                raise PTCompileError("unpopulated leaf node encountered")
+        etree.cleanup_namespaces(label)
+        return label
+
+    def _emit(self, t_elem: etree._Element, out: etree._Element, ctx: "_Context"):
+        exps = {}
+        for attr, exp in t_elem.items():
+            qname = etree.QName(attr)
+            if qname.namespace != PT_NS["uri"]:
+                continue
+            if qname.localname not in _PROPERTIES:
+                self._unsupported("an unrecognised PT attribute", t_elem)
+            exps[qname.localname] = exp
+        ctx = ctx.child(None if t_elem.getparent() is None else self._step(t_elem))
+
+        if "sources" in exps:
+            if exps["sources"] == "template":
+                self._unsupported("the template source", t_elem)
+            if ctx.in_multi:
+                self._unsupported("pt:sources inside a pt:multi subtree", t_elem)
+            ctx.moniker = exps["sources"]
+            if ctx.moniker not in self.monikers:
+                self.monikers[ctx.moniker] = f"s{len(self.monikers)}"
+        elif len(exps) and ctx.moniker is None:
+            self._unsupported("PT properties without a source", t_elem)
+
+        fetch = self._literal(exps, "fetch", ctx.fetch, t_elem)
+        multi = self._literal(exps, "multi", False, t_elem)
+        for kw in ("defer", "reorder"):
+            if self._literal(exps, kw, False, t_elem):
+                self._unsupported(f"{PT_NS['prefix']}:{kw}", t_elem)
+        if fetch:
+            required = self._literal(exps, "required", ctx.required, t_elem)
+            if required and not ctx.required:
+                self._unsupported("a required child of an unrequired element", t_elem)
+        else:
+            # non-fetch requireds are evaluated at export, which isn't supported
+            if not self._literal(exps, "required", True, t_elem):
+                self._unsupported("pt:required outside a pt:fetch context", t_elem)
+            if multi:
+                self._unsupported("pt:multi outside a pt:fetch context", t_elem)
+            required = ctx.required
+        fill = exps.get("fill")
+        if fill is not None:
+            if len(t_elem):
+                self._unsupported("pt:fill on a PDS4 class", t_elem)
+            if t_elem.text is not None and FILL_TOKEN in t_elem.text:
+                self._unsupported("pt:fill format tokens", t_elem)
+            if _ELEM_DEPENDENT.search(fill):
+                self._unsupported(f"{PT_NS['prefix']}:self()", t_elem)
+        if not len(t_elem) and etree.QName(t_elem).localname[0].isupper():
+            self._unsupported("a PDS4 class stub", t_elem)
+        tags = [child.tag for child in t_elem]
+        if len(set(tags)) < len(tags):
+            self._unsupported("sibling elements with the same tag", t_elem)
+        ctx.fetch, ctx.required = fetch, required
+
+        if not fetch:
+            self._emit_elem(t_elem, out, ctx, None, fill)
+            return
+        if t_elem.getparent() is None:
+            self._unsupported("pt:fetch on the root element", t_elem)
+
+        matches = self._var(out, ctx.source_path(self.monikers[ctx.moniker]))
+        if multi:
+            if required:
+                self._message(
+                    out, f"not(${matches})", "no source element found", t_elem
+                )
+            loop = etree.SubElement(out, f"{{{XSL_URI}}}for-each", select=f"${matches}")
+            node = self._var(loop, ".")
+            ctx.bind(node, in_multi=True)
+            self._emit_elem(t_elem, loop, ctx, node, fill)
+            return
+        choose = etree.SubElement(out, f"{{{XSL_URI}}}choose")
+        self._message(
+            choose,
+            f"count(${matches}) > 1",
+            "multiple source elements found but pt:multi is not set",
+            t_elem,
+            when=True,
+        )
+        if required:
+            self._message(
+                choose, f"not(${matches})", "no source element found", t_elem, when=True
+            )
+        else:
+            etree.SubElement(choose, f"{{{XSL_URI}}}when", test=f"not(${matches})")
+        otherwise = etree.SubElement(choose, f"{{{XSL_URI}}}otherwise")
+        ctx.bind(matches)
+        self._emit_elem(t_elem, otherwise, ctx, matches, fill)
+
+    def _step(self, t_elem: etree._Element) -> str:
+        qname = etree.QName(t_elem)
+        if qname.namespace is None:
+            return qname.localname
+        try:
+            return f"{self._prefixes[qname.namespace]}:{qname.localname}"
+        except KeyError:
+            self._unsupported(f"undeclared namespace {qname.namespace}", t_elem)
+
+    def _emit_elem(self, t_elem, out, ctx, node: Optional[str], fill: Optional[str]):
+        elem = etree.SubElement(out, t_elem.tag)
+        for attr, val in t_elem.items():
+            if etree.QName(attr).namespace != PT_NS["uri"]:
+                # escape attribute value template delimiters
+                elem.set(attr, val.replace("{", "{{").replace("}", "}}"))
+        if len(t_elem):
+            self._text(elem, t_elem.text)
+            for child in t_elem:
+                self._emit(child, elem, ctx)
+        else:
+            if node is not None:
+                etree.SubElement(elem, f"{{{XSL_URI}}}copy-of", select=f"${node}/@*")
+            if fill is not None:
+                scope = etree.SubElement(
+                    elem,
+                    f"{{{XSL_URI}}}for-each",
+                    select=f"${self.monikers[ctx.moniker]}",
+                )
+                etree.SubElement(
+                    scope,
+                    f"{{{XSL_URI}}}value-of",
+                    select=f"{_INTERNAL_PREFIX}:conform({fill})",
+                )
+            elif node is not None:
+                etree.SubElement(
+                    elem, f"{{{XSL_URI}}}value-of", select=f"${node}/text()[1]"
+                )
+            else:
+                self._text(elem, t_elem.text)
+        self._text(out, t_elem.tail)
+
+    def _var(self, out: etree._Element, select: str) -> str:
+        name = f"v{next(self._ids)}"
+        etree.SubElement(out, f"{{{XSL_URI}}}variable", name=name, select=select)
+        return name
+
+    @staticmethod
+    def _text(out: etree._Element, text: Optional[str]):
+        if text:
+            etree.SubElement(out, f"{{{XSL_URI}}}text").text = text
+
+    @staticmethod
+    def _message(out, test, msg, t_elem, when=False):
+        cond = etree.SubElement(
+            out, f"{{{XSL_URI}}}{'when' if when else 'if'}", test=test
+        )
+        etree.SubElement(cond, f"{{{XSL_URI}}}message", terminate="yes").text = (
+            f"{msg} (line {t_elem.sourceline})"
+        )
+
+    @staticmethod
+    def _literal(exps, kw, default, t_elem):
+        if kw not in exps:
+            return default
+        try:
+            return _LITERALS[exps[kw].strip()]
+        except KeyError:
+            raise PTCompileError(
+                f"non-literal {PT_NS['prefix']}:{kw} is not supported", t_elem
+            ) from None
+
+    @staticmethod
+    def _unsupported(construct, t_elem):
+        raise PTCompileError(f"{construct} is not supported", t_elem)
+
+
+class _Context:
+    """The inherited compilation state of a template element"""
+
+    def __init__(self):
+        self.moniker: Optional[str] = None
+        self.fetch = False
+        self.required = True
+        self.in_multi = False
+        self.steps = []  # location steps from the root to the element
+        self.bound: Optional[str] = None  # variable holding the nearest source node
+        self.bound_moniker: Optional[str] = None
+        self.bound_depth = 0
+
+    def child(self, step: Optional[str]) -> "_Context":
+        ctx = _Context()
+        ctx.__dict__.update(self.__dict__)
+        if step is not None:
+            ctx.steps = [*self.steps, step]
+        return ctx
+
+    def bind(self, var: str, in_multi: bool = False):
+        self.bound = var
+        self.bound_moniker = self.moniker
+        self.bound_depth = len(self.steps)
+        self.in_multi |= in_multi
+
+    def source_path(self, source_var: str) -> str:
+        # The equivalent of Template's fetch path (the element's path in the label,
+        # where positional predicates only stem from pt:multi duplication), expressed
+        # relative to the nearest source node bound by a fetching ancestor
+        if self.bound is not None and self.bound_moniker == self.moniker:
+            return "/".join([f"${self.bound}", *self.steps[self.bound_depth :]])
+        return "/".join([f"${source_var}", *self.steps])
+
+
+_DUMMY_INPUT = etree.ElementTree(etree.Element("input"))
+
+
+def compile_xslt(
+    template: Union[LabelLike, CompiledTemplate]
+) -> Optional[XSLTTemplate]:
+    """Compile `template` to an `XSLTTemplate`, or return None if it is unsupported."""
+    try:
+        return XSLTTemplate(template)
+    except PTCompileError:
+        return None
+
+
+def render(
+    template: Union[LabelLike, CompiledTemplate, XSLTTemplate],
+    source_map: Mapping[str, Union[LabelLike, Sequence[LabelLike]]],
+    context_map: Optional[dict] = None,
+    **kwargs,
+) -> etree._ElementTree:
+    """Render a completed label, natively via XSLT where possible.
+
+    Args:
+        template: An `XSLTTemplate`, or a type template to render with `Template`.
+        source_map: As for `Template`.
+        context_map: As for `Template`.
+        **kwargs: Further keyword arguments for `Template`, used when falling back
+            to the Python engine.
+
+    Returns:
+        The completed label.
+    """
+    from .template import Template  # deferred to avoid a circular import
+
+    if isinstance(template, XSLTTemplate):
+        try:
+            return template.render(source_map, context_map)
+        except PTCompileError:
+            template = template.template
+    return Template(template, source_map, context_map, **kwargs).finalize()
@@ -0,0 +1,59 @@
+import pytest
+
+PDS_NS = "http://pds.nasa.gov/pds4/pds/v1"
+PT_URI = "https://github.com/ExoMars-PanCam/passthrough"
+
+SOURCE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}">
+  <Identification_Area>
+    <logical_identifier>urn:esa:psa:test:{{}}</logical_identifier>
+    <title>Source {{}}</title>
+  </Identification_Area>
+</Product_Observational>
+"""
+
+# fetches its Identification_Area from the "input" source
+FETCH_TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" pt:sources="input">
+  <Identification_Area pt:fetch="true()">
+    <logical_identifier/>
+    <title/>
+  </Identification_Area>
+</Product_Observational>
+"""
+
+# fills its title from the "input" source at export
+DEFERRED_TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" pt:sources="input">
+  <Identification_Area>
+    <logical_identifier pt:fill="'urn:esa:psa:test:out'"/>
+    <title pt:fill="//pds:title" pt:defer="true()"/>
+  </Identification_Area>
+</Product_Observational>
+"""
+
+
+@pytest.fixture
+def make_source(tmp_path):
+    """Return a function writing a source label with the given id to a file."""
+
+    def make(name: str) -> str:
+        path = tmp_path / f"{name}.xml"
+        path.write_text(SOURCE.format(name, name))
+        return str(path)
+
+    return make
+
+
+@pytest.fixture
+def fetch_template(tmp_path) -> str:
+    path = tmp_path / "fetch_template.xml"
+    path.write_text(FETCH_TEMPLATE)
+    return str(path)
+
+
+@pytest.fixture
+def deferred_template(tmp_path) -> str:
+    path = tmp_path / "deferred_template.xml"
+    path.write_text(DEFERRED_TEMPLATE)
+    return str(path)
@@ -0,0 +1,47 @@
+import json
+import logging
+
+from conftest import PDS_NS, PT_URI
+
+from passthrough import batch
+
+# prunes an empty optional element, which Template logs at logging.INFO
+PRUNING_TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" pt:sources="input">
+  <Identification_Area pt:fetch="true()">
+    <logical_identifier/>
+    <title/>
+  </Identification_Area>
+  <Reference_List pt:required="false()">
+    <comment pt:fill="''"/>
+  </Reference_List>
+</Product_Observational>
+"""
+
+
+def test_render_manifest_in_process_logging(caplog, tmp_path, make_source):
+    (tmp_path / "template.xml").write_text(PRUNING_TEMPLATE)
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text(
+        "".join(
+            json.dumps(
+                {
+                    "template": "template.xml",
+                    "source_map": {"input": make_source(name)},
+                    "output": "out",
+                    "filename": f"{name}.xml",
+                }
+            )
+            + "\n"
+            for name in ("a", "b")
+        )
+    )
+    caplog.set_level(logging.INFO, logger="passthrough")
+    summary = batch.render_manifest(manifest, jobs=1, stats_interval=0)
+    assert summary["count"] == 2 and summary["failed"] == 0
+    # the batch's progress is logged, but not the messages of its Templates
+    messages = [(r.name, r.getMessage()) for r in caplog.records]
+    assert any(name == "passthrough.batch" for name, _ in messages)
+    assert not any(name == "passthrough.Template" for name, _ in messages)
+    assert logging.getLogger("passthrough").level == logging.INFO
+    assert not logging.getLogger("passthrough.Template").filters
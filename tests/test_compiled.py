@@ -0,0 +1,51 @@
+import pickle
+from pathlib import Path
+
+import pytest
+from conftest import PDS_NS, PT_URI
+from lxml import etree
+
+from passthrough import Template
+from passthrough.compiled import ARTIFACT_FORMAT, CompiledTemplate, compile_template
+from passthrough.exc import PTArtifactError, PTSyntaxError
+
+
+def test_artifact_round_trip(tmp_path, fetch_template, make_source):
+    artifact = tmp_path / "template.ptc"
+    CompiledTemplate.compile(fetch_template).save(artifact)
+    compiled = CompiledTemplate.load(artifact)
+    assert compiled.is_current(fetch_template)
+    source = make_source("a")
+    labels = [
+        etree.tostring(Template(template, {"input": source}).finalize())
+        for template in (compiled, fetch_template)
+    ]
+    assert labels[0] == labels[1]
+
+
+def test_artifact_of_other_format(tmp_path, fetch_template):
+    artifact = tmp_path / "template.ptc"
+    CompiledTemplate.compile(fetch_template).save(artifact)
+    with open(artifact, "rb") as f:
+        state = pickle.load(f)
+    state["format"] = ARTIFACT_FORMAT - 1
+    with open(artifact, "wb") as f:
+        pickle.dump(state, f)
+    with pytest.raises(PTArtifactError, match="compatible"):
+        CompiledTemplate.load(artifact)
+
+
+def test_unrecognised_attribute(tmp_path):
+    path = tmp_path / "template.xml"
+    path.write_text(
+        f'<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" pt:fecth="1"/>'
+    )
+    with pytest.raises(PTSyntaxError, match="fecth"):
+        CompiledTemplate.compile(str(path))
+
+
+def test_url_template(tmp_path, fetch_template):
+    url = Path(fetch_template).as_uri()
+    compiled = compile_template(url, tmp_path / "template.ptc")
+    assert compiled.is_current(url)
+    assert compile_template(url, tmp_path / "template.ptc").digest == compiled.digest
@@ -0,0 +1,39 @@
+from conftest import PDS_NS, PT_URI
+
+from passthrough.explain import explain_template
+
+SOURCE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}">
+  <Observation_Area>
+    <Investigation_Area><name>A</name><type>Mission</type></Investigation_Area>
+    <Investigation_Area><name>B</name><type>Mission</type></Investigation_Area>
+    <Investigation_Area><name>C</name><type>Mission</type></Investigation_Area>
+  </Observation_Area>
+</Product_Observational>
+"""
+
+TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" pt:sources="input">
+  <Observation_Area pt:fetch="true()">
+    <Investigation_Area pt:multi="true()">
+      <name/>
+      <type pt:required="true()"/>
+    </Investigation_Area>
+  </Observation_Area>
+</Product_Observational>
+"""
+
+
+def test_nested_fanout(tmp_path):
+    (tmp_path / "template.xml").write_text(TEMPLATE)
+    (tmp_path / "source.xml").write_text(SOURCE)
+    plan = explain_template(
+        str(tmp_path / "template.xml"), {"input": str(tmp_path / "source.xml")}
+    )
+    counts = {
+        step.path.rsplit("/", 1)[-1]: (step.fanout, step.instances)
+        for step in plan.steps
+    }
+    assert counts["pds:Investigation_Area"] == (3, 3)
+    # copied once per Investigation_Area, not once per type in the whole source
+    assert counts["pds:type"] == (1, 3)
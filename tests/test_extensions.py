@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+from conftest import PDS_NS, PT_URI, SOURCE
+from lxml import etree
+
+from passthrough import ContextProvider, Template
+from passthrough.exc import PTEvalError
+from passthrough.extensions import ExtensionManager, MemoCache
+
+# fills its title from the context map at export
+CONTEXT_TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" pt:sources="input">
+  <Identification_Area>
+    <logical_identifier pt:fill="'urn:esa:psa:test:out'"/>
+    <title pt:fill="pt:context('title')" pt:defer="true()"/>
+  </Identification_Area>
+</Product_Observational>
+"""
+
+# looks up its identifier from the context map both during and after traversal
+LAZY_CONTEXT_TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" pt:sources="input">
+  <Identification_Area>
+    <logical_identifier pt:fill="pt:context('lid')"/>
+    <title pt:fill="pt:context('lid')" pt:defer="true()"/>
+  </Identification_Area>
+</Product_Observational>
+"""
+
+
+def _in_thread(func):
+    # return what `func` returns (or raises) when called in a new thread
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = func()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def test_dispatch_requires_manager_in_thread():
+    ExtensionManager()  # registers the extension functions, active in this thread only
+    root = etree.fromstring("<root/>")
+    with pytest.raises(RuntimeError, match="in this thread"):
+        _in_thread(lambda: root.xpath("pt:context('key')"))
+
+
+def test_deferred_fill_in_another_thread(tmp_path, make_source):
+    path = tmp_path / "context_template.xml"
+    path.write_text(CONTEXT_TEMPLATE)
+    template = Template(str(path), {"input": make_source("a")}, {"title": "Title"})
+    label = _in_thread(template.finalize)
+    assert label.getroot().find(f".//{{{PDS_NS}}}title").text == "Title"
+
+
+def test_memo_cache_shared_between_documents():
+    calls = []
+
+    def first_text(_, nodes):
+        calls.append(nodes)
+        return nodes[0].text
+
+    cache = MemoCache()
+    lids = [
+        etree.fromstring(SOURCE.format(name, name).encode()).xpath(
+            "//pds:logical_identifier", namespaces={"pds": PDS_NS}
+        )
+        for name in ("a", "a", "b")
+    ]
+    results = [cache.call(first_text, None, (nodes,)) for nodes in lids]
+    assert results == ["urn:esa:psa:test:a"] * 2 + ["urn:esa:psa:test:b"]
+    # the second document's identical argument is a hit, the third's a miss
+    assert len(calls) == 2
+    assert cache.info()[:2] == (1, 2)
+
+
+@pytest.fixture
+def render_lazy(tmp_path, make_source):
+    """Return a function rendering the lazy context template, returning its texts."""
+    path = tmp_path / "lazy_context_template.xml"
+    path.write_text(LAZY_CONTEXT_TEMPLATE)
+
+    def render(context_map):
+        label = Template(str(path), {"input": make_source("a")}, context_map)
+        return [e.text for e in label.finalize().getroot()[0]]
+
+    return render
+
+
+def _counter(calls):
+    def compute():
+        calls.append(None)
+        return f"urn:esa:psa:test:{len(calls)}"
+
+    return compute
+
+
+def test_context_callable_computed_once_per_render(render_lazy):
+    calls, unused = [], []
+    context_map = {"lid": _counter(calls), "unused": _counter(unused)}
+    assert render_lazy(context_map) == ["urn:esa:psa:test:1"] * 2
+    assert render_lazy(context_map) == ["urn:esa:psa:test:2"] * 2
+    assert not unused
+
+
+def test_context_provider_computed_once_per_batch(render_lazy):
+    calls = []
+    context_map = {"lid": ContextProvider(_counter(calls), scope="batch")}
+    assert render_lazy(context_map) == ["urn:esa:psa:test:1"] * 2
+    assert render_lazy(context_map) == ["urn:esa:psa:test:1"] * 2
+    context_map["lid"].reset()
+    assert render_lazy(context_map) == ["urn:esa:psa:test:2"] * 2
+
+
+def test_context_callable_failure(render_lazy):
+    def fail():
+        raise OSError("unavailable")
+
+    with pytest.raises(PTEvalError, match="could not be computed"):
+        render_lazy({"lid": fail})
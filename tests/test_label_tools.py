@@ -0,0 +1,45 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+from conftest import PDS_NS, SOURCE
+
+from passthrough import Template
+from passthrough.label_tools import detect_compression, parse_label
+
+COMPRESSORS = {"gz": gzip.compress, "xz": lzma.compress, "bz2": bz2.compress}
+
+
+def _lid(label) -> str:
+    return label.getroot().findtext(f".//{{{PDS_NS}}}logical_identifier")
+
+
+@pytest.mark.parametrize("compression", COMPRESSORS)
+def test_parse_compressed(tmp_path, compression):
+    data = COMPRESSORS[compression](SOURCE.format("a", "a").encode())
+    by_suffix = tmp_path / f"a.xml.{compression}"
+    by_suffix.write_bytes(data)
+    sniffed = tmp_path / "a.label"
+    sniffed.write_bytes(data)
+    for path in (by_suffix, sniffed):
+        assert detect_compression(path) == compression
+        assert _lid(parse_label(path)) == "urn:esa:psa:test:a"
+
+
+def test_xml_suffix_not_sniffed(tmp_path):
+    path = tmp_path / "a.xml"
+    path.write_bytes(gzip.compress(SOURCE.format("a", "a").encode()))
+    assert detect_compression(path) is None
+    assert detect_compression(tmp_path / "missing.xml") is None  # not even opened
+    # left to libxml2 to decompress
+    assert _lid(parse_label(path)) == "urn:esa:psa:test:a"
+
+
+@pytest.mark.parametrize("compression", COMPRESSORS)
+def test_export_compressed(tmp_path, fetch_template, make_source, compression):
+    template = Template(fetch_template, {"input": make_source("a")})
+    result = template.export(tmp_path / "out", "b.xml", compression=compression)
+    assert result.path.name == f"b.xml.{compression}"
+    assert detect_compression(result.path) == compression
+    assert _lid(parse_label(result.path)) == "urn:esa:psa:test:a"
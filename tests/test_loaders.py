@@ -0,0 +1,47 @@
+import os
+import time
+
+import pytest
+
+from passthrough import loaders
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_prefetch_after_fork(make_source):
+    paths = [make_source("a"), make_source("b")]
+    loaders.prefetch(paths)  # start the pool in the parent
+
+    pid = os.fork()
+    if pid == 0:  # child: must not wait on the parent's pool threads
+        try:
+            trees = loaders.prefetch(paths)
+            os._exit(0 if len(trees) == 2 else 1)
+        except BaseException:
+            os._exit(1)
+    for _ in range(100):  # 10s
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            break
+        time.sleep(0.1)
+    else:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        pytest.fail("prefetch hung in the forked child")
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+
+def test_prefetch_loads_each_path_once(make_source):
+    path = make_source("a")
+    trees = loaders.prefetch([path, path, make_source("b")])
+    assert len(trees) == 2
+
+
+def test_file_url(make_source):
+    path = make_source("a")
+    tree = loaders.load_url(f"file://{path}")
+    assert tree.getroot().tag.endswith("Product_Observational")
+
+
+def test_unknown_scheme():
+    with pytest.raises(ValueError):
+        loaders.load_url("gopher://example.org/label.xml")
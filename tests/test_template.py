@@ -0,0 +1,208 @@
+import gc
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from conftest import PDS_NS, PT_URI
+from lxml import etree
+
+import passthrough.extensions
+from passthrough import Template
+
+
+def _alive(path: str) -> bool:
+    # whether any element or tree of the document parsed from `path` is still alive
+    gc.collect()
+    url = str(Path(path).resolve())
+    for obj in gc.get_objects():
+        if isinstance(obj, etree._Element):
+            obj = obj.getroottree()
+        if isinstance(obj, etree._ElementTree) and obj.docinfo.URL == url:
+            return True
+    return False
+
+
+def test_sources_released_after_traversal(fetch_template, make_source):
+    source = make_source("a")
+    template = Template(fetch_template, {"input": source})
+    assert not _alive(source)
+    assert "urn:esa:psa:test:a" in etree.tostring(template.finalize()).decode()
+
+
+def test_incremental_retains_sources(fetch_template, make_source):
+    source = make_source("a")
+    template = Template(fetch_template, {"input": source}, incremental=True)
+    assert _alive(source)
+    template.close()
+    assert not _alive(source)
+
+
+def test_deferred_sources_released_on_export(deferred_template, make_source):
+    source = make_source("a")
+    template = Template(deferred_template, {"input": source})
+    assert _alive(source)  # still needed for the deferred pt:fill
+    label = template.finalize()
+    assert label.getroot()[0][1].text == "Source a"
+    assert not _alive(source)
+
+
+def test_source_group_with_repeated_label(tmp_path, make_source):
+    template_path = tmp_path / "group_template.xml"
+    template_path.write_text(
+        f"""<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}">
+  <Identification_Area pt:sources="group" pt:fetch="true()">
+    <logical_identifier/>
+    <title/>
+  </Identification_Area>
+</Product_Observational>"""
+    )
+    source = make_source("a")
+    label = Template(str(template_path), {"group": [source, source]}).finalize()
+    titles = label.getroot().findall(f"{{{PDS_NS}}}Identification_Area/*")
+    assert [e.text for e in titles].count("Source a") == 2
+
+
+@pytest.fixture
+def batched_upper(monkeypatch):
+    """Install a "tst" extension with a batched upper() function."""
+
+    def upper(calls):
+        return [args[0].upper() for _, args in calls]
+
+    tst = SimpleNamespace(functions={"upper": upper}, batched={"upper"})
+    get_extensions = passthrough.extensions.get_extensions
+    monkeypatch.setattr(
+        passthrough.extensions,
+        "get_extensions",
+        lambda: {**get_extensions(), "tst": tst},
+    )
+
+
+def test_refresh_reports_batched_fills_by_final_text(
+    batched_upper, tmp_path, make_source
+):
+    template_path = tmp_path / "batched_template.xml"
+    template_path.write_text(
+        f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}"
+    xmlns:tst="{PT_URI}/extensions/tst" pt:sources="input">
+  <Identification_Area>
+    <logical_identifier pt:fill="tst:upper(string(//pds:logical_identifier))"/>
+    <title pt:fill="tst:upper(string(//pds:title))"/>
+  </Identification_Area>
+</Product_Observational>
+"""
+    )
+    template = Template(
+        str(template_path), {"input": make_source("a")}, incremental=True
+    )
+    title = template.root.find(f".//{{{PDS_NS}}}title")
+    assert title.text == "SOURCE A"
+
+    revised = make_source("b")
+    # the revision only changes the id, so only the identifier changes
+    Path(revised).write_text(Path(revised).read_text().replace("Source b", "Source a"))
+    changed = template.refresh({"input": revised})
+    assert [e.tag for e in changed] == [f"{{{PDS_NS}}}logical_identifier"]
+    assert title.text == "SOURCE A"
+    template.close()
+
+
+def test_collect_errors_with_failed_reorder_fetch(tmp_path, make_source):
+    template_path = tmp_path / "reorder_template.xml"
+    template_path.write_text(
+        f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" pt:sources="input">
+  <Observation_Area pt:fetch="true()" pt:reorder="true()">
+    <comment/>
+  </Observation_Area>
+</Product_Observational>
+"""
+    )
+    template = Template(
+        str(template_path), {"input": make_source("a")}, collect_errors=True
+    )
+    assert [(e.type, e.tag) for e in template.error_report()] == [
+        ("PTFetchError", "Observation_Area")
+    ]
+
+
+def test_identical_template_fills_see_earlier_fills(tmp_path, make_source):
+    count = "count(//pds:Identification_Area/*[normalize-space(.)!=''])"
+    template_path = tmp_path / "counting_template.xml"
+    template_path.write_text(
+        f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" pt:sources="template">
+  <Identification_Area>
+    <logical_identifier pt:fill="{count}" pt:defer="true()"/>
+    <title pt:fill="{count}" pt:defer="true()"/>
+  </Identification_Area>
+</Product_Observational>
+"""
+    )
+    label = Template(str(template_path), {"input": make_source("a")}).finalize()
+    area = label.getroot().find(f"{{{PDS_NS}}}Identification_Area")
+    assert [e.text for e in area] == ["0.0", "1.0"]
+
+
+def test_template_fill_reads_batched_results(batched_upper, tmp_path, make_source):
+    template_path = tmp_path / "batched_template.xml"
+    template_path.write_text(
+        f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}"
+    xmlns:tst="{PT_URI}/extensions/tst" pt:sources="input">
+  <Identification_Area>
+    <logical_identifier pt:fill="tst:upper(string(//pds:logical_identifier))"/>
+    <title pt:sources="template" pt:fill="string(//pds:logical_identifier)"/>
+  </Identification_Area>
+</Product_Observational>
+"""
+    )
+    label = Template(str(template_path), {"input": make_source("a")}).finalize()
+    area = label.getroot().find(f"{{{PDS_NS}}}Identification_Area")
+    assert [e.text for e in area] == ["URN:ESA:PSA:TEST:A"] * 2
+
+
+def test_skip_unchanged_export(tmp_path, fetch_template, make_source):
+    out = tmp_path / "out"
+    source = make_source("a")
+    first = Template(fetch_template, {"input": source}).export(out, skip_unchanged=True)
+    assert first.written and first.path == out / "a.xml"
+    again = Template(fetch_template, {"input": source}).export(out, skip_unchanged=True)
+    assert again == (first.path, False, first.digest)
+    changed = Template(fetch_template, {"input": make_source("b")}).export(
+        out, "a.xml", skip_unchanged=True
+    )
+    assert changed.written and changed.digest != first.digest
+    assert "urn:esa:psa:test:b" in changed.path.read_text()
+
+
+def test_skip_unchanged_disregards_volatile_and_masked(tmp_path, make_source):
+    template_path = tmp_path / "volatile_template.xml"
+    template_path.write_text(
+        f"""<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}"
+    pt:sources="input">
+  <Identification_Area>
+    <logical_identifier pt:fill="'urn:esa:psa:test:out'"/>
+    <title pt:fill="//pds:title"/>
+    <version_id pt:fill="pt:datetime.now()"/>
+  </Identification_Area>
+</Product_Observational>"""
+    )
+
+    def export(name, **kwargs):
+        template = Template(str(template_path), {"input": make_source(name)})
+        return template.export(tmp_path / "out", skip_unchanged=True, **kwargs)
+
+    first = export("a")
+    # a later export differs from the file only in its volatile element
+    path = first.path
+    path.write_text(path.read_text().replace("<version_id>", "<version_id>1999"))
+    assert not export("a").written
+
+    # the manifest is consulted in place of the file, with the same mask throughout
+    for mask in ((), ["//pds:title"]):
+        manifest = {}
+        digest = export("a", manifest=manifest, mask=mask).digest
+        assert manifest == {str(path): digest}
+        assert export("b", manifest=manifest, mask=mask).written != bool(mask)
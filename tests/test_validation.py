@@ -0,0 +1,100 @@
+import pytest
+from conftest import PDS_NS, PT_URI
+
+from passthrough import Template
+from passthrough.exc import PTTemplateError, PTValidationError
+from passthrough.validation import LabelValidator
+
+XSI_URI = "http://www.w3.org/2001/XMLSchema-instance"
+
+# requires an Identification_Area with a logical_identifier and a short title
+SCHEMA = f"""<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="{PDS_NS}"
+    elementFormDefault="qualified">
+  <xs:element name="Product_Observational">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="Identification_Area">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:element name="logical_identifier" type="xs:string"/>
+              <xs:element name="title">
+                <xs:simpleType>
+                  <xs:restriction base="xs:string">
+                    <xs:maxLength value="{{}}"/>
+                  </xs:restriction>
+                </xs:simpleType>
+              </xs:element>
+            </xs:sequence>
+          </xs:complexType>
+        </xs:element>
+      </xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+# fetches its Identification_Area from the "input" source, and references the schema
+TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" xmlns:xsi="{XSI_URI}"
+    xsi:schemaLocation="{PDS_NS} https://example.com/pds/test.xsd"
+    pt:sources="input">
+  <Identification_Area pt:fetch="true()">
+    <logical_identifier/>
+    <title/>
+  </Identification_Area>
+</Product_Observational>
+"""
+
+
+@pytest.fixture
+def template(tmp_path, make_source):
+    """Return a function rendering the schema-referencing template."""
+    path = tmp_path / "template.xml"
+    path.write_text(TEMPLATE)
+
+    def make(**kwargs) -> Template:
+        return Template(str(path), {"input": make_source("a")}, **kwargs)
+
+    return make
+
+
+@pytest.fixture
+def schema_dir(tmp_path):
+    """Return a function writing the schema, with the given title length limit."""
+    directory = tmp_path / "schemas"
+    directory.mkdir()
+
+    def make(max_length: int):
+        (directory / "test.xsd").write_text(SCHEMA.format(max_length))
+        return directory
+
+    return make
+
+
+def test_export_valid(tmp_path, template, schema_dir):
+    validator = LabelValidator([schema_dir(20)])
+    result = template().export(tmp_path / "out", validator=validator)
+    assert result.written and result.path.is_file()
+
+
+def test_export_invalid(tmp_path, template, schema_dir):
+    validator = LabelValidator([schema_dir(5)])
+    with pytest.raises(PTValidationError, match="title"):
+        template().export(tmp_path / "out", validator=validator)
+    assert not (tmp_path / "out").exists()
+
+
+def test_export_invalid_collect_errors(tmp_path, template, schema_dir):
+    validator = LabelValidator([schema_dir(5)])
+    rendered = template(collect_errors=True)
+    with pytest.raises(PTTemplateError):
+        rendered.export(tmp_path / "out", validator=validator)
+    assert [e.type for e in rendered.error_report()] == ["PTValidationError"]
+
+
+def test_unresolved_schema(tmp_path, template):
+    with pytest.raises(PTValidationError, match="no local copy"):
+        template().export(tmp_path / "out", validator=LabelValidator())
+    result = template().export(tmp_path / "out", validator=LabelValidator(strict=False))
+    assert result.written
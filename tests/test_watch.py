@@ -0,0 +1,24 @@
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+from conftest import SOURCE
+
+from passthrough import batch
+from passthrough.watch import Rule, Watcher
+
+
+def test_nested_output_not_scanned(tmp_path, fetch_template):
+    watched = tmp_path / "watched"
+    (watched / "out").mkdir(parents=True)
+    (watched / "a.xml").write_text(SOURCE.format("a", "a"))
+    (watched / "out" / "a.xml").write_text(SOURCE.format("a", "a"))  # exported
+    rule = Rule("*.xml", fetch_template, "input", {}, {}, "")
+    watcher = Watcher(watched, [rule], watched / "out")
+    watcher._scan()
+    assert list(watcher._entries) == [watched / "a.xml"]
+
+
+def test_workers_ignore_sigint():
+    with ProcessPoolExecutor(1, initializer=batch.init_worker) as pool:
+        handler = pool.submit(signal.getsignal, signal.SIGINT).result()
+    assert handler == signal.SIG_IGN
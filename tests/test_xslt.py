@@ -0,0 +1,117 @@
+import re
+
+import pytest
+from conftest import PDS_NS, PT_URI
+from lxml import etree
+
+from passthrough import Template, xslt
+from passthrough.exc import PTCompileError, PTEvalError
+
+EXM_URI = "https://github.com/ExoMars-PanCam/passthrough/extensions/exm"
+
+TEMPLATE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}" xmlns:pt="{PT_URI}" xmlns:exm="{EXM_URI}">
+  <Identification_Area pt:sources="primary">
+    <logical_identifier pt:fill="exm:lid.to_browse(//pds:logical_identifier)"/>
+    <version_id pt:fetch="true()"/>
+    <title pt:fill="pt:context('title')"/>
+    <info pt:fill="concat(//pds:version_id, ' / ', count(//pds:Investigation_Area))"/>
+    <now pt:fill="pt:datetime.now()"/>
+  </Identification_Area>
+  <Observation_Area pt:sources="primary" pt:fetch="true()">
+    <Time_Coordinates>
+      <start_date_time/>
+      <stop_date_time/>
+    </Time_Coordinates>
+    <Investigation_Area pt:multi="true()">
+      <name/>
+      <type/>
+    </Investigation_Area>
+    <Optional pt:required="false()"><x/></Optional>
+  </Observation_Area>
+  <Reference_List>
+    <Internal_Reference pt:sources="second">
+      <lid_reference pt:fill="pt:sequence(//pds:logical_identifier)"/>
+    </Internal_Reference>
+  </Reference_List>
+</Product_Observational>
+"""
+
+SOURCE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Product_Observational xmlns="{PDS_NS}">
+  <Identification_Area>
+    <logical_identifier>urn:esa:psa:em16_pan:data_partially_processed:\
+pan_par_sc_lwac_rad_2021010{{}}t000000.000z</logical_identifier>
+    <version_id>1.0</version_id>
+  </Identification_Area>
+  <Observation_Area>
+    <Time_Coordinates>
+      <start_date_time>2021-01-01T00:00:00.000Z</start_date_time>
+      <stop_date_time>2021-01-01T00:00:01.000Z</stop_date_time>
+    </Time_Coordinates>
+    <Investigation_Area><name>A</name><type>Mission</type></Investigation_Area>
+    <Investigation_Area><name>B</name><type>Mission</type></Investigation_Area>
+  </Observation_Area>
+</Product_Observational>
+"""
+
+
+@pytest.fixture
+def files(tmp_path):
+    def write(name, text):
+        path = tmp_path / name
+        path.write_text(text)
+        return str(path)
+
+    template = write("template.xml", TEMPLATE)
+    source_map = {
+        "primary": write("primary.xml", SOURCE.format(1)),
+        "second": write("second.xml", SOURCE.format(2)),
+    }
+    return template, source_map
+
+
+def _normalise(label: etree._ElementTree) -> str:
+    root = etree.fromstring(etree.tostring(label))
+    for elem in root.iter():
+        if elem.text is not None and not elem.text.strip():
+            elem.text = None
+        if elem.tail is not None and not elem.tail.strip():
+            elem.tail = None
+    c14n = etree.tostring(root, method="c14n").decode()
+    return re.sub(r"<now>.*?</now>", "<now/>", c14n)
+
+
+def test_xslt_matches_template(files):
+    template, source_map = files
+    context_map = {"title": "T"}
+    compiled = xslt.XSLTTemplate(template)
+    native = compiled.render(source_map, context_map)
+    reference = Template(template, source_map, context_map, quiet=True).finalize()
+    assert _normalise(native) == _normalise(reference)
+
+
+def test_extension_error_falls_back(files):
+    template, source_map = files
+    compiled = xslt.XSLTTemplate(template)
+    with pytest.raises(PTCompileError):
+        compiled.render(source_map, {})  # no 'title' context entry
+    # the fallback reports the error as Template does
+    with pytest.raises(PTEvalError, match="'title' has not been registered"):
+        xslt.render(compiled, source_map, {}, quiet=True)
+
+
+def test_unsupported_result_falls_back(files, tmp_path):
+    template, source_map = files
+    multi_valued = tmp_path / "multi_valued.xml"
+    multi_valued.write_text(
+        TEMPLATE.replace(
+            "<title pt:fill=\"pt:context('title')\"/>",
+            '<title pt:fill="//pds:name"/>',
+        )
+    )
+    compiled = xslt.XSLTTemplate(str(multi_valued))
+    with pytest.raises(PTCompileError, match="single value"):
+        compiled.render(source_map)
+    with pytest.raises(PTEvalError):  # as raised by Template
+        xslt.render(compiled, source_map, quiet=True)